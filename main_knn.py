@@ -19,8 +19,12 @@
 
 import json
 import os
+import re
+import shutil
+import tempfile
+from contextlib import ExitStack
 from pathlib import Path
-from typing import Tuple
+from typing import Callable, Dict, List, Tuple
 
 import torch
 import torch.nn as nn
@@ -35,16 +39,30 @@ from solo.data.classification_dataloader import (
     prepare_transforms,
 )
 from solo.methods import METHODS
+from solo.methods.base import BaseMethod
+from solo.utils.feature_store import FeatureStore
 from solo.utils.knn import WeightedKNNClassifier
+from solo.utils.misc import (
+    inference_autocast,
+    prepare_model_for_inference,
+    setup_inference_device,
+)
 
 
 @torch.no_grad()
-def extract_features(loader: DataLoader, model: nn.Module) -> Tuple[torch.Tensor]:
+def extract_features(
+    loader: DataLoader,
+    model: nn.Module,
+    device: torch.device = torch.device("cuda"),
+    bf16: bool = False,
+) -> Tuple[torch.Tensor]:
     """Extract features from a data loader using a model.
 
     Args:
         loader (DataLoader): dataloader for a dataset.
         model (nn.Module): torch module used to extract features.
+        device (torch.device, optional): device used for inference. Defaults to cuda.
+        bf16 (bool, optional): whether to use bf16 autocast. Defaults to False.
 
     Returns:
         Tuple(torch.Tensor): tuple containing the backbone features, projector features and labels.
@@ -53,11 +71,12 @@ def extract_features(loader: DataLoader, model: nn.Module) -> Tuple[torch.Tensor
     model.eval()
     backbone_features, proj_features, labels = [], [], []
     for im, lab in tqdm(loader):
-        im = im.cuda(non_blocking=True)
-        lab = lab.cuda(non_blocking=True)
-        outs = model(im)
-        backbone_features.append(outs["feats"].detach())
-        proj_features.append(outs["z"])
+        im = im.to(device, non_blocking=True)
+        lab = lab.to(device, non_blocking=True)
+        with inference_autocast(device, bf16):
+            outs = model(im)
+        backbone_features.append(outs["feats"].detach().float())
+        proj_features.append(outs["z"].float())
         labels.append(lab)
     model.train()
     backbone_features = torch.cat(backbone_features)
@@ -66,6 +85,148 @@ def extract_features(loader: DataLoader, model: nn.Module) -> Tuple[torch.Tensor
     return backbone_features, proj_features, labels
 
 
+def extract_features_with_store(
+    store: FeatureStore,
+    dataset: torch.utils.data.Dataset,
+    split: str,
+    model: nn.Module,
+    batch_size: int,
+    num_workers: int,
+    device: torch.device = torch.device("cuda"),
+    bf16: bool = False,
+) -> Tuple[Dict[str, torch.Tensor], torch.Tensor]:
+    """Extract features from a dataset, reusing the ones available in the feature store.
+
+    Args:
+        store (FeatureStore): feature store used to cache the features.
+        dataset (torch.utils.data.Dataset): dataset to extract features from.
+        split (str): name of the split (train or val).
+        model (nn.Module): torch module used to extract features.
+        batch_size (int): batch size.
+        num_workers (int): number of parallel workers.
+        device (torch.device, optional): device used for inference. Defaults to cuda.
+        bf16 (bool, optional): whether to use bf16 autocast. Defaults to False.
+
+    Returns:
+        Tuple[Dict[str, torch.Tensor], torch.Tensor]: dict containing the backbone and
+            projector features and the labels.
+    """
+
+    def forward_fn(im: torch.Tensor) -> Dict[str, torch.Tensor]:
+        with inference_autocast(device, bf16):
+            outs = model(im)
+        return {"backbone": outs["feats"], "projector": outs["z"]}
+
+    model.eval()
+    entries = store.extract(
+        forward_fn,
+        dataset,
+        split,
+        feature_types=["backbone", "projector"],
+        batch_size=batch_size,
+        num_workers=num_workers,
+        device=device,
+    )
+    model.train()
+    features = {k: feats.to(device, non_blocking=True) for k, (feats, _) in entries.items()}
+    labels = entries["backbone"][1].to(device, non_blocking=True)
+    return features, labels
+
+
+def load_backbone(ckpt_path: Path, cfg: OmegaConf) -> nn.Module:
+    """Builds the backbone of a pretrained method and loads only its weights from the
+    checkpoint, avoiding instantiating projectors, momentum networks, etc.
+
+    Args:
+        ckpt_path (Path): path to the checkpoint.
+        cfg (OmegaConf): config of the pretrained method.
+
+    Returns:
+        nn.Module: backbone with the pretrained weights.
+    """
+
+    backbone = BaseMethod._BACKBONES[cfg.backbone.name](
+        cfg.method, **cfg.backbone.get("kwargs", {})
+    )
+    if cfg.backbone.name.startswith("resnet"):
+        # remove fc layer
+        backbone.fc = nn.Identity()
+        if cfg.data.dataset in ["cifar10", "cifar100"]:
+            backbone.conv1 = nn.Conv2d(3, 64, kernel_size=3, stride=1, padding=2, bias=False)
+            backbone.maxpool = nn.Identity()
+
+    state = torch.load(ckpt_path, map_location="cpu")["state_dict"]
+    state = {k[len("backbone.") :]: v for k, v in state.items() if k.startswith("backbone.")}
+    backbone.load_state_dict(state)
+    return backbone
+
+
+def extract_features_multi(
+    stores: List[FeatureStore],
+    dataset: torch.utils.data.Dataset,
+    split: str,
+    backbones: List[nn.Module],
+    batch_size: int,
+    num_workers: int,
+    device: torch.device = torch.device("cuda"),
+    bf16: bool = False,
+):
+    """Extract backbone features for several models while decoding each batch only once. The
+    features of each model are written to its feature store as they are produced, so they are
+    never all in memory and interrupted extractions resume where they stopped.
+
+    Args:
+        stores (List[FeatureStore]): feature store of each model.
+        dataset (torch.utils.data.Dataset): dataset to extract features from.
+        split (str): name of the split (train or val).
+        backbones (List[nn.Module]): backbones used to extract features.
+        batch_size (int): batch size.
+        num_workers (int): number of parallel workers.
+        device (torch.device, optional): device used for inference. Defaults to cuda.
+        bf16 (bool, optional): whether to use bf16 autocast. Defaults to False.
+    """
+
+    def backbone_forward_fn(backbone: nn.Module) -> Callable:
+        def forward_fn(im: torch.Tensor) -> Dict[str, torch.Tensor]:
+            with inference_autocast(device, bf16):
+                return {"backbone": backbone(im)}
+
+        return forward_fn
+
+    for backbone in backbones:
+        backbone.eval()
+    FeatureStore.extract_multi(
+        stores,
+        [backbone_forward_fn(backbone) for backbone in backbones],
+        dataset,
+        split,
+        feature_types=["backbone"],
+        batch_size=batch_size,
+        num_workers=num_workers,
+        device=device,
+    )
+
+
+def find_checkpoints(ckpt_dir: Path, frequency: int = 1) -> List[Tuple[int, Path]]:
+    """Finds all checkpoints stored by the Checkpointer in a directory.
+
+    Args:
+        ckpt_dir (Path): directory containing the checkpoints.
+        frequency (int, optional): only keeps checkpoints of every frequency-th epoch.
+            Defaults to 1.
+
+    Returns:
+        List[Tuple[int, Path]]: sorted list of epochs and checkpoint paths.
+    """
+
+    ckpts = []
+    for ckpt in os.listdir(ckpt_dir):
+        match = re.search(r"ep=(\d+)\.ckpt$", ckpt)
+        if match is not None and int(match.group(1)) % frequency == 0:
+            ckpts.append((int(match.group(1)), ckpt_dir / ckpt))
+    return sorted(ckpts)
+
+
 @torch.no_grad()
 def run_knn(
     train_features: torch.Tensor,
@@ -116,6 +277,129 @@ def run_knn(
     return acc1, acc5
 
 
+def main_all_checkpoints(args, cfg: OmegaConf, ckpt_dir: Path):
+    """Runs offline k-NN for every checkpoint of a directory and reports the accuracy per epoch.
+    Checkpoints are evaluated in groups of args.checkpoints_per_pass backbones, so that each
+    batch is decoded once per group instead of once per checkpoint. The features of each
+    checkpoint are streamed to the feature store (a temporary one if args.feature_store_dir is not
+    set) and are only read back when the checkpoint is evaluated.
+
+    Args:
+        args (argparse.Namespace): k-NN arguments.
+        cfg (OmegaConf): config of the pretrained method.
+        ckpt_dir (Path): directory containing the checkpoints.
+    """
+
+    if args.feature_type != ["backbone"]:
+        raise ValueError(
+            "--all_checkpoints only loads the backbones of the checkpoints, so it requires "
+            f"--feature_type backbone (got --feature_type {' '.join(args.feature_type)})."
+        )
+
+    ckpts = find_checkpoints(ckpt_dir, args.checkpoint_frequency)
+    assert ckpts, f"No checkpoints found in {ckpt_dir}."
+
+    device = setup_inference_device(args.device, args.num_threads, args.num_workers)
+
+    # prepare data
+    _, T = prepare_transforms(args.dataset)
+    train_dataset, val_dataset = prepare_datasets(
+        args.dataset,
+        T_train=T,
+        T_val=T,
+        train_data_path=args.train_data_path,
+        val_data_path=args.val_data_path,
+        data_format=args.data_format,
+    )
+    datasets = {"train": train_dataset, "val": val_dataset}
+
+    curve = []
+    with ExitStack() as stack:
+        # features are streamed to the feature store, or to a temporary one if it is disabled
+        root = args.feature_store_dir
+        if root is None:
+            root = stack.enter_context(tempfile.TemporaryDirectory())
+        stores = {
+            epoch: FeatureStore(root, ckpt_path, args.dataset, transform=T)
+            for epoch, ckpt_path in ckpts
+        }
+        cached = {
+            epoch
+            for epoch, store in stores.items()
+            if all(store.exists(split, "backbone") for split in datasets)
+        }
+
+        for i in range(0, len(ckpts), args.checkpoints_per_pass):
+            group = ckpts[i : i + args.checkpoints_per_pass]
+
+            missing = [(epoch, ckpt_path) for epoch, ckpt_path in group if epoch not in cached]
+            if missing:
+                backbones = [
+                    prepare_model_for_inference(
+                        load_backbone(ckpt_path, cfg), device, cfg.backbone.name
+                    )
+                    for _, ckpt_path in missing
+                ]
+                for split, dataset in datasets.items():
+                    extract_features_multi(
+                        [stores[epoch] for epoch, _ in missing],
+                        dataset,
+                        split,
+                        backbones,
+                        args.batch_size,
+                        args.num_workers,
+                        device,
+                        args.bf16,
+                    )
+                del backbones
+
+            for epoch, _ in group:
+                # stored features are memory-mapped and only read for this checkpoint
+                train_features, train_targets = stores[epoch].load("train", "backbone")
+                test_features, test_targets = stores[epoch].load("val", "backbone")
+                for k in args.k:
+                    for distance_fx in args.distance_function:
+                        temperatures = args.temperature if distance_fx == "cosine" else [None]
+                        for T in temperatures:
+                            acc1, acc5 = run_knn(
+                                train_features=train_features.to(device).float(),
+                                train_targets=train_targets.to(device),
+                                test_features=test_features.to(device).float(),
+                                test_targets=test_targets.to(device),
+                                k=k,
+                                T=T,
+                                distance_fx=distance_fx,
+                            )
+                            print(
+                                f"Epoch {epoch}: distance_fx={distance_fx}, k={k}, T={T}, "
+                                f"acc@1={acc1}, acc@5={acc5}"
+                            )
+                            curve.append(
+                                {
+                                    "epoch": epoch,
+                                    "distance_fx": distance_fx,
+                                    "k": k,
+                                    "T": T,
+                                    "acc1": acc1,
+                                    "acc5": acc5,
+                                }
+                            )
+                del train_features, test_features
+
+                # temporary features are removed as soon as their checkpoint is evaluated
+                if args.feature_store_dir is None:
+                    for split in datasets:
+                        shutil.rmtree(stores[epoch].path(split, "backbone"))
+
+    if args.feature_store_dir is not None:
+        print(f"Feature store: {len(cached)}/{len(ckpts)} checkpoints loaded from cache")
+
+    curve_path = ckpt_dir / "knn_curve.json"
+    with open(curve_path, "w") as f:
+        json.dump(curve, f, indent=2)
+    print(f"Saved k-NN accuracy curve to {curve_path}")
+
+
 def main():
     args = parse_args_knn()
 
@@ -129,8 +413,17 @@ def main():
         method_args = json.load(f)
     cfg = OmegaConf.create(method_args)
 
+    if args.all_checkpoints:
+        main_all_checkpoints(args, cfg, ckpt_dir)
+        return
+
+    device = setup_inference_device(args.device, args.num_threads, args.num_workers)
+
     # build the model
-    model = METHODS[method_args["method"]].load_from_checkpoint(ckpt_path, strict=False, cfg=cfg)
+    model = METHODS[method_args["method"]].load_from_checkpoint(
+        ckpt_path, strict=False, cfg=cfg, map_location="cpu"
+    )
+    model = prepare_model_for_inference(model, device, cfg.backbone.name)
 
     # prepare data
     _, T = prepare_transforms(args.dataset)
@@ -142,20 +435,50 @@ def main():
         val_data_path=args.val_data_path,
         data_format=args.data_format,
     )
-    train_loader, val_loader = prepare_dataloaders(
-        train_dataset,
-        val_dataset,
-        batch_size=args.batch_size,
-        num_workers=args.num_workers,
-    )
 
-    # extract train features
-    train_features_bb, train_features_proj, train_targets = extract_features(train_loader, model)
-    train_features = {"backbone": train_features_bb, "projector": train_features_proj}
+    if args.feature_store_dir is not None:
+        store = FeatureStore(args.feature_store_dir, ckpt_path, args.dataset, transform=T)
+
+        train_features, train_targets = extract_features_with_store(
+            store,
+            train_dataset,
+            "train",
+            model,
+            args.batch_size,
+            args.num_workers,
+            device,
+            args.bf16,
+        )
+        test_features, test_targets = extract_features_with_store(
+            store,
+            val_dataset,
+            "val",
+            model,
+            args.batch_size,
+            args.num_workers,
+            device,
+            args.bf16,
+        )
+        print(store.report())
+    else:
+        train_loader, val_loader = prepare_dataloaders(
+            train_dataset,
+            val_dataset,
+            batch_size=args.batch_size,
+            num_workers=args.num_workers,
+        )
+
+        # extract train features
+        train_features_bb, train_features_proj, train_targets = extract_features(
+            train_loader, model, device, args.bf16
+        )
+        train_features = {"backbone": train_features_bb, "projector": train_features_proj}
 
-    # extract test features
-    test_features_bb, test_features_proj, test_targets = extract_features(val_loader, model)
-    test_features = {"backbone": test_features_bb, "projector": test_features_proj}
+        # extract test features
+        test_features_bb, test_features_proj, test_targets = extract_features(
+            val_loader, model, device, args.bf16
+        )
+        test_features = {"backbone": test_features_bb, "projector": test_features_proj}
 
     # run k-nn for all possible combinations of parameters
     for feat_type in args.feature_type:
@@ -167,9 +490,9 @@ def main():
                     print("---")
                     print(f"Running k-NN with params: distance_fx={distance_fx}, k={k}, T={T}...")
                     acc1, acc5 = run_knn(
-                        train_features=train_features[feat_type],
+                        train_features=train_features[feat_type].float(),
                         train_targets=train_targets,
-                        test_features=test_features[feat_type],
+                        test_features=test_features[feat_type].float(),
                         test_targets=test_targets,
                         k=k,
                         T=T,
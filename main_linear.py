@@ -215,6 +215,9 @@ def main(cfg: DictConfig):
     else:
         trainer.fit(model, train_loader, val_loader, ckpt_path=ckpt_path)
 
+    if cfg.performance.compile.enabled and trainer.is_global_zero:
+        print(model.compile_report())
+
 
 if __name__ == "__main__":
     main()
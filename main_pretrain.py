@@ -39,7 +39,9 @@ from solo.data.pretrain_dataloader import (
 from solo.methods import METHODS
 from solo.utils.auto_resumer import AutoResumer
 from solo.utils.checkpointer import Checkpointer
+from solo.utils.comm_stats import CommStatsCallback
 from solo.utils.misc import make_contiguous, omegaconf_select
+from solo.utils.profiler import StepProfilerCallback
 
 try:
     from solo.data.dali_dataloader import PretrainDALIDataModule, build_transform_pipeline_dali
@@ -195,6 +197,24 @@ def main(cfg: DictConfig):
         )
         callbacks.append(auto_umap)
 
+    if cfg.comm_stats.enabled:
+        comm_stats = CommStatsCallback(
+            logdir=cfg.comm_stats.dir,
+            sync_cuda=cfg.comm_stats.sync_cuda,
+        )
+        callbacks.append(comm_stats)
+
+    if cfg.step_profiler.enabled:
+        step_profiler = StepProfilerCallback(
+            window=cfg.step_profiler.window,
+            frequency=cfg.step_profiler.frequency,
+            sync_cuda=cfg.step_profiler.sync_cuda,
+            trace_start_step=cfg.step_profiler.trace.start_step,
+            trace_num_steps=cfg.step_profiler.trace.num_steps,
+            trace_dir=cfg.step_profiler.trace.dir,
+        )
+        callbacks.append(step_profiler)
+
     # wandb logging
     if cfg.wandb.enabled:
         wandb_logger = WandbLogger(
@@ -233,6 +253,9 @@ def main(cfg: DictConfig):
     else:
         trainer.fit(model, train_loader, val_loader, ckpt_path=ckpt_path)
 
+    if cfg.performance.compile.enabled and trainer.is_global_zero:
+        print(model.compile_report())
+
 
 if __name__ == "__main__":
     main()
@@ -24,9 +24,19 @@ from pathlib import Path
 from omegaconf import OmegaConf
 
 from solo.args.umap import parse_args_umap
-from solo.data.classification_dataloader import prepare_data
+from solo.data.classification_dataloader import (
+    prepare_data,
+    prepare_datasets,
+    prepare_transforms,
+)
 from solo.methods import METHODS
 from solo.utils.auto_umap import OfflineUMAP
+from solo.utils.feature_store import FeatureStore
+from solo.utils.misc import (
+    inference_autocast,
+    prepare_model_for_inference,
+    setup_inference_device,
+)
 
 
 def main():
@@ -42,12 +52,51 @@ def main():
         method_args = json.load(f)
     cfg = OmegaConf.create(method_args)
 
+    device = setup_inference_device(args.device, args.num_threads, args.num_workers)
+
     # build the model
     model = (
         METHODS[method_args["method"]]
-        .load_from_checkpoint(ckpt_path, strict=False, cfg=cfg)
+        .load_from_checkpoint(ckpt_path, strict=False, cfg=cfg, map_location="cpu")
         .backbone
     )
+    umap = OfflineUMAP()
+
+    # move model to the inference device
+    model = prepare_model_for_inference(model, device, cfg.backbone.name)
+
+    if args.feature_store_dir is not None:
+        # cached features must be deterministic, so both splits use the validation transformations
+        _, T = prepare_transforms(args.dataset)
+        train_dataset, val_dataset = prepare_datasets(
+            args.dataset,
+            T_train=T,
+            T_val=T,
+            train_data_path=args.train_data_path,
+            val_data_path=args.val_data_path,
+            data_format=args.data_format,
+        )
+
+        def forward_backbone(im):
+            with inference_autocast(device, args.bf16):
+                return model(im).float()
+
+        model.eval()
+        store = FeatureStore(args.feature_store_dir, ckpt_path, args.dataset, transform=T)
+        for split, dataset in [("train", train_dataset), ("val", val_dataset)]:
+            feats, labels = store.extract(
+                lambda im: {"backbone": forward_backbone(im)},
+                dataset,
+                split,
+                feature_types=["backbone"],
+                batch_size=args.batch_size,
+                num_workers=args.num_workers,
+                device=device,
+            )["backbone"]
+            umap.plot_features(feats, labels, f"im100_{split}_umap.pdf")
+        print(store.report())
+        return
+
     # prepare data
     train_loader, val_loader = prepare_data(
         args.dataset,
@@ -59,14 +108,8 @@ def main():
         auto_augment=False,
     )
 
-    umap = OfflineUMAP()
-
-    # move model to the gpu
-    device = "cuda:0"
-    model = model.to(device)
-
-    umap.plot(device, model, train_loader, "im100_train_umap.pdf")
-    umap.plot(device, model, val_loader, "im100_val_umap.pdf")
+    umap.plot(device, model, train_loader, "im100_train_umap.pdf", bf16=args.bf16)
+    umap.plot(device, model, val_loader, "im100_val_umap.pdf", bf16=args.bf16)
 
 
 if __name__ == "__main__":
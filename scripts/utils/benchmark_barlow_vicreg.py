@@ -0,0 +1,126 @@
+# Copyright 2023 solo-learn development team.
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the
+# Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies
+# or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+# PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE
+# FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import argparse
+import time
+
+import torch
+import torch.nn.functional as F
+
+from solo.losses.barlow import barlow_loss_func
+from solo.losses.vicreg import vicreg_loss_func
+
+
+def reference_barlow_loss(z1: torch.Tensor, z2: torch.Tensor) -> torch.Tensor:
+    # previous implementation: BatchNorm1d module, identity matrix and off-diagonal mask
+    N, D = z1.size()
+    bn = torch.nn.BatchNorm1d(D, affine=False).to(z1.device)
+    corr = torch.einsum("bi, bj -> ij", bn(z1), bn(z2)) / N
+    diag = torch.eye(D, device=corr.device)
+    cdif = (corr - diag).pow(2)
+    cdif[~diag.bool()] *= 5e-3
+    return 0.025 * cdif.sum()
+
+
+def reference_vicreg_loss(z1: torch.Tensor, z2: torch.Tensor) -> torch.Tensor:
+    # previous implementation: two DxD covariances, identity matrix and off-diagonal masks
+    N, D = z1.size()
+    sim_loss = F.mse_loss(z1, z2)
+    std_z1 = torch.sqrt(z1.var(dim=0) + 1e-4)
+    std_z2 = torch.sqrt(z2.var(dim=0) + 1e-4)
+    var_loss = torch.mean(F.relu(1 - std_z1)) + torch.mean(F.relu(1 - std_z2))
+    z1 = z1 - z1.mean(dim=0)
+    z2 = z2 - z2.mean(dim=0)
+    cov_z1 = (z1.T @ z1) / (N - 1)
+    cov_z2 = (z2.T @ z2) / (N - 1)
+    diag = torch.eye(D, device=z1.device)
+    cov_loss = cov_z1[~diag.bool()].pow_(2).sum() / D + cov_z2[~diag.bool()].pow_(2).sum() / D
+    return 25 * sim_loss + 25 * var_loss + cov_loss
+
+
+def benchmark(loss_fn, batch_size: int, dim: int, num_iters: int, device: torch.device):
+    """Measures the time and peak memory of forward and backward of a loss.
+
+    Args:
+        loss_fn (Callable): loss function that receives two NxD tensors.
+        batch_size (int): number of samples.
+        dim (int): dimension of the projected features.
+        num_iters (int): number of timed iterations (one extra warmup iteration is done).
+        device (torch.device): device.
+
+    Returns:
+        Tuple[float, float]: milliseconds per iteration and peak memory in MB (only on cuda).
+    """
+
+    z1 = torch.randn(batch_size, dim, device=device, requires_grad=True)
+    z2 = torch.randn(batch_size, dim, device=device, requires_grad=True)
+
+    loss_fn(z1, z2).backward()
+    if device.type == "cuda":
+        torch.cuda.synchronize()
+        torch.cuda.reset_peak_memory_stats()
+        base_memory = torch.cuda.memory_allocated()
+    start = time.perf_counter()
+    for _ in range(num_iters):
+        loss_fn(z1, z2).backward()
+    peak_memory = 0.0
+    if device.type == "cuda":
+        torch.cuda.synchronize()
+        peak_memory = (torch.cuda.max_memory_allocated() - base_memory) / 2**20
+    return (time.perf_counter() - start) / num_iters * 1000, peak_memory
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch_size", type=int, default=256)
+    parser.add_argument("--dims", type=int, nargs="+", default=[512, 2048, 4096, 8192])
+    parser.add_argument("--chunk_size", type=int, default=1024)
+    parser.add_argument("--num_iters", type=int, default=20)
+    parser.add_argument(
+        "--device", type=str, default="cuda" if torch.cuda.is_available() else "cpu"
+    )
+    args = parser.parse_args()
+
+    device = torch.device(args.device)
+    chunk_size = args.chunk_size
+    losses = {
+        "barlow": [
+            ("reference", reference_barlow_loss),
+            ("new", barlow_loss_func),
+            ("chunked", lambda z1, z2: barlow_loss_func(z1, z2, chunk_size=chunk_size)),
+        ],
+        "vicreg": [
+            ("reference", reference_vicreg_loss),
+            ("new", vicreg_loss_func),
+            ("chunked", lambda z1, z2: vicreg_loss_func(z1, z2, chunk_size=chunk_size)),
+        ],
+    }
+
+    print(f"Loss forward + backward time (ms) and peak memory (MB) on {device}")
+    print(f"| {'loss':<8} | {'variant':<10} | {'dim':>6} | {'time':>8} | {'memory':>8} |")
+    print(f"|{'-' * 10}|{'-' * 12}|{'-' * 8}|{'-' * 10}|{'-' * 10}|")
+    for loss_name, variants in losses.items():
+        for dim in args.dims:
+            for variant, loss_fn in variants:
+                t, memory = benchmark(loss_fn, args.batch_size, dim, args.num_iters, device)
+                print(f"| {loss_name:<8} | {variant:<10} | {dim:>6} | {t:>8.2f} | {memory:>8.1f} |")
+
+
+if __name__ == "__main__":
+    main()
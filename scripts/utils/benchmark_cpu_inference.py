@@ -0,0 +1,110 @@
+# Copyright 2023 solo-learn development team.
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the
+# Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies
+# or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+# PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE
+# FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import argparse
+import time
+
+import torch
+import torch.nn as nn
+
+from solo.methods.base import BaseMethod
+from solo.utils.misc import (
+    inference_autocast,
+    prepare_model_for_inference,
+    setup_inference_device,
+)
+
+
+@torch.no_grad()
+def benchmark_backbone(
+    name: str,
+    batch_size: int,
+    img_size: int,
+    num_iters: int,
+    num_warmup: int,
+    bf16: bool,
+    channels_last: bool,
+) -> float:
+    """Measures the cpu inference throughput of a backbone.
+
+    Args:
+        name (str): name of the backbone in BaseMethod._BACKBONES.
+        batch_size (int): batch size.
+        img_size (int): resolution of the images.
+        num_iters (int): number of timed iterations.
+        num_warmup (int): number of warmup iterations.
+        bf16 (bool): whether to use bf16 autocast.
+        channels_last (bool): whether to use channels_last for convolutional backbones.
+
+    Returns:
+        float: images per second.
+    """
+
+    device = torch.device("cpu")
+    backbone = BaseMethod._BACKBONES[name](None)
+    if name.startswith("resnet"):
+        backbone.fc = nn.Identity()
+    backbone.eval()
+    backbone = prepare_model_for_inference(backbone, device, name if channels_last else None)
+
+    x = torch.randn(batch_size, 3, img_size, img_size)
+    for i in range(num_warmup + num_iters):
+        if i == num_warmup:
+            start = time.perf_counter()
+        with inference_autocast(device, bf16):
+            backbone(x)
+    return batch_size * num_iters / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backbones", type=str, nargs="+", default=list(BaseMethod._BACKBONES))
+    parser.add_argument("--batch_size", type=int, default=32)
+    parser.add_argument("--img_size", type=int, default=224)
+    parser.add_argument("--num_iters", type=int, default=10)
+    parser.add_argument("--num_warmup", type=int, default=2)
+    parser.add_argument("--num_threads", type=int, default=None)
+    args = parser.parse_args()
+
+    setup_inference_device("cpu", args.num_threads)
+    print(f"Using {torch.get_num_threads()} threads")
+
+    configs = [("fp32", False, False), ("fp32+cl", False, True), ("bf16+cl", True, True)]
+    print(f"| {'backbone':<16} | " + " | ".join(f"{c[0]:>10}" for c in configs) + " |")
+    print(f"|{'-' * 18}|" + "|".join("-" * 12 for _ in configs) + "|")
+    for name in args.backbones:
+        # wide resnets are meant for cifar-sized images
+        img_size = 32 if name.startswith("wide_resnet") else args.img_size
+        results = [
+            benchmark_backbone(
+                name,
+                args.batch_size,
+                img_size,
+                args.num_iters,
+                args.num_warmup,
+                bf16=bf16,
+                channels_last=channels_last,
+            )
+            for _, bf16, channels_last in configs
+        ]
+        print(f"| {name:<16} | " + " | ".join(f"{r:>10.1f}" for r in results) + " |")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+# Copyright 2023 solo-learn development team.
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the
+# Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies
+# or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+# PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE
+# FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import argparse
+import copy
+import time
+
+import torch
+
+from solo.methods.base import BaseMethod
+from solo.utils.misc import enable_grad_checkpointing
+
+
+def saved_activations_hook():
+    """Creates saved tensor hooks that measure the memory of the activations kept for backward.
+    Activations saved inside checkpointed units are handled by the checkpoint and not counted.
+
+    Returns:
+        Tuple[torch.autograd.graph.saved_tensors_hooks, Dict[int, int]]: hooks and the dict
+            mapping each saved storage to its size in bytes.
+    """
+
+    storages = {}
+
+    def pack(t: torch.Tensor) -> torch.Tensor:
+        if not isinstance(t, torch.nn.Parameter):
+            storage = t.untyped_storage()
+            storages[storage.data_ptr()] = storage.nbytes()
+        return t
+
+    return torch.autograd.graph.saved_tensors_hooks(pack, lambda t: t), storages
+
+
+def benchmark(model, batch_size: int, img_size: int, num_iters: int, device: torch.device):
+    """Measures the time of forward and backward of a backbone and the memory used by the
+    activations.
+
+    Args:
+        model (nn.Module): backbone.
+        batch_size (int): number of images.
+        img_size (int): resolution of the images.
+        num_iters (int): number of timed iterations (one extra warmup iteration is done).
+        device (torch.device): device.
+
+    Returns:
+        Tuple[float, float, float]: images per second, memory of the saved activations in MB
+            and peak memory in MB (only on cuda).
+    """
+
+    x = torch.randn(batch_size, 3, img_size, img_size, device=device)
+
+    hooks, storages = saved_activations_hook()
+    with hooks:
+        out = model(x)
+    out.float().pow(2).mean().backward()
+    saved_memory = sum(storages.values()) / 2**20
+
+    if device.type == "cuda":
+        torch.cuda.synchronize()
+        torch.cuda.reset_peak_memory_stats()
+        base_memory = torch.cuda.memory_allocated()
+    start = time.perf_counter()
+    for _ in range(num_iters):
+        model(x).float().pow(2).mean().backward()
+    peak_memory = 0.0
+    if device.type == "cuda":
+        torch.cuda.synchronize()
+        peak_memory = (torch.cuda.max_memory_allocated() - base_memory) / 2**20
+    throughput = batch_size * num_iters / (time.perf_counter() - start)
+    return throughput, saved_memory, peak_memory
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--backbones",
+        type=str,
+        nargs="+",
+        default=[
+            "resnet50",
+            "vit_large",
+            "swin_large",
+            "convnext_large",
+            "poolformer_m48",
+        ],
+    )
+    parser.add_argument("--fractions", type=float, nargs="+", default=[0.0, 0.5, 1.0])
+    parser.add_argument("--batch_size", type=int, default=32)
+    parser.add_argument("--img_size", type=int, default=224)
+    parser.add_argument("--num_iters", type=int, default=5)
+    parser.add_argument(
+        "--device", type=str, default="cuda" if torch.cuda.is_available() else "cpu"
+    )
+    args = parser.parse_args()
+
+    device = torch.device(args.device)
+
+    print(
+        f"Backbone forward + backward with batch size {args.batch_size} at {args.img_size}px"
+        f" on {device}: throughput (img/s), saved activations (MB) and peak memory (MB)"
+    )
+    print(f"| {'backbone':<16} | {'fraction':>8} | {'img/s':>8} | {'saved':>9} | {'peak':>9} |")
+    print(f"|{'-' * 18}|{'-' * 10}|{'-' * 10}|{'-' * 11}|{'-' * 11}|")
+    for name in args.backbones:
+        kwargs = {}
+        if name.startswith(("vit", "swin")):
+            kwargs["img_size"] = args.img_size
+        base_model = BaseMethod._BACKBONES[name](method=None, **kwargs).to(device)
+        for fraction in args.fractions:
+            model = copy.deepcopy(base_model)
+            if fraction > 0:
+                enable_grad_checkpointing(model, fraction)
+            throughput, saved, peak = benchmark(
+                model, args.batch_size, args.img_size, args.num_iters, device
+            )
+            peak = f"{peak:>9.1f}" if device.type == "cuda" else f"{'-':>9}"
+            print(
+                f"| {name:<16} | {fraction:>8.2f} | {throughput:>8.1f} | {saved:>9.1f} | {peak} |"
+            )
+            del model
+
+
+if __name__ == "__main__":
+    main()
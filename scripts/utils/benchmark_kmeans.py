@@ -0,0 +1,109 @@
+# Copyright 2023 solo-learn development team.
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the
+# Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies
+# or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+# PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE
+# FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+# Compares the vectorized k-means of DeepClusterV2 against the previous implementation, which
+# computed the full distance matrix and looped over the clusters in the M step.
+
+import argparse
+import time
+
+import torch
+import torch.nn.functional as F
+
+from solo.utils.kmeans import KMeans
+
+
+@torch.no_grad()
+def loop_kmeans(embeddings: torch.Tensor, K: int, kmeans_iters: int) -> torch.Tensor:
+    """k-means with a dense E step and a python loop over the clusters in the M step.
+
+    Args:
+        embeddings (torch.Tensor): normalized embeddings.
+        K (int): number of clusters.
+        kmeans_iters (int): number of iterations.
+
+    Returns:
+        torch.Tensor: assignments of the samples.
+    """
+
+    centroids = embeddings[torch.randperm(len(embeddings), device=embeddings.device)[:K]]
+    for n_iter in range(kmeans_iters + 1):
+        _, assignments = torch.mm(embeddings, centroids.t()).max(dim=1)
+        if n_iter == kmeans_iters:
+            break
+        counts = torch.zeros(K, dtype=torch.int, device=embeddings.device)
+        emb_sums = torch.zeros_like(centroids)
+        for k in range(K):
+            where = torch.where(assignments == k)[0]
+            if len(where) > 0:
+                emb_sums[k] = embeddings[where].sum(dim=0)
+                counts[k] = len(where)
+        mask = counts > 0
+        centroids[mask] = emb_sums[mask] / counts[mask].unsqueeze(1)
+        centroids = F.normalize(centroids, dim=1, p=2)
+    return assignments
+
+
+def timed(fn, device: torch.device) -> float:
+    if device.type == "cuda":
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    fn()
+    if device.type == "cuda":
+        torch.cuda.synchronize()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dataset_sizes", type=int, nargs="+", default=[20000, 100000])
+    parser.add_argument("--proj_features_dim", type=int, default=128)
+    parser.add_argument("--num_prototypes", type=int, nargs="+", default=[1000, 1000, 1000])
+    parser.add_argument("--kmeans_iters", type=int, default=3)
+    parser.add_argument(
+        "--device", type=str, default="cuda" if torch.cuda.is_available() else "cpu"
+    )
+    args = parser.parse_args()
+
+    device = torch.device(args.device)
+    print(f"k-means time (s) on {device} for {args.num_prototypes} clusters")
+    print(f"| {'samples':>10} | {'loop':>10} | {'vectorized':>10} |")
+    print(f"|{'-' * 12}|{'-' * 12}|{'-' * 12}|")
+    for n in args.dataset_sizes:
+        d = args.proj_features_dim
+        embeddings = F.normalize(torch.randn(2, n, d, device=device), dim=-1)
+        kmeans = KMeans(
+            1, 0, 2, n, d, args.num_prototypes, kmeans_iters=args.kmeans_iters, device=device
+        )
+
+        vectorized_time = timed(
+            lambda: kmeans.cluster_memory(torch.arange(n, device=device), embeddings), device
+        )
+        loop_time = timed(
+            lambda: [
+                loop_kmeans(embeddings[i % 2], K, args.kmeans_iters)
+                for i, K in enumerate(args.num_prototypes)
+            ],
+            device,
+        )
+        print(f"| {n:>10} | {loop_time:>10.3f} | {vectorized_time:>10.3f} |")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+# Copyright 2023 solo-learn development team.
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the
+# Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies
+# or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+# PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE
+# FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+# Benchmarks the training step of every method with several backbones on cpu with synthetic
+# data. Each configuration runs in its own process so that its peak memory is isolated.
+# Results are stored as json and can be compared with compare_benchmarks.py.
+
+import argparse
+import json
+import multiprocessing
+import platform
+import resource
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List
+
+import numpy as np
+import torch
+from lightning.pytorch import Callback, Trainer
+from omegaconf import OmegaConf
+from torch.utils._python_dispatch import TorchDispatchMode
+from torch.utils.data import DataLoader, Dataset
+
+from solo.methods import METHODS
+
+CONFIG_DIR = Path(__file__).resolve().parents[1] / "pretrain" / "cifar"
+
+# base classes that are not pretraining methods
+SKIPPED_METHODS = ["base", "linear"]
+
+
+class SyntheticDataset(Dataset):
+    def __init__(self, size: int, num_crops: int, img_size: int, num_classes: int):
+        """Dataset of random crops in the format of the pretraining datasets.
+
+        Args:
+            size (int): number of samples.
+            num_crops (int): number of crops of each sample.
+            img_size (int): resolution of the crops.
+            num_classes (int): number of classes.
+        """
+
+        self.size = size
+        self.num_crops = num_crops
+        self.img_size = img_size
+        self.num_classes = num_classes
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __getitem__(self, index: int):
+        generator = torch.Generator().manual_seed(index)
+        crops = [
+            torch.randn(3, self.img_size, self.img_size, generator=generator)
+            for _ in range(self.num_crops)
+        ]
+        return index, crops, index % self.num_classes
+
+
+class AllocationCounter(TorchDispatchMode):
+    """Sums the bytes of the tensors allocated by every operator, ignoring outputs that share
+    the storage of an input (views and in-place operations)."""
+
+    def __init__(self):
+        super().__init__()
+        self.nbytes = 0
+
+    def __torch_dispatch__(self, func, types, args=(), kwargs=None):
+        out = func(*args, **(kwargs or {}))
+
+        inputs = torch.utils._pytree.tree_leaves((args, kwargs))
+        input_ptrs = {t.untyped_storage().data_ptr() for t in inputs if isinstance(t, torch.Tensor)}
+        for t in torch.utils._pytree.tree_leaves(out):
+            if isinstance(t, torch.Tensor) and t.untyped_storage().data_ptr() not in input_ptrs:
+                self.nbytes += t.untyped_storage().nbytes()
+        return out
+
+
+class StepTimer(Callback):
+    def __init__(self, num_warmup: int, num_iters: int):
+        """Times the forward (training step with the loss), backward and optimizer step of
+        num_iters steps after num_warmup steps, then counts the bytes allocated in one more step.
+
+        Args:
+            num_warmup (int): number of untimed steps.
+            num_iters (int): number of timed steps.
+        """
+
+        super().__init__()
+        self.num_warmup = num_warmup
+        self.num_iters = num_iters
+        self.times: Dict[str, List[float]] = {
+            "forward": [],
+            "backward": [],
+            "optimizer": [],
+            "step": [],
+        }
+        self.counter = None
+        self.allocated_bytes = 0
+
+    def on_train_batch_start(self, trainer, pl_module, batch, batch_idx):
+        self.timed = self.num_warmup <= batch_idx < self.num_warmup + self.num_iters
+        if batch_idx == self.num_warmup + self.num_iters:
+            self.counter = AllocationCounter()
+            self.counter.__enter__()
+        self.start = time.perf_counter()
+
+    def on_before_backward(self, trainer, pl_module, loss):
+        self.backward_start = time.perf_counter()
+
+    def on_after_backward(self, trainer, pl_module):
+        self.backward_end = time.perf_counter()
+
+    def on_train_batch_end(self, trainer, pl_module, outputs, batch, batch_idx):
+        end = time.perf_counter()
+        if self.counter is not None:
+            self.counter.__exit__(None, None, None)
+            self.allocated_bytes = self.counter.nbytes
+            self.counter = None
+        if self.timed:
+            self.times["forward"].append(self.backward_start - self.start)
+            self.times["backward"].append(self.backward_end - self.backward_start)
+            self.times["optimizer"].append(end - self.backward_end)
+            self.times["step"].append(end - self.start)
+
+
+def build_cfg(method: str, backbone: str, args: argparse.Namespace):
+    """Builds the config of a method from its cifar pretraining config, replacing the backbone,
+    the data and the trainer settings.
+
+    Args:
+        method (str): name of the method in solo.methods.METHODS.
+        backbone (str): name of the backbone in BaseMethod._BACKBONES.
+        args (argparse.Namespace): benchmark arguments.
+
+    Returns:
+        omegaconf.DictConfig: config of the method.
+    """
+
+    yaml_cfg = OmegaConf.load(CONFIG_DIR / f"{method.replace('_twins', '')}.yaml")
+
+    backbone_kwargs = {}
+    if backbone.startswith(("vit", "swin")):
+        backbone_kwargs["img_size"] = args.img_size
+    if backbone.startswith("vit") and args.img_size <= 64:
+        backbone_kwargs["patch_size"] = 4
+
+    cfg = {
+        "name": f"benchmark-{method}-{backbone}",
+        "method": method,
+        "backbone": {"name": backbone, "kwargs": backbone_kwargs},
+        "method_kwargs": yaml_cfg.method_kwargs,
+        "data": {
+            "dataset": "cifar10" if args.img_size <= 64 else "imagenet100",
+            "train_path": ".",
+            "format": "image_folder",
+            "num_workers": 0,
+            "num_large_crops": 2,
+            "num_small_crops": 0,
+            "num_classes": args.num_classes,
+        },
+        "optimizer": {
+            "name": yaml_cfg.optimizer.name,
+            "batch_size": args.batch_size,
+            "lr": yaml_cfg.optimizer.lr,
+            "classifier_lr": yaml_cfg.optimizer.classifier_lr,
+            "weight_decay": yaml_cfg.optimizer.weight_decay,
+            "kwargs": yaml_cfg.optimizer.get("kwargs", {}),
+        },
+        "scheduler": {"name": "none"},
+        "checkpoint": {"enabled": False},
+        "auto_resume": {"enabled": False},
+        "max_epochs": 1,
+        "devices": 1,
+        "accelerator": "cpu",
+        "num_nodes": 1,
+    }
+    if "momentum" in yaml_cfg:
+        cfg["momentum"] = yaml_cfg.momentum
+    cfg = OmegaConf.create(cfg)
+    OmegaConf.set_struct(cfg, False)
+    return cfg
+
+
+def run_config(method: str, backbone: str, args: argparse.Namespace) -> Dict[str, Any]:
+    """Trains a method for a few steps and measures its time and memory.
+
+    Args:
+        method (str): name of the method in solo.methods.METHODS.
+        backbone (str): name of the backbone in BaseMethod._BACKBONES.
+        args (argparse.Namespace): benchmark arguments.
+
+    Returns:
+        Dict[str, Any]: median times in milliseconds, steps per second, peak resident memory
+            and allocated tensor bytes of a step in MB, or the error if the method could not run
+            with the backbone.
+    """
+
+    torch.manual_seed(0)
+    torch.set_num_threads(args.num_threads)
+
+    try:
+        cfg = build_cfg(method, backbone, args)
+        model = METHODS[method](cfg)
+
+        num_steps = args.num_warmup + args.num_iters + 1
+        dataset = SyntheticDataset(
+            num_steps * args.batch_size,
+            cfg.data.num_large_crops + cfg.data.num_small_crops,
+            args.img_size,
+            args.num_classes,
+        )
+        loader = DataLoader(dataset, batch_size=args.batch_size, shuffle=False, drop_last=True)
+
+        timer = StepTimer(args.num_warmup, args.num_iters)
+        trainer = Trainer(
+            accelerator="cpu",
+            devices=1,
+            max_steps=num_steps,
+            max_epochs=1,
+            logger=False,
+            callbacks=[timer],
+            enable_checkpointing=False,
+            enable_progress_bar=False,
+            enable_model_summary=False,
+            num_sanity_val_steps=0,
+            limit_val_batches=0,
+        )
+        trainer.fit(model, loader)
+    except Exception as e:
+        return {"error": f"{type(e).__name__}: {e}", "traceback": traceback.format_exc()}
+
+    result = {f"{k}_ms": float(np.median(v) * 1000) for k, v in timer.times.items()}
+    result["steps_per_s"] = float(1 / np.mean(timer.times["step"]))
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    result["peak_rss_mb"] = peak_rss / 2**20 if sys.platform == "darwin" else peak_rss / 2**10
+    result["allocated_mb"] = timer.allocated_bytes / 2**20
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    methods = [m for m in METHODS if m not in SKIPPED_METHODS]
+    parser.add_argument("--methods", type=str, nargs="+", default=methods)
+    parser.add_argument(
+        "--backbones", type=str, nargs="+", default=["resnet18", "wide_resnet28w2", "vit_tiny"]
+    )
+    parser.add_argument("--batch_size", type=int, default=16)
+    parser.add_argument("--img_size", type=int, default=32)
+    parser.add_argument("--num_classes", type=int, default=10)
+    parser.add_argument("--num_iters", type=int, default=10)
+    parser.add_argument("--num_warmup", type=int, default=3)
+    parser.add_argument("--num_threads", type=int, default=torch.get_num_threads())
+    parser.add_argument("--output", type=Path, default=Path("benchmark_methods.json"))
+    args = parser.parse_args()
+
+    results = {}
+    print(f"Training step on cpu with batch size {args.batch_size} at {args.img_size}px")
+    columns = ["fwd ms", "bwd ms", "opt ms", "steps/s", "rss MB", "alloc MB"]
+    print(f"| {'method':<14} | {'backbone':<16} | " + " | ".join(f"{c:>8}" for c in columns) + " |")
+    print(f"|{'-' * 16}|{'-' * 18}|" + "|".join("-" * 10 for _ in columns) + "|")
+    context = multiprocessing.get_context("spawn")
+    for method in args.methods:
+        for backbone in args.backbones:
+            # a fresh process per configuration isolates its peak memory
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                result = executor.submit(run_config, method, backbone, args).result()
+            results[f"{method}/{backbone}"] = result
+
+            if "error" in result:
+                values = [f"{'-':>8}"] * len(columns)
+                print(f"| {method:<14} | {backbone:<16} | " + " | ".join(values) + " |")
+                print(f"  skipped: {result['error'].splitlines()[0]}")
+                continue
+            keys = ["forward_ms", "backward_ms", "optimizer_ms", "steps_per_s"]
+            keys += ["peak_rss_mb", "allocated_mb"]
+            values = [f"{result[k]:>8.2f}" for k in keys]
+            print(f"| {method:<14} | {backbone:<16} | " + " | ".join(values) + " |")
+
+    meta = {
+        "date": datetime.now().isoformat(),
+        "torch": torch.__version__,
+        "python": platform.python_version(),
+        "processor": platform.processor(),
+    }
+    meta.update({k: str(v) if isinstance(v, Path) else v for k, v in vars(args).items()})
+    with open(args.output, "w") as f:
+        json.dump({"meta": meta, "results": results}, f, indent=2)
+    print(f"Results stored in {args.output}")
+
+
+if __name__ == "__main__":
+    main()
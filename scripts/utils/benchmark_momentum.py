@@ -0,0 +1,107 @@
+# Copyright 2023 solo-learn development team.
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the
+# Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies
+# or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+# PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE
+# FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import argparse
+import copy
+import time
+
+import torch
+import torch.nn as nn
+
+from solo.methods.base import BaseMethod
+from solo.utils.momentum import MomentumUpdater, initialize_momentum_params
+
+
+@torch.no_grad()
+def loop_update(online_net: nn.Module, momentum_net: nn.Module, tau: float):
+    # previous implementation: one or two kernels per parameter
+    for op, mp in zip(online_net.parameters(), momentum_net.parameters()):
+        mp.data = tau * mp.data + (1 - tau) * op.data
+
+
+def benchmark_backbone(name: str, num_iters: int, num_warmup: int, device: torch.device):
+    """Measures the time of a momentum update of a backbone with the previous per-parameter
+    loop, with the multi-tensor implementation and with flat momentum parameters.
+
+    Args:
+        name (str): name of the backbone in BaseMethod._BACKBONES.
+        num_iters (int): number of timed iterations.
+        num_warmup (int): number of warmup iterations.
+        device (torch.device): device.
+
+    Returns:
+        Tuple[int, float, float, float]: number of parameter tensors and milliseconds per
+            update for the loop, foreach and flat implementations.
+    """
+
+    online_net = BaseMethod._BACKBONES[name](None).to(device)
+    momentum_net = copy.deepcopy(online_net)
+    initialize_momentum_params(online_net, momentum_net)
+    updater = MomentumUpdater(0.99, 1.0)
+    flat_momentum_net = copy.deepcopy(momentum_net)
+    flat_updater = MomentumUpdater(0.99, 1.0, flat_params=True)
+
+    update_fns = [
+        lambda: loop_update(online_net, momentum_net, 0.99),
+        lambda: updater.update(online_net, momentum_net),
+        lambda: flat_updater.update(online_net, flat_momentum_net),
+    ]
+    results = []
+    for update_fn in update_fns:
+        for i in range(num_warmup + num_iters):
+            if i == num_warmup:
+                if device.type == "cuda":
+                    torch.cuda.synchronize()
+                start = time.perf_counter()
+            update_fn()
+        if device.type == "cuda":
+            torch.cuda.synchronize()
+        results.append((time.perf_counter() - start) / num_iters * 1000)
+    return len(list(online_net.parameters())), *results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--backbones",
+        type=str,
+        nargs="+",
+        default=["resnet18", "resnet50", "vit_small", "vit_base", "swin_tiny"],
+    )
+    parser.add_argument("--num_iters", type=int, default=50)
+    parser.add_argument("--num_warmup", type=int, default=5)
+    parser.add_argument(
+        "--device", type=str, default="cuda" if torch.cuda.is_available() else "cpu"
+    )
+    args = parser.parse_args()
+
+    device = torch.device(args.device)
+    print(f"Momentum update time (ms) on {device}")
+    columns = ["#tensors", "loop", "foreach", "flat"]
+    print(f"| {'backbone':<16} | " + " | ".join(f"{c:>8}" for c in columns) + " |")
+    print(f"|{'-' * 18}|" + "|".join("-" * 10 for _ in columns) + "|")
+    for name in args.backbones:
+        num_tensors, *times = benchmark_backbone(name, args.num_iters, args.num_warmup, device)
+        print(
+            f"| {name:<16} | {num_tensors:>8} | " + " | ".join(f"{t:>8.2f}" for t in times) + " |"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+# Copyright 2023 solo-learn development team.
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the
+# Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies
+# or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+# PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE
+# FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import argparse
+import time
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+from solo.utils.feature_queue import FeatureQueue
+from solo.utils.sinkhorn_knopp import SinkhornKnopp
+
+
+@torch.no_grad()
+def benchmark_queue(
+    mode: str,
+    queue_size: int,
+    batch_size: int,
+    proj_output_dim: int,
+    num_prototypes: int,
+    staleness: int,
+    num_iters: int,
+    num_warmup: int,
+    device: torch.device,
+) -> float:
+    """Measures the time per step spent on SwAV's queue, i.e., computing the sinkhorn-knopp
+    assignments of the batch together with the queue and updating the queue.
+
+    Args:
+        mode (str): "shift" for the previous shift-and-clone update, "ring" for the ring
+            buffer and "cached" for the ring buffer with cached prototype scores.
+        queue_size (int): number of samples in the queue.
+        batch_size (int): batch size.
+        proj_output_dim (int): number of dimensions of the projected features.
+        num_prototypes (int): number of prototypes.
+        staleness (int): number of steps cached scores are reused for.
+        num_iters (int): number of timed iterations.
+        num_warmup (int): number of warmup iterations.
+        device (torch.device): device.
+
+    Returns:
+        float: milliseconds per step.
+    """
+
+    prototypes = nn.Linear(proj_output_dim, num_prototypes, bias=False).to(device)
+    sk = SinkhornKnopp()
+    if mode == "shift":
+        queue = torch.zeros(2, queue_size, proj_output_dim, device=device)
+    else:
+        queue = FeatureQueue(queue_size, proj_output_dim, num_views=2).to(device)
+        score_queue = FeatureQueue(queue_size, num_prototypes, num_views=2).to(device)
+
+    for step in range(num_warmup + num_iters):
+        if step == num_warmup:
+            if device.type == "cuda":
+                torch.cuda.synchronize()
+            start = time.perf_counter()
+
+        z = F.normalize(torch.randn(2, batch_size, proj_output_dim, device=device), dim=-1)
+        preds = prototypes(z)
+
+        for i in range(2):
+            if mode == "shift":
+                p_queue = prototypes(queue[i])
+            elif mode == "ring" or staleness == 0:
+                # like SwAV, a staleness of 0 disables the cached scores
+                p_queue = prototypes(queue.get()[i])
+            else:
+                if step % staleness == 0:
+                    score_queue.features[i].copy_(prototypes(queue.get()[i]))
+                p_queue = score_queue.get()[i]
+            sk(torch.cat((preds[i], p_queue)))[:batch_size]
+
+        if mode == "shift":
+            queue[:, batch_size:] = queue[:, :-batch_size].clone()
+            queue[:, :batch_size] = z
+        else:
+            queue.enqueue(z)
+            if mode == "cached" and staleness > 0:
+                score_queue.enqueue(preds)
+
+    if device.type == "cuda":
+        torch.cuda.synchronize()
+    return (time.perf_counter() - start) / num_iters * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queue_sizes", type=int, nargs="+", default=[3840, 16384, 65536])
+    parser.add_argument("--batch_size", type=int, default=256)
+    parser.add_argument("--proj_output_dim", type=int, default=128)
+    parser.add_argument("--num_prototypes", type=int, default=3000)
+    parser.add_argument("--staleness", type=int, default=10)
+    parser.add_argument("--num_iters", type=int, default=20)
+    parser.add_argument("--num_warmup", type=int, default=5)
+    parser.add_argument(
+        "--device", type=str, default="cuda" if torch.cuda.is_available() else "cpu"
+    )
+    args = parser.parse_args()
+
+    device = torch.device(args.device)
+    modes = [
+        ("shift", "shift+clone"),
+        ("ring", "ring"),
+        ("cached", f"ring+cache({args.staleness})"),
+    ]
+    print(f"Time per step (ms) on {device}")
+    print(f"| {'queue size':>10} | " + " | ".join(f"{m[1]:>14}" for m in modes) + " |")
+    print(f"|{'-' * 12}|" + "|".join("-" * 16 for _ in modes) + "|")
+    for queue_size in args.queue_sizes:
+        results = [
+            benchmark_queue(
+                mode,
+                queue_size,
+                args.batch_size,
+                args.proj_output_dim,
+                args.num_prototypes,
+                args.staleness,
+                args.num_iters,
+                args.num_warmup,
+                device,
+            )
+            for mode, _ in modes
+        ]
+        print(f"| {queue_size:>10} | " + " | ".join(f"{r:>14.2f}" for r in results) + " |")
+
+
+if __name__ == "__main__":
+    main()
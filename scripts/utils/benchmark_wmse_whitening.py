@@ -0,0 +1,125 @@
+# Copyright 2023 solo-learn development team.
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the
+# Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies
+# or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+# PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE
+# FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import argparse
+import time
+
+import torch
+from torch.nn.functional import conv2d
+
+from solo.utils.whitening import Whitening2d
+
+
+def loop_whitening(x: torch.Tensor, eps: float) -> torch.Tensor:
+    # previous implementation: one cholesky, inverse and conv2d per slice
+    out = []
+    for xi in x:
+        xi = xi.unsqueeze(2).unsqueeze(3)
+        xn = xi - xi.mean(0).view(xi.size(1), -1).mean(-1).view(1, -1, 1, 1)
+        T = xn.permute(1, 0, 2, 3).contiguous().view(xi.size(1), -1)
+        f_cov = torch.mm(T, T.permute(1, 0)) / (T.shape[-1] - 1)
+        eye = torch.eye(xi.size(1)).type(f_cov.type())
+        f_cov_shrinked = (1 - eps) * f_cov + eps * eye
+        inv_sqrt = torch.triangular_solve(eye, torch.linalg.cholesky(f_cov_shrinked), upper=False)
+        inv_sqrt = inv_sqrt[0].contiguous().view(xi.size(1), xi.size(1), 1, 1)
+        out.append(conv2d(xn, inv_sqrt).squeeze(2).squeeze(2))
+    return torch.stack(out)
+
+
+def benchmark(
+    batch_size: int,
+    num_crops: int,
+    whitening_size: int,
+    dim: int,
+    num_iters: int,
+    num_warmup: int,
+    device: torch.device,
+):
+    """Measures the time of forward and backward of the whitening of all slices of all crops of
+    a batch with the previous per-slice loop and with the batched implementation.
+
+    Args:
+        batch_size (int): number of samples per crop.
+        num_crops (int): number of crops.
+        whitening_size (int): size of each slice.
+        dim (int): dimension of the projected features.
+        num_iters (int): number of timed iterations.
+        num_warmup (int): number of warmup iterations.
+        device (torch.device): device.
+
+    Returns:
+        Tuple[float, float]: milliseconds per iteration for the loop and batched implementations.
+    """
+
+    whitening = Whitening2d(dim, eps=0.0)
+    x = torch.randn(num_crops * batch_size // whitening_size, whitening_size, dim, device=device)
+    x.requires_grad_()
+
+    whitening_fns = [lambda: loop_whitening(x, 0.0), lambda: whitening(x)]
+    results = []
+    for whitening_fn in whitening_fns:
+        for i in range(num_warmup + num_iters):
+            if i == num_warmup:
+                if device.type == "cuda":
+                    torch.cuda.synchronize()
+                start = time.perf_counter()
+            whitening_fn().sum().backward()
+        if device.type == "cuda":
+            torch.cuda.synchronize()
+        results.append((time.perf_counter() - start) / num_iters * 1000)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch_size", type=int, default=1024)
+    parser.add_argument("--num_crops", type=int, default=2)
+    parser.add_argument("--whitening_sizes", type=int, nargs="+", default=[128, 256])
+    parser.add_argument("--dims", type=int, nargs="+", default=[32, 64, 128])
+    parser.add_argument("--num_iters", type=int, default=50)
+    parser.add_argument("--num_warmup", type=int, default=5)
+    parser.add_argument(
+        "--device", type=str, default="cuda" if torch.cuda.is_available() else "cpu"
+    )
+    args = parser.parse_args()
+
+    device = torch.device(args.device)
+    print(f"W-MSE whitening forward + backward time (ms) on {device}")
+    columns = ["size", "dim", "loop", "batched", "speedup"]
+    print("| " + " | ".join(f"{c:>8}" for c in columns) + " |")
+    print("|" + "|".join("-" * 10 for _ in columns) + "|")
+    for whitening_size in args.whitening_sizes:
+        for dim in args.dims:
+            loop, batched = benchmark(
+                args.batch_size,
+                args.num_crops,
+                whitening_size,
+                dim,
+                args.num_iters,
+                args.num_warmup,
+                device,
+            )
+            print(
+                f"| {whitening_size:>8} | {dim:>8} | {loop:>8.2f} | {batched:>8.2f} "
+                f"| {loop / batched:>7.2f}x |"
+            )
+
+
+if __name__ == "__main__":
+    main()
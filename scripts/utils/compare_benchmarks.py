@@ -0,0 +1,111 @@
+# Copyright 2023 solo-learn development team.
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the
+# Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies
+# or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+# PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE
+# FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+# Compares the results of benchmark_methods.py against a baseline and exits with an error if
+# any configuration regressed.
+
+import argparse
+import json
+import sys
+from typing import Any, Dict, List, Tuple
+
+TIME_METRICS = ["forward_ms", "backward_ms", "optimizer_ms", "step_ms"]
+MEMORY_METRICS = ["peak_rss_mb", "allocated_mb"]
+
+
+def compare(
+    baseline: Dict[str, Dict[str, Any]],
+    results: Dict[str, Dict[str, Any]],
+    time_tolerance: float,
+    memory_tolerance: float,
+) -> List[Tuple[str, str, float, float]]:
+    """Finds the metrics of each configuration that are worse than in the baseline by more
+    than the tolerance. Configurations that ran in the baseline but fail now are regressions.
+
+    Args:
+        baseline (Dict[str, Dict[str, Any]]): baseline results indexed by configuration.
+        results (Dict[str, Dict[str, Any]]): new results indexed by configuration.
+        time_tolerance (float): relative increase of the times that is tolerated.
+        memory_tolerance (float): relative increase of the memory that is tolerated.
+
+    Returns:
+        List[Tuple[str, str, float, float]]: configuration, metric, baseline and new value of
+            each regression (NaN for configurations that fail and for metrics that are missing
+            from the new results).
+    """
+
+    regressions = []
+    for config, base in baseline.items():
+        if config not in results or "error" in base:
+            continue
+        new = results[config]
+        if "error" in new:
+            regressions.append((config, "error", float("nan"), float("nan")))
+            continue
+
+        tolerances = {m: time_tolerance for m in TIME_METRICS}
+        tolerances.update({m: memory_tolerance for m in MEMORY_METRICS})
+        for metric, tolerance in tolerances.items():
+            if metric not in base:
+                continue
+            # a metric that is missing from the new results is NaN, which fails the comparison
+            value = new.get(metric, float("nan"))
+            if not value <= base[metric] * (1 + tolerance):
+                regressions.append((config, metric, base[metric], value))
+        # throughput regresses when it decreases
+        if "steps_per_s" in base:
+            value = new.get("steps_per_s", float("nan"))
+            if not value >= base["steps_per_s"] / (1 + time_tolerance):
+                regressions.append((config, "steps_per_s", base["steps_per_s"], value))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("baseline", type=str)
+    parser.add_argument("results", type=str)
+    parser.add_argument("--time_tolerance", type=float, default=0.1)
+    parser.add_argument("--memory_tolerance", type=float, default=0.05)
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)["results"]
+    with open(args.results) as f:
+        results = json.load(f)["results"]
+
+    missing = sorted(set(baseline) - set(results))
+    if missing:
+        print(f"Not in the results: {', '.join(missing)}")
+
+    regressions = compare(baseline, results, args.time_tolerance, args.memory_tolerance)
+    if not regressions:
+        print(f"No regressions in {len(set(baseline) & set(results))} configurations")
+        return
+
+    header = ["configuration".ljust(32), "metric".ljust(14), "baseline".rjust(10), "new".rjust(10)]
+    print("| " + " | ".join(header) + f" | {'change':>8} |")
+    print(f"|{'-' * 34}|{'-' * 16}|{'-' * 12}|{'-' * 12}|{'-' * 10}|")
+    for config, metric, base, new in regressions:
+        change = f"{(new / base - 1) * 100:>+7.1f}%" if metric != "error" else f"{'fails':>8}"
+        print(f"| {config:<32} | {metric:<14} | {base:>10.2f} | {new:>10.2f} | {change} |")
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -16,11 +16,23 @@ def parse_args_knn() -> argparse.Namespace:
     parser.add_argument("--pretrained_checkpoint_dir", type=str)
     parser.add_argument("--batch_size", type=int, default=16)
     parser.add_argument("--num_workers", type=int, default=10)
+    # directory to cache extracted features, disabled if not set
+    parser.add_argument("--feature_store_dir", type=str, default=None)
+
+    # inference device, cpu threads and bf16 autocast
+    parser.add_argument("--device", type=str, default="cuda")
+    parser.add_argument("--num_threads", type=int, default=None)
+    parser.add_argument("--bf16", action="store_true")
     parser.add_argument("--k", type=int, nargs="+")
     parser.add_argument("--temperature", type=float, nargs="+")
     parser.add_argument("--distance_function", type=str, nargs="+")
     parser.add_argument("--feature_type", type=str, nargs="+")
 
+    # evaluate all checkpoints of the directory, sharing data loading between them
+    parser.add_argument("--all_checkpoints", action="store_true")
+    parser.add_argument("--checkpoint_frequency", type=int, default=1)
+    parser.add_argument("--checkpoints_per_pass", type=int, default=4)
+
     # add shared arguments
     dataset_args(parser)
     custom_dataset_args(parser)
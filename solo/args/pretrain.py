@@ -4,7 +4,9 @@ import omegaconf
 from omegaconf import OmegaConf
 from solo.utils.auto_resumer import AutoResumer
 from solo.utils.checkpointer import Checkpointer
+from solo.utils.comm_stats import CommStatsCallback
 from solo.utils.misc import omegaconf_select
+from solo.utils.profiler import StepProfilerCallback
 
 try:
     from solo.data.dali_dataloader import PretrainDALIDataModule
@@ -106,6 +108,12 @@ def parse_cfg(cfg: omegaconf.DictConfig):
     # default values for auto_resume
     cfg = AutoResumer.add_and_assert_specific_cfg(cfg)
 
+    # default values for communication statistics
+    cfg = CommStatsCallback.add_and_assert_specific_cfg(cfg)
+
+    # default values for the step profiler
+    cfg = StepProfilerCallback.add_and_assert_specific_cfg(cfg)
+
     # default values for dali
     if _dali_available:
         cfg = PretrainDALIDataModule.add_and_assert_specific_cfg(cfg)
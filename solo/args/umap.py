@@ -16,6 +16,13 @@ def parse_args_umap() -> argparse.Namespace:
     parser.add_argument("--pretrained_checkpoint_dir", type=str)
     parser.add_argument("--batch_size", type=int, default=16)
     parser.add_argument("--num_workers", type=int, default=10)
+    # directory to cache extracted features, disabled if not set
+    parser.add_argument("--feature_store_dir", type=str, default=None)
+
+    # inference device, cpu threads and bf16 autocast
+    parser.add_argument("--device", type=str, default="cuda")
+    parser.add_argument("--num_threads", type=int, default=None)
+    parser.add_argument("--bf16", action="store_true")
 
     # add shared arguments
     dataset_args(parser)
@@ -17,44 +17,53 @@
 # OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 # DEALINGS IN THE SOFTWARE.
 
-import torch
+from typing import Optional
 
-import torch.distributed as dist
+import torch
+import torch.nn.functional as F
+from solo.utils.misc import matmul_sq_norm_and_diag
 
 
 def barlow_loss_func(
-    z1: torch.Tensor, z2: torch.Tensor, lamb: float = 5e-3, scale_loss: float = 0.025
+    z1: torch.Tensor,
+    z2: torch.Tensor,
+    lamb: float = 5e-3,
+    scale_loss: float = 0.025,
+    chunk_size: Optional[int] = None,
 ) -> torch.Tensor:
     """Computes Barlow Twins' loss given batch of projected features z1 from view 1 and
     projected features z2 from view 2.
 
+    The off-diagonal term is the squared Frobenius norm of the cross-correlation matrix minus its
+    squared diagonal, so no identity matrix or mask is built, and the DxD matrix itself is only
+    materialized when N >= D (see matmul_sq_norm_and_diag).
+
     Args:
         z1 (torch.Tensor): NxD Tensor containing projected features from view 1.
         z2 (torch.Tensor): NxD Tensor containing projected features from view 2.
         lamb (float, optional): off-diagonal scaling factor for the cross-covariance matrix.
             Defaults to 5e-3.
         scale_loss (float, optional): final scaling factor of the loss. Defaults to 0.025.
+        chunk_size (Optional[int], optional): number of columns of the cross-correlation matrix
+            computed at once. Defaults to None.
 
     Returns:
         torch.Tensor: Barlow Twins' loss.
     """
 
-    N, D = z1.size()
-
-    # to match the original code
-    bn = torch.nn.BatchNorm1d(D, affine=False).to(z1.device)
-    z1 = bn(z1)
-    z2 = bn(z2)
+    N = z1.size(0)
 
-    corr = torch.einsum("bi, bj -> ij", z1, z2) / N
+    # to match the original code, which normalizes with a BatchNorm1d without affine parameters
+    z1 = F.batch_norm(z1, None, None, training=True)
+    z2 = F.batch_norm(z2, None, None, training=True)
 
-    if dist.is_available() and dist.is_initialized():
-        dist.all_reduce(corr)
-        world_size = dist.get_world_size()
-        corr /= world_size
+    sq_norm, diag = matmul_sq_norm_and_diag(
+        z1, z2, chunk_size=chunk_size, average_across_processes=True
+    )
+    sq_norm = sq_norm / N**2
+    diag = diag / N
 
-    diag = torch.eye(D, device=corr.device)
-    cdif = (corr - diag).pow(2)
-    cdif[~diag.bool()] *= lamb
-    loss = scale_loss * cdif.sum()
+    on_diag = (diag - 1).pow(2).sum()
+    off_diag = sq_norm - diag.pow(2).sum()
+    loss = scale_loss * (on_diag + lamb * off_diag)
     return loss
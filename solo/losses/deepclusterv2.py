@@ -37,9 +37,12 @@ def deepclusterv2_loss_func(
     Returns:
         torch.Tensor: DeepClusterV2 loss.
     """
-    loss = 0
-    for h in range(outputs.size(0)):
-        scores = outputs[h].view(-1, outputs.size(-1)) / temperature
-        targets = assignments[h].repeat(outputs.size(1)).to(outputs.device, non_blocking=True)
-        loss += F.cross_entropy(scores, targets, ignore_index=-1)
-    return loss / outputs.size(0)
+
+    num_heads, num_views = outputs.size(0), outputs.size(1)
+    scores = outputs.reshape(num_heads, -1, outputs.size(-1)) / temperature
+    targets = assignments.repeat(1, num_views).to(outputs.device, non_blocking=True)
+
+    # cross-entropy of all heads at once, averaged per head over the non-ignored samples
+    loss = F.cross_entropy(scores.transpose(1, 2), targets, ignore_index=-1, reduction="none")
+    valid = targets != -1
+    return ((loss * valid).sum(dim=1) / valid.sum(dim=1)).mean()
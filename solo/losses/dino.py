@@ -78,25 +78,25 @@ class DINOLoss(nn.Module):
             torch.Tensor: DINO loss.
         """
 
+        # log-softmax of each student view is computed only once
         student_out = student_output / self.student_temp
-        student_out = student_out.chunk(self.num_large_crops)
+        student_out = student_out.view(self.num_large_crops, -1, student_out.size(-1))
+        student_out = F.log_softmax(student_out, dim=-1)
 
         # teacher centering and sharpening
         temp = self.teacher_temp_schedule[self.epoch]
         teacher_out = F.softmax((teacher_output - self.center) / temp, dim=-1)
-        teacher_out = teacher_out.detach().chunk(2)
-
-        total_loss = 0
-        n_loss_terms = 0
-        for iq, q in enumerate(teacher_out):
-            for iv, v in enumerate(student_out):
-                if iv == iq:
-                    # we skip cases where student and teacher operate on the same view
-                    continue
-                loss = torch.sum(-q * F.log_softmax(v, dim=-1), dim=-1)
-                total_loss += loss.mean()
-                n_loss_terms += 1
-        total_loss /= n_loss_terms
+        teacher_out = teacher_out.detach().view(2, -1, teacher_out.size(-1))
+
+        # cross-entropy of all (teacher, student) pairs, computed in full precision as the sum
+        # runs over all samples and prototypes
+        with torch.autocast(device_type=student_out.device.type, enabled=False):
+            losses = -torch.einsum("tnc, snc -> ts", teacher_out.to(student_out.dtype), student_out)
+        losses = losses / student_out.size(1)
+
+        # we skip cases where student and teacher operate on the same view
+        mask = ~torch.eye(*losses.size(), dtype=torch.bool, device=losses.device)
+        total_loss = losses[mask].mean()
         self.update_center(teacher_output)
         return total_loss
 
@@ -20,7 +20,7 @@
 import torch
 import torch.distributed as dist
 import torch.nn.functional as F
-from solo.utils.misc import concat_all_gather_no_grad
+from solo.utils.misc import gathered_matmul
 
 
 def mocov3_loss_func(query: torch.Tensor, key: torch.Tensor, temperature=0.2) -> torch.Tensor:
@@ -39,15 +39,17 @@ def mocov3_loss_func(query: torch.Tensor, key: torch.Tensor, temperature=0.2) ->
 
     n = query.size(0)
     device = query.device
-    rank = dist.get_rank() if dist.is_available() and dist.is_initialized() else 0
+    distributed = dist.is_available() and dist.is_initialized()
+    rank = dist.get_rank() if distributed else 0
 
     query = F.normalize(query, dim=1)
     key = F.normalize(key, dim=1)
 
-    # gather all targets without gradients
-    key = concat_all_gather_no_grad(key)
-
-    logits = torch.einsum("nc,mc->nm", [query, key]) / temperature
+    # gather all targets without gradients, computing the local logits in the meantime.
+    # As with a plain all_gather, the keys only receive gradients in a single process
+    if distributed:
+        key = key.detach()
+    logits = gathered_matmul(query, key) / temperature
     labels = torch.arange(n, dtype=torch.long, device=device) + n * rank
 
     return F.cross_entropy(logits, labels) * (2 * temperature)
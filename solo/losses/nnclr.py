@@ -19,7 +19,7 @@
 
 import torch
 import torch.nn.functional as F
-from solo.utils.misc import gather, get_rank
+from solo.utils.misc import gathered_matmul, get_rank
 
 
 def nnclr_loss_func(nn: torch.Tensor, p: torch.Tensor, temperature: float = 0.1) -> torch.Tensor:
@@ -40,9 +40,8 @@ def nnclr_loss_func(nn: torch.Tensor, p: torch.Tensor, temperature: float = 0.1)
     p = F.normalize(p, dim=-1)
     # to be consistent with simclr, we now gather p
     # this might result in suboptimal results given previous parameters.
-    p = gather(p)
-
-    logits = nn @ p.T / temperature
+    # the similarities with the local p are computed while p is being gathered
+    logits = gathered_matmul(nn, p) / temperature
 
     rank = get_rank()
     n = nn.size(0)
@@ -17,43 +17,162 @@
 # OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 # DEALINGS IN THE SOFTWARE.
 
+from typing import Optional, Tuple
+
 import torch
 import torch.nn.functional as F
-from solo.utils.misc import gather, get_rank
+from solo.utils.misc import gather_async, gathered_matmul, get_rank
+from torch.utils.checkpoint import checkpoint
+
+
+def _positive_pairs(
+    indexes: torch.Tensor, sorted_indexes: torch.Tensor, order: torch.Tensor
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    """Finds the positives of each row, i.e., the columns with the same index, by binary search
+    over the sorted indexes of all columns instead of comparing every row with every column.
+
+    Args:
+        indexes (torch.Tensor): identifiers of the samples of the rows.
+        sorted_indexes (torch.Tensor): sorted identifiers of all samples of all processes.
+        order (torch.Tensor): column of each element of sorted_indexes.
+
+    Returns:
+        Tuple[torch.Tensor, torch.Tensor]: row and column of each positive pair.
+    """
+
+    first = torch.searchsorted(sorted_indexes, indexes)
+    counts = torch.searchsorted(sorted_indexes, indexes, right=True) - first
+    rows = torch.repeat_interleave(torch.arange(indexes.size(0), device=indexes.device), counts)
+    # position of each pair among the positives of its row
+    rank = torch.arange(rows.size(0), device=rows.device) - (counts.cumsum(0) - counts)[rows]
+    return rows, order[first[rows] + rank]
+
+
+def _simclr_logits_loss(
+    logits: torch.Tensor,
+    indexes: torch.Tensor,
+    sorted_indexes: torch.Tensor,
+    order: torch.Tensor,
+    offset: int,
+    temperature: float,
+) -> torch.Tensor:
+    """Computes the per-sample SimCLR loss of a chunk of rows in log space.
+
+    Args:
+        logits (torch.Tensor): similarities of the chunk with all samples of all processes.
+        indexes (torch.Tensor): identifiers of the samples of the chunk.
+        sorted_indexes (torch.Tensor): sorted identifiers of all samples of all processes.
+        order (torch.Tensor): column of each element of sorted_indexes.
+        offset (int): column of logits corresponding to the first row of the chunk.
+        temperature (float): temperature of the softmax.
+
+    Returns:
+        torch.Tensor: loss of each sample of the chunk.
+    """
+
+    # half precision similarities are upcast so that the softmax is computed in fp32
+    if logits.element_size() < 4:
+        logits = logits.float()
+    logits = logits / temperature
+
+    # remove the similarity of each sample with itself
+    rows = torch.arange(logits.size(0), device=logits.device)
+    logits[rows, rows + offset] = float("-inf")
+
+    # positives share the same index, all other samples are negatives
+    pos_rows, pos_cols = _positive_pairs(indexes, sorted_indexes, order)
+    pos_logits = logits[pos_rows, pos_cols]
+
+    # logsumexp of the positives of each row, shifted by their maximum for stability
+    max_pos = torch.full_like(rows, float("-inf"), dtype=logits.dtype)
+    max_pos = max_pos.scatter_reduce(0, pos_rows, pos_logits.detach(), "amax")
+    max_pos = max_pos.masked_fill(max_pos.isinf(), 0)
+    exp_pos = (pos_logits - max_pos[pos_rows]).exp()
+    log_pos = torch.zeros_like(max_pos).index_add(0, pos_rows, exp_pos).log() + max_pos
+
+    log_all = torch.logsumexp(logits, dim=1)
+    return log_all - log_pos
+
+
+def _simclr_chunk_loss(
+    z: torch.Tensor,
+    gathered_z: torch.Tensor,
+    indexes: torch.Tensor,
+    sorted_indexes: torch.Tensor,
+    order: torch.Tensor,
+    offset: int,
+    temperature: float,
+) -> torch.Tensor:
+    """Computes the per-sample SimCLR loss of a chunk of rows in log space.
+
+    Args:
+        z (torch.Tensor): normalized features of the chunk.
+        gathered_z (torch.Tensor): normalized features of all samples of all processes.
+        indexes (torch.Tensor): identifiers of the samples of the chunk.
+        sorted_indexes (torch.Tensor): sorted identifiers of all samples of all processes.
+        order (torch.Tensor): column of each element of sorted_indexes.
+        offset (int): column of gathered_z corresponding to the first row of the chunk.
+        temperature (float): temperature of the softmax.
+
+    Returns:
+        torch.Tensor: loss of each sample of the chunk.
+    """
+
+    logits = torch.einsum("if, jf -> ij", z, gathered_z)
+    return _simclr_logits_loss(logits, indexes, sorted_indexes, order, offset, temperature)
 
 
 def simclr_loss_func(
-    z: torch.Tensor, indexes: torch.Tensor, temperature: float = 0.1
+    z: torch.Tensor,
+    indexes: torch.Tensor,
+    temperature: float = 0.1,
+    chunk_size: Optional[int] = None,
 ) -> torch.Tensor:
     """Computes SimCLR's loss given batch of projected features z
     from different views, a positive boolean mask of all positives and
     a negative boolean mask of all negatives.
 
+    The loss is computed in log space with logsumexp, so it does not overflow in half precision,
+    and the positives of each row are selected by index, without a rows x columns mask. If
+    chunk_size is set, rows are processed in chunks whose similarities are recomputed in the
+    backward pass, so at most chunk_size x (N*views*world_size) similarities are alive at once.
+
+    The features and indexes are gathered asynchronously. Without chunking, the similarities
+    between local samples are computed while the gather is in flight.
+
     Args:
         z (torch.Tensor): (N*views) x D Tensor containing projected features from the views.
         indexes (torch.Tensor): unique identifiers for each crop (unsupervised)
             or targets of each crop (supervised).
+        temperature (float, optional): temperature of the softmax. Defaults to 0.1.
+        chunk_size (Optional[int], optional): number of rows processed at once.
+            Defaults to None (all rows at once).
 
     Return:
         torch.Tensor: SimCLR loss.
     """
 
     z = F.normalize(z, dim=-1)
-    gathered_z = gather(z)
-
-    sim = torch.exp(torch.einsum("if, jf -> ij", z, gathered_z) / temperature)
+    z_handle = gather_async(z)
+    indexes_handle = gather_async(indexes)
+    offset = z.size(0) * get_rank()
 
-    gathered_indexes = gather(indexes)
+    if chunk_size is None or chunk_size >= z.size(0):
+        logits = gathered_matmul(z, z, z_handle)
+        sorted_indexes, order = indexes_handle.wait().sort()
+        losses = _simclr_logits_loss(logits, indexes, sorted_indexes, order, offset, temperature)
+        return losses.mean()
 
-    indexes = indexes.unsqueeze(0)
-    gathered_indexes = gathered_indexes.unsqueeze(0)
-    # positives
-    pos_mask = indexes.t() == gathered_indexes
-    pos_mask[:, z.size(0) * get_rank() :].fill_diagonal_(0)
-    # negatives
-    neg_mask = indexes.t() != gathered_indexes
+    gathered_z = z_handle.wait()
+    sorted_indexes, order = indexes_handle.wait().sort()
 
-    pos = torch.sum(sim * pos_mask, 1)
-    neg = torch.sum(sim * neg_mask, 1)
-    loss = -(torch.mean(torch.log(pos / (pos + neg))))
-    return loss
+    losses = []
+    for start in range(0, z.size(0), chunk_size):
+        end = start + chunk_size
+        args = (z[start:end], gathered_z, indexes[start:end], sorted_indexes, order)
+        args = args + (offset + start, temperature)
+        if torch.is_grad_enabled():
+            losses.append(checkpoint(_simclr_chunk_loss, *args, use_reentrant=False))
+        else:
+            losses.append(_simclr_chunk_loss(*args))
+    return torch.cat(losses).mean()
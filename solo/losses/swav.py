@@ -19,7 +19,6 @@
 
 from typing import List
 
-import numpy as np
 import torch
 
 
@@ -29,6 +28,10 @@ def swav_loss_func(
     """Computes SwAV's loss given list of batch predictions from multiple views
     and a list of cluster assignments from the same multiple views.
 
+    The log-softmax of each view is computed once and the cross-entropies of all pairs of
+    (assignment, prediction) views are evaluated with a single einsum, masking pairs of the same
+    view.
+
     Args:
         preds (torch.Tensor): list of NxC Tensors containing nearest neighbors' features from
             view 1.
@@ -39,10 +42,12 @@ def swav_loss_func(
         torch.Tensor: SwAV loss.
     """
 
-    losses = []
-    for v1, a in enumerate(assignments):
-        for v2 in np.delete(np.arange(len(preds)), v1):
-            p = preds[v2] / temperature
-            loss = -torch.mean(torch.sum(a * torch.log_softmax(p, dim=1), dim=1))
-            losses.append(loss)
-    return sum(losses) / len(losses)
+    log_p = torch.log_softmax(torch.stack(list(preds)) / temperature, dim=-1)
+    a = torch.stack(list(assignments)).to(log_p.dtype)
+
+    # computed in full precision as the sum runs over all samples and prototypes
+    with torch.autocast(device_type=log_p.device.type, enabled=False):
+        losses = -torch.einsum("anc, pnc -> ap", a, log_p) / log_p.size(1)
+
+    mask = ~torch.eye(*losses.size(), dtype=torch.bool, device=losses.device)
+    return losses[mask].mean()
@@ -20,7 +20,7 @@
 import torch
 import torch.nn.functional as F
 from solo.losses.vicreg import invariance_loss, variance_loss
-from solo.utils.misc import gather
+from solo.utils.misc import gather_async
 
 
 def covariance_loss(z1: torch.Tensor, z2: torch.Tensor) -> torch.Tensor:
@@ -68,10 +68,14 @@ def vibcreg_loss_func(
         torch.Tensor: VIbCReg loss.
     """
 
-    sim_loss = invariance_loss(z1, z2)
     # vicreg's official coded gathers the tensors here, so it's likely to benefit vibcreg
     # https://github.com/facebookresearch/vicreg/blob/main/main_vicreg.py
-    z1, z2 = gather(z1), gather(z2)
+    # the gather runs while the local invariance loss is computed
+    z1_handle, z2_handle = gather_async(z1), gather_async(z2)
+
+    sim_loss = invariance_loss(z1, z2)
+
+    z1, z2 = z1_handle.wait(), z2_handle.wait()
 
     var_loss = variance_loss(z1, z2)
     cov_loss = covariance_loss(z1, z2)
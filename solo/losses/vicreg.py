@@ -17,9 +17,11 @@
 # OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 # DEALINGS IN THE SOFTWARE.
 
+from typing import Optional
+
 import torch
 import torch.nn.functional as F
-from solo.utils.misc import gather
+from solo.utils.misc import gather_async, matmul_sq_norm_and_diag
 
 
 def invariance_loss(z1: torch.Tensor, z2: torch.Tensor) -> torch.Tensor:
@@ -56,13 +58,21 @@ def variance_loss(z1: torch.Tensor, z2: torch.Tensor) -> torch.Tensor:
     return std_loss
 
 
-def covariance_loss(z1: torch.Tensor, z2: torch.Tensor) -> torch.Tensor:
+def covariance_loss(
+    z1: torch.Tensor, z2: torch.Tensor, chunk_size: Optional[int] = None
+) -> torch.Tensor:
     """Computes covariance loss given batch of projected features z1 from view 1 and
     projected features z2 from view 2.
 
+    The sum of the squared off-diagonal covariances is the squared Frobenius norm of the
+    covariance matrix minus its squared diagonal, so no identity matrix or mask is built, and the
+    DxD matrix itself is only materialized when N >= D (see matmul_sq_norm_and_diag).
+
     Args:
         z1 (torch.Tensor): NxD Tensor containing projected features from view 1.
         z2 (torch.Tensor): NxD Tensor containing projected features from view 2.
+        chunk_size (Optional[int], optional): number of columns of the covariance matrices
+            computed at once. Defaults to None.
 
     Returns:
         torch.Tensor: covariance regularization loss.
@@ -70,13 +80,11 @@ def covariance_loss(z1: torch.Tensor, z2: torch.Tensor) -> torch.Tensor:
 
     N, D = z1.size()
 
-    z1 = z1 - z1.mean(dim=0)
-    z2 = z2 - z2.mean(dim=0)
-    cov_z1 = (z1.T @ z1) / (N - 1)
-    cov_z2 = (z2.T @ z2) / (N - 1)
-
-    diag = torch.eye(D, device=z1.device)
-    cov_loss = cov_z1[~diag.bool()].pow_(2).sum() / D + cov_z2[~diag.bool()].pow_(2).sum() / D
+    cov_loss = 0
+    for z in (z1, z2):
+        z = z - z.mean(dim=0)
+        sq_norm, diag = matmul_sq_norm_and_diag(z, z, chunk_size=chunk_size)
+        cov_loss = cov_loss + (sq_norm - diag.pow(2).sum()) / (N - 1) ** 2 / D
     return cov_loss
 
 
@@ -86,6 +94,7 @@ def vicreg_loss_func(
     sim_loss_weight: float = 25.0,
     var_loss_weight: float = 25.0,
     cov_loss_weight: float = 1.0,
+    chunk_size: Optional[int] = None,
 ) -> torch.Tensor:
     """Computes VICReg's loss given batch of projected features z1 from view 1 and
     projected features z2 from view 2.
@@ -96,19 +105,24 @@ def vicreg_loss_func(
         sim_loss_weight (float): invariance loss weight.
         var_loss_weight (float): variance loss weight.
         cov_loss_weight (float): covariance loss weight.
+        chunk_size (Optional[int]): number of columns of the covariance matrices computed at
+            once. Defaults to None.
 
     Returns:
         torch.Tensor: VICReg loss.
     """
 
-    sim_loss = invariance_loss(z1, z2)
-
     # vicreg's official code gathers the tensors here
     # https://github.com/facebookresearch/vicreg/blob/main/main_vicreg.py
-    z1, z2 = gather(z1), gather(z2)
+    # the gather runs while the local invariance loss is computed
+    z1_handle, z2_handle = gather_async(z1), gather_async(z2)
+
+    sim_loss = invariance_loss(z1, z2)
+
+    z1, z2 = z1_handle.wait(), z2_handle.wait()
 
     var_loss = variance_loss(z1, z2)
-    cov_loss = covariance_loss(z1, z2)
+    cov_loss = covariance_loss(z1, z2, chunk_size=chunk_size)
 
     loss = sim_loss_weight * sim_loss + var_loss_weight * var_loss + cov_loss_weight * cov_loss
     return loss
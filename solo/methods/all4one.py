@@ -26,14 +26,13 @@ import torch.nn as nn
 import torch.nn.functional as F
 from solo.losses.nnclr import nnclr_loss_func
 from solo.methods.base import BaseMomentumMethod
+from solo.utils.feature_queue import QUEUE_DTYPES, FeatureQueue
 from solo.utils.misc import gather, omegaconf_select
 from solo.utils.momentum import initialize_momentum_params
 from solo.utils.positional_encodings import PositionalEncodingPermute1D, Summer
 
 
 class All4One(BaseMomentumMethod):
-    queue: torch.Tensor
-
     def __init__(self, cfg: omegaconf.DictConfig):
         super().__init__(cfg)
 
@@ -99,13 +98,16 @@ class All4One(BaseMomentumMethod):
         # positional encoder
         self.pos_enc = Summer(PositionalEncodingPermute1D(5))
 
-        # queue
-        self.register_buffer("queue", torch.randn(self.queue_size, proj_output_dim))
-        self.register_buffer("queue_y", -torch.ones(self.queue_size, dtype=torch.long))
-        self.queue = F.normalize(self.queue, dim=1)
-        self.register_buffer("queue_ptr", torch.zeros(1, dtype=torch.long))
-        # NN index queue
-        self.register_buffer("queue_index", -torch.ones(self.queue_size, dtype=torch.long))
+        # queue with labels and NN indexes
+        self.queue = FeatureQueue(
+            self.queue_size,
+            proj_output_dim,
+            dtype=QUEUE_DTYPES[cfg.method_kwargs.queue_dtype],
+            extra_fields=("y", "index"),
+        )
+
+        # loss (optionally compiled)
+        self.nnclr_loss_func = self.compile_loss(nnclr_loss_func)
 
     @staticmethod
     def add_and_assert_specific_cfg(cfg: omegaconf.DictConfig) -> omegaconf.DictConfig:
@@ -126,6 +128,10 @@ class All4One(BaseMomentumMethod):
         assert not omegaconf.OmegaConf.is_missing(cfg, "method_kwargs.temperature")
 
         cfg.method_kwargs.queue_size = omegaconf_select(cfg, "method_kwargs.queue_size", 65536)
+        cfg.method_kwargs.queue_dtype = omegaconf_select(
+            cfg, "method_kwargs.queue_dtype", "float32"
+        )
+        assert cfg.method_kwargs.queue_dtype in QUEUE_DTYPES
 
         return cfg
 
@@ -171,20 +177,7 @@ class All4One(BaseMomentumMethod):
         y = gather(y)
         idx = gather(idx)
 
-        batch_size = z.shape[0]
-
-        ptr = int(self.queue_ptr)  # type: ignore
-        assert self.queue_size % batch_size == 0
-
-        self.queue[ptr : ptr + batch_size, :] = z
-        self.queue_y[ptr : ptr + batch_size] = y  # type: ignore
-
-        # NN indexes
-        self.queue_index[ptr : ptr + batch_size] = idx
-
-        ptr = (ptr + batch_size) % self.queue_size
-
-        self.queue_ptr[0] = ptr  # type: ignore
+        self.queue.enqueue(z, y=y, index=idx)
 
     @torch.no_grad()
     def find_nn(self, z: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
@@ -204,15 +197,9 @@ class All4One(BaseMomentumMethod):
                 NN labels.
         """
 
-        idxx = (z @ self.queue.T).max(dim=1)[1]
-
-        _, idx = (z @ self.queue.T).topk(5, dim=1)
-
-        nn = self.queue[idx]
-        nn_idx = self.queue_index[idx]
-        nn_lb = self.queue_y[idx]
-
-        return idxx, nn, nn_idx, nn_lb
+        # a single chunked top-5 search, the first neighbor is the top-1
+        out = self.queue.find_nn(z, k=5)
+        return out["indices"][:, 0], out["neighbors"], out["index"], out["y"]
 
     @torch.no_grad()
     def momentum_forward(self, X: torch.Tensor) -> Dict:
@@ -355,13 +342,13 @@ class All4One(BaseMomentumMethod):
 
         # ------- contrastive loss -------
         att_nnclr_loss = (
-            nnclr_loss_func(rich_emb1, strange_emb2) / 2
-            + nnclr_loss_func(rich_emb2, strange_emb1) / 2
+            self.nnclr_loss_func(rich_emb1, strange_emb2) / 2
+            + self.nnclr_loss_func(rich_emb2, strange_emb1) / 2
         )
 
         nnclr_loss = (
-            nnclr_loss_func(nn1[:, 0, :], p2, temperature=self.temperature) / 2
-            + nnclr_loss_func(nn2[:, 0, :], p1, temperature=self.temperature) / 2
+            self.nnclr_loss_func(nn1[:, 0, :], p2, temperature=self.temperature) / 2
+            + self.nnclr_loss_func(nn2[:, 0, :], p1, temperature=self.temperature) / 2
         )
 
         feature_loss = (0.5 * on_diag_feat + 0.5 * off_diag_feat) * 10
@@ -370,7 +357,7 @@ class All4One(BaseMomentumMethod):
 
         final_losss = 0.5 * att_nnclr_loss + 0.5 * nnclr_loss + 0.5 * feature_loss
 
-        nn_acc = (targets == self.queue_y[idx1]).sum() / b
+        nn_acc = (targets == self.queue.y[idx1]).sum() / b
 
         self.dequeue_and_enqueue(momentum_z1, targets, img_indexes)
 
@@ -17,7 +17,7 @@
 # OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 # DEALINGS IN THE SOFTWARE.
 
-from typing import Any, List, Sequence
+from typing import Any, List, Optional, Sequence
 
 import omegaconf
 import torch
@@ -37,12 +37,16 @@ class BarlowTwins(BaseMethod):
                 proj_output_dim (int): number of dimensions of projected features.
                 lamb (float): off-diagonal scaling factor for the cross-covariance matrix.
                 scale_loss (float): scaling factor of the loss.
+                loss_chunk_size (Optional[int]): number of columns of the DxD matrix of the loss
+                    computed at once. Chunks are recomputed in the backward pass, trading compute
+                    for memory. Defaults to None.
         """
 
         super().__init__(cfg)
 
         self.lamb: float = cfg.method_kwargs.lamb
         self.scale_loss: float = cfg.method_kwargs.scale_loss
+        self.loss_chunk_size: Optional[int] = cfg.method_kwargs.loss_chunk_size
 
         proj_hidden_dim: int = cfg.method_kwargs.proj_hidden_dim
         proj_output_dim: int = cfg.method_kwargs.proj_output_dim
@@ -58,6 +62,9 @@ class BarlowTwins(BaseMethod):
             nn.Linear(proj_hidden_dim, proj_output_dim),
         )
 
+        # loss (optionally compiled)
+        self.barlow_loss_func = self.compile_loss(barlow_loss_func)
+
     @staticmethod
     def add_and_assert_specific_cfg(cfg: omegaconf.DictConfig) -> omegaconf.DictConfig:
         """Adds method specific default values/checks for config.
@@ -77,6 +84,11 @@ class BarlowTwins(BaseMethod):
         cfg.method_kwargs.lamb = omegaconf_select(cfg, "method_kwargs.lamb", 0.0051)
         cfg.method_kwargs.scale_loss = omegaconf_select(cfg, "method_kwargs.scale_loss", 0.024)
 
+        cfg.method_kwargs.loss_chunk_size = omegaconf_select(
+            cfg, "method_kwargs.loss_chunk_size", None
+        )
+        assert cfg.method_kwargs.loss_chunk_size is None or cfg.method_kwargs.loss_chunk_size > 0
+
         return cfg
 
     @property
@@ -122,7 +134,13 @@ class BarlowTwins(BaseMethod):
         z1, z2 = out["z"]
 
         # ------- barlow twins loss -------
-        barlow_loss = barlow_loss_func(z1, z2, lamb=self.lamb, scale_loss=self.scale_loss)
+        barlow_loss = self.barlow_loss_func(
+            z1,
+            z2,
+            lamb=self.lamb,
+            scale_loss=self.scale_loss,
+            chunk_size=self.loss_chunk_size,
+        )
 
         self.log("train_barlow_loss", barlow_loss, on_epoch=True, sync_dist=True)
 
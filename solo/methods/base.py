@@ -18,8 +18,9 @@
 # DEALINGS IN THE SOFTWARE.
 
 import logging
+from contextlib import nullcontext
 from functools import partial
-from typing import Any, Callable, Dict, List, Sequence, Tuple, Union
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
 
 import lightning.pytorch as pl
 import omegaconf
@@ -51,12 +52,35 @@ from solo.backbones import (
     wide_resnet28w2,
     wide_resnet28w8,
 )
+from solo.utils.compiler import (
+    COMPILE_MODES,
+    CompiledFunction,
+    compile_module,
+    compile_report,
+)
+from solo.utils.feature_queue import FeatureQueue
+from solo.utils.grad_cache import (
+    RandContext,
+    detach_outputs,
+    flatten_tensors,
+    merge_outputs,
+    split_batch,
+)
 from solo.utils.knn import WeightedKNNClassifier
 from solo.utils.lars import LARS
 from solo.utils.lr_scheduler import LinearWarmupCosineAnnealingLR
 from solo.utils.metrics import accuracy_at_k, weighted_mean
-from solo.utils.misc import omegaconf_select, remove_bias_and_norm_from_weight_decay
+from solo.utils.misc import (
+    enable_grad_checkpointing,
+    get_world_size,
+    omegaconf_select,
+    per_chunk_batch_norm,
+    pop_exposed_gather_time,
+    preserve_batch_norm_stats,
+    remove_bias_and_norm_from_weight_decay,
+)
 from solo.utils.momentum import MomentumUpdater, initialize_momentum_params
+from solo.utils.profiler import profile_region
 
 
 def static_lr(
@@ -107,6 +131,18 @@ class BaseMethod(pl.LightningModule):
         "exponential",
         "none",
     ]
+    # methods that compute their loss between cached_forward and cached_backward
+    supports_grad_cache = False
+    # batch dimension of forward outputs that are not batch-first, used to split grouped crops.
+    # Outputs without a batch dimension are marked with NO_BATCH_DIM and repeated for each crop
+    NO_BATCH_DIM = None
+    _OUTPUT_BATCH_DIMS: Dict[str, Optional[int]] = {
+        "loss": NO_BATCH_DIM,
+        "acc1": NO_BATCH_DIM,
+        "acc5": NO_BATCH_DIM,
+    }
+    # heads compiled with performance.compile.heads, if the method has them
+    _COMPILE_HEADS = ["projector", "predictor", "momentum_projector"]
 
     def __init__(self, cfg: omegaconf.DictConfig):
         """Base model that implements all basic operations for all self-supervised methods.
@@ -120,6 +156,13 @@ class BaseMethod(pl.LightningModule):
             backbone:
                 name (str): architecture of the base backbone.
                 kwargs (dict): extra backbone kwargs.
+                grad_checkpointing:
+                    enabled (bool): recomputes the activations of the backbone during backward
+                        instead of storing them, at the granularity of blocks (ViT, Swin and
+                        PoolFormer) or stages (ResNet, WideResNet and ConvNeXt).
+                        Defaults to False.
+                    fraction (float): fraction of the blocks/stages that are checkpointed,
+                        starting from the input. Defaults to 1.0.
             data:
                 dataset (str): name of the dataset.
                 num_classes (int): number of classes.
@@ -153,7 +196,34 @@ class BaseMethod(pl.LightningModule):
                 disable_channel_last (bool). Disables channel last conversion operation which
                 speeds up training considerably. Defaults to False.
                 https://pytorch.org/tutorials/intermediate/memory_format_tutorial.html#converting-existing-models
+                group_crops (bool): concatenates all crops with the same resolution and forwards
+                    them at once, instead of forwarding each crop separately. Defaults to False.
+                group_crops_bn (str): batch normalization statistics of grouped crops, either
+                    "per_crop" (each crop is normalized with its own statistics, as when crops
+                    are forwarded separately) or "shared" (statistics of the whole group).
+                    Defaults to "per_crop".
+                compile:
+                    enabled (bool): compiles the backbone, heads and loss with torch.compile.
+                        Each of them falls back to eager mode if its compilation fails.
+                        Defaults to False.
+                    mode (str): torch.compile mode. Defaults to "default".
+                    backend (str): torch.compile backend. Defaults to "inductor".
+                    dynamic (Optional[bool]): compiles with dynamic shapes. If None, a static
+                        graph is compiled first and recompiled with dynamic shapes when the
+                        input shapes change (e.g. small crops). False compiles one static graph
+                        per resolution. Defaults to None.
+                    backbone (bool): compiles the backbone (and momentum backbone).
+                        Defaults to True.
+                    heads (bool): compiles the projector/predictor heads. Defaults to True.
+                    losses (bool): compiles the loss functions. Defaults to True.
             accumulate_grad_batches (Union[int, None]): number of batches for gradient accumulation.
+            grad_cache:
+                enabled (bool): trains with gradient caching, i.e., embeddings of the full batch
+                    are computed without graph in sub-batches, the loss and its gradients w.r.t.
+                    the embeddings are computed on the full batch and each sub-batch is then
+                    forwarded again to backpropagate the cached gradients. Only available for
+                    methods that support it. Defaults to False.
+                sub_batch_size (int): number of samples forwarded at once. Defaults to 64.
             num_large_crops (int): number of big crops.
             num_small_crops (int): number of small crops .
 
@@ -167,6 +237,14 @@ class BaseMethod(pl.LightningModule):
             The learning rate (base, min and warmup) is automatically scaled linearly
             if using gradient accumulation.
 
+        .. note::
+            With gradient caching, the loss is computed over the full batch, while the peak
+            activation memory scales with the sub-batch size. Each sub-batch is forwarded twice
+            with the same random state. The loss and gradients are those of the full batch only
+            for models without batch statistics: batch normalization layers normalize each
+            sub-batch with its own statistics, and their running statistics are updated once
+            per sub-batch.
+
         .. note::
             For CIFAR10/100, the first convolutional and maxpooling layers of the ResNet backbone
             are slightly adjusted to handle lower resolution images (32x32 instead of 224x224).
@@ -203,6 +281,8 @@ class BaseMethod(pl.LightningModule):
                 self.backbone.maxpool = nn.Identity()
         else:
             self.features_dim: int = self.backbone.num_features
+        if cfg.backbone.grad_checkpointing.enabled:
+            enable_grad_checkpointing(self.backbone, cfg.backbone.grad_checkpointing.fraction)
         ##############################
 
         # online linear classifier
@@ -258,6 +338,29 @@ class BaseMethod(pl.LightningModule):
 
         # for performance
         self.no_channel_last = cfg.performance.disable_channel_last
+        self.group_crops: bool = cfg.performance.group_crops
+        self.group_crops_bn: str = cfg.performance.group_crops_bn
+        self.compile_enabled: bool = cfg.performance.compile.enabled
+        self.compile_backbone: bool = cfg.performance.compile.backbone
+        self.compile_heads: bool = cfg.performance.compile.heads
+        self.compile_losses: bool = cfg.performance.compile.losses
+        self.compile_kwargs: Dict[str, Any] = {
+            "mode": cfg.performance.compile.mode,
+            "backend": cfg.performance.compile.backend,
+            "dynamic": cfg.performance.compile.dynamic,
+        }
+        self.compiled: Dict[str, CompiledFunction] = {}
+
+        # gradient caching requires full control over the backward and optimizer steps
+        self.grad_cache: bool = cfg.grad_cache.enabled
+        self.grad_cache_sub_batch_size: int = cfg.grad_cache.sub_batch_size
+        assert (
+            not self.grad_cache or self.supports_grad_cache
+        ), f"{cfg.method} does not support gradient caching."
+        if self.grad_cache:
+            self.automatic_optimization = False
+        self._grad_cache_state = None
+        self._grad_cache_replay = False
 
         # keep track of validation metrics
         self.validation_step_outputs = []
@@ -276,6 +379,16 @@ class BaseMethod(pl.LightningModule):
         # default for extra backbone kwargs (use pytorch's default if not available)
         cfg.backbone.kwargs = omegaconf_select(cfg, "backbone.kwargs", {})
 
+        # default parameters for activation checkpointing of the backbone
+        cfg.backbone.grad_checkpointing = omegaconf_select(cfg, "backbone.grad_checkpointing", {})
+        cfg.backbone.grad_checkpointing.enabled = omegaconf_select(
+            cfg, "backbone.grad_checkpointing.enabled", False
+        )
+        cfg.backbone.grad_checkpointing.fraction = omegaconf_select(
+            cfg, "backbone.grad_checkpointing.fraction", 1.0
+        )
+        assert 0 <= cfg.backbone.grad_checkpointing.fraction <= 1
+
         # default parameters for optimizer
         cfg.optimizer.exclude_bias_n_norm_wd = omegaconf_select(
             cfg, "optimizer.exclude_bias_n_norm_wd", False
@@ -304,6 +417,39 @@ class BaseMethod(pl.LightningModule):
         cfg.performance.disable_channel_last = omegaconf_select(
             cfg, "performance.disable_channel_last", False
         )
+        cfg.performance.group_crops = omegaconf_select(cfg, "performance.group_crops", False)
+        cfg.performance.group_crops_bn = omegaconf_select(
+            cfg, "performance.group_crops_bn", "per_crop"
+        )
+        assert cfg.performance.group_crops_bn in ["per_crop", "shared"]
+        cfg.performance.compile = omegaconf_select(cfg, "performance.compile", {})
+        cfg.performance.compile.enabled = omegaconf_select(
+            cfg, "performance.compile.enabled", False
+        )
+        cfg.performance.compile.mode = omegaconf_select(cfg, "performance.compile.mode", "default")
+        cfg.performance.compile.backend = omegaconf_select(
+            cfg, "performance.compile.backend", "inductor"
+        )
+        cfg.performance.compile.dynamic = omegaconf_select(cfg, "performance.compile.dynamic", None)
+        cfg.performance.compile.backbone = omegaconf_select(
+            cfg, "performance.compile.backbone", True
+        )
+        cfg.performance.compile.heads = omegaconf_select(cfg, "performance.compile.heads", True)
+        cfg.performance.compile.losses = omegaconf_select(cfg, "performance.compile.losses", True)
+        assert cfg.performance.compile.mode in COMPILE_MODES
+        assert not cfg.performance.compile.enabled or hasattr(
+            torch, "compile"
+        ), "performance.compile requires torch>=2.0."
+
+        # default parameters for gradient caching
+        cfg.grad_cache = omegaconf_select(cfg, "grad_cache", {})
+        cfg.grad_cache.enabled = omegaconf_select(cfg, "grad_cache.enabled", False)
+        cfg.grad_cache.sub_batch_size = omegaconf_select(cfg, "grad_cache.sub_batch_size", 64)
+        if cfg.grad_cache.enabled:
+            assert cfg.grad_cache.sub_batch_size > 0
+            assert (
+                cfg.accumulate_grad_batches == 1
+            ), "Gradient caching already trains with the full batch, disable gradient accumulation."
 
         # default empty parameters for method-specific kwargs
         cfg.method_kwargs = omegaconf_select(cfg, "method_kwargs", {})
@@ -416,6 +562,84 @@ class BaseMethod(pl.LightningModule):
         except:
             optimizer.zero_grad()
 
+    def compile_loss(self, loss_func: Callable) -> Callable:
+        """Compiles a loss function or loss module if performance.compile is enabled. Methods
+        should call their loss through the returned callable.
+
+        Args:
+            loss_func (Callable): loss function or nn.Module.
+
+        Returns:
+            Callable: the compiled loss (modules are compiled in place and returned).
+        """
+
+        if not (self.compile_enabled and self.compile_losses):
+            return loss_func
+
+        if isinstance(loss_func, nn.Module):
+            name = type(loss_func).__name__
+            self.compiled[name] = compile_module(loss_func, name, **self.compile_kwargs)
+            return loss_func
+
+        name = loss_func.__name__
+        self.compiled[name] = CompiledFunction(loss_func, name, **self.compile_kwargs)
+        return self.compiled[name]
+
+    def on_fit_start(self):
+        """Compiles the backbones and heads if performance.compile is enabled. This is done
+        here instead of in __init__ so that the heads created by each method already exist."""
+
+        if not self.compile_enabled:
+            return
+
+        names = []
+        if self.compile_backbone:
+            names += ["backbone", "momentum_backbone"]
+        if self.compile_heads:
+            names += self._COMPILE_HEADS
+        for name in names:
+            module = getattr(self, name, None)
+            if isinstance(module, nn.Module) and name not in self.compiled:
+                self.compiled[name] = compile_module(module, name, **self.compile_kwargs)
+
+    def compile_report(self) -> str:
+        """Summarizes the compilation of the backbone, heads and losses.
+
+        Returns:
+            str: human-readable report.
+        """
+
+        return compile_report(self.compiled)
+
+    def on_load_checkpoint(self, checkpoint: Dict[str, Any]):
+        """Converts the queues of checkpoints saved before queues were stored in a FeatureQueue,
+        so that they can still be loaded strictly.
+
+        Args:
+            checkpoint (Dict[str, Any]): checkpoint being loaded.
+        """
+
+        for name, module in self.named_modules():
+            if isinstance(module, FeatureQueue):
+                module.convert_legacy_state_dict(checkpoint["state_dict"], name)
+
+    def transfer_batch_to_device(
+        self, batch: Any, device: torch.device, dataloader_idx: int
+    ) -> Any:
+        """Moves the batch to the device, timed as the h2d stage when profiling.
+
+        Args:
+            batch (Any): the batch of data.
+            device (torch.device): target device.
+            dataloader_idx (int): index of the dataloader.
+
+        Returns:
+            Any: the batch on the device.
+        """
+
+        with profile_region("h2d"):
+            return super().transfer_batch_to_device(batch, device, dataloader_idx)
+
     def forward(self, X) -> Dict:
         """Basic forward method. Children methods should call this function,
         modify the ouputs (without deleting anything) and return it.
@@ -430,7 +654,8 @@ class BaseMethod(pl.LightningModule):
         if not self.no_channel_last:
             X = X.to(memory_format=torch.channels_last)
         feats = self.backbone(X)
-        logits = self.classifier(feats.detach())
+        with profile_region("online_classifier"):
+            logits = self.classifier(feats.detach())
         return {"logits": logits, "feats": feats}
 
     def multicrop_forward(self, X: torch.tensor) -> Dict[str, Any]:
@@ -474,6 +699,60 @@ class BaseMethod(pl.LightningModule):
         out.update({"loss": loss, "acc1": acc1, "acc5": acc5})
         return out
 
+    def forward_crops(
+        self, forward_fn: Callable, X: List[torch.Tensor], targets: Optional[torch.Tensor] = None
+    ) -> List[Dict[str, Any]]:
+        """Forwards a list of crops with forward_fn. If performance.group_crops is enabled, crops
+        with the same resolution are concatenated and forwarded at once, and the outputs are
+        split back so that the result is the same list of per-crop dicts. Tensor outputs are split
+        along their batch dimension in _OUTPUT_BATCH_DIMS (0 by default). Outputs declared with
+        NO_BATCH_DIM (e.g. losses and accuracies, which are the average over the group) and
+        non-tensor outputs are repeated for each crop.
+
+        Args:
+            forward_fn (Callable): function that receives a batch of images (and targets, if
+                given) and returns a dict of outputs.
+            X (List[torch.Tensor]): list of crops.
+            targets (Optional[torch.Tensor], optional): batch of labels shared by all crops.
+                Defaults to None.
+
+        Returns:
+            List[Dict[str, Any]]: outputs of each crop.
+        """
+
+        args = [] if targets is None else [targets]
+        if not self.group_crops:
+            return [forward_fn(x, *args) for x in X]
+
+        groups = {}
+        for i, x in enumerate(X):
+            groups.setdefault(tuple(x.shape[1:]), []).append(i)
+
+        outs = [{} for _ in X]
+        for idxs in groups.values():
+            sizes = [X[i].size(0) for i in idxs]
+            group_args = [arg.repeat(len(idxs)) for arg in args]
+            if self.group_crops_bn == "per_crop" and len(idxs) > 1:
+                bn_context = per_chunk_batch_norm(self, sizes)
+            else:
+                bn_context = nullcontext()
+            with bn_context:
+                out = forward_fn(torch.cat([X[i] for i in idxs]), *group_args)
+
+            for k, v in out.items():
+                dim = self._OUTPUT_BATCH_DIMS.get(k, 0)
+                if isinstance(v, torch.Tensor) and dim is not self.NO_BATCH_DIM:
+                    assert v.dim() > dim and v.size(dim) == sum(sizes), (
+                        f"Output {k} of size {tuple(v.size())} has no batch dimension {dim}, "
+                        "declare its batch dimension in _OUTPUT_BATCH_DIMS."
+                    )
+                    chunks = v.split(sizes, dim=dim)
+                else:
+                    chunks = [v] * len(idxs)
+                for i, chunk in zip(idxs, chunks):
+                    outs[i][k] = chunk
+        return outs
+
     def base_training_step(self, X: torch.Tensor, targets: torch.Tensor) -> Dict:
         """Allows user to re-write how the forward step behaves for the training_step.
         Should always return a dict containing, at least, "loss", "acc1" and "acc5".
@@ -509,13 +788,16 @@ class BaseMethod(pl.LightningModule):
         # check that we received the desired number of crops
         assert len(X) == self.num_crops
 
-        outs = [self.base_training_step(x, targets) for x in X[: self.num_large_crops]]
-        outs = {k: [out[k] for out in outs] for k in outs[0].keys()}
+        with profile_region("online_forward"):
+            outs = self.forward_crops(self.base_training_step, X[: self.num_large_crops], targets)
+            outs = {k: [out[k] for out in outs] for k in outs[0].keys()}
 
-        if self.multicrop:
-            multicrop_outs = [self.multicrop_forward(x) for x in X[self.num_large_crops :]]
-            for k in multicrop_outs[0].keys():
-                outs[k] = outs.get(k, []) + [out[k] for out in multicrop_outs]
+            if self.multicrop:
+                multicrop_outs = self.forward_crops(
+                    self.multicrop_forward, X[self.num_large_crops :]
+                )
+                for k in multicrop_outs[0].keys():
+                    outs[k] = outs.get(k, []) + [out[k] for out in multicrop_outs]
 
         # loss and stats
         outs["loss"] = sum(outs["loss"]) / self.num_large_crops
@@ -530,16 +812,122 @@ class BaseMethod(pl.LightningModule):
 
         self.log_dict(metrics, on_epoch=True, sync_dist=True)
 
-        if self.knn_eval:
+        # features were already added when the sub-batches were first forwarded
+        if self.knn_eval and not self._grad_cache_replay:
             targets = targets.repeat(self.num_large_crops)
             mask = targets != -1
-            self.knn(
-                train_features=torch.cat(outs["feats"][: self.num_large_crops])[mask].detach(),
-                train_targets=targets[mask],
-            )
+            with profile_region("knn"):
+                self.knn(
+                    train_features=torch.cat(outs["feats"][: self.num_large_crops])[mask].detach(),
+                    train_targets=targets[mask],
+                )
 
         return outs
 
+    def on_train_batch_end(self, outputs: Dict[str, Any], batch: Sequence[Any], batch_idx: int):
+        """Logs the time spent waiting for the asynchronous feature gathers of the losses.
+
+        Args:
+            outputs (Dict[str, Any]): the outputs of the training step.
+            batch (Sequence[Any]): a batch of data in the format of [img_indexes, [X], Y], where
+                [X] is a list of size self.num_crops containing batches of images.
+            batch_idx (int): index of the batch.
+        """
+
+        exposed_gather_time = pop_exposed_gather_time()
+        if get_world_size() > 1:
+            self.log("train_exposed_gather_time", exposed_gather_time, on_epoch=True)
+
+    def cached_forward(
+        self, forward_fn: Callable, batch: Sequence[Any], batch_idx: int
+    ) -> Dict[str, Any]:
+        """Calls the shared training step forward_fn on the batch. With gradient caching,
+        the batch is forwarded without graph in sub-batches and the outputs are merged into leaf
+        tensors, so that a loss over the full batch can be computed on them and passed to
+        cached_backward. Batch normalization statistics are only updated when the sub-batches
+        are forwarded again in cached_backward.
+
+        Args:
+            forward_fn (Callable): training step of the parent class, which receives a batch and
+                its index and returns a dict of outputs.
+            batch (Sequence[Any]): a batch of data in the format of [img_indexes, [X], Y], where
+                [X] is a list of size self.num_crops containing batches of images.
+            batch_idx (int): index of the batch.
+
+        Returns:
+            Dict[str, Any]: outputs of forward_fn for the full batch.
+        """
+
+        if not self.grad_cache:
+            return forward_fn(batch, batch_idx)
+
+        sub_batches = split_batch(batch, self.grad_cache_sub_batch_size)
+        rand_states, outs = [], []
+        with torch.no_grad(), preserve_batch_norm_stats(self):
+            for sub_batch in sub_batches:
+                rand_states.append(RandContext())
+                outs.append(detach_outputs(forward_fn(sub_batch, batch_idx)))
+
+        self._grad_cache_state = (forward_fn, batch_idx, sub_batches, rand_states, outs)
+        return merge_outputs(outs, [sub_batch[2].size(0) for sub_batch in sub_batches])
+
+    def cached_backward(self, loss: torch.Tensor) -> torch.Tensor:
+        """With gradient caching, computes the gradients of the full-batch loss w.r.t. the
+        outputs returned by cached_forward, forwards each sub-batch again with graph to
+        backpropagate these gradients to the parameters and performs the optimizer step.
+        Otherwise, the loss is returned as is for Lightning's automatic optimization.
+
+        Args:
+            loss (torch.Tensor): full-batch loss computed from the outputs of cached_forward.
+
+        Returns:
+            torch.Tensor: the loss.
+        """
+
+        if not self.grad_cache:
+            return loss
+
+        forward_fn, batch_idx, sub_batches, rand_states, outs = self._grad_cache_state
+        self._grad_cache_state = None
+
+        optimizer = self.optimizers()
+        optimizer.zero_grad(set_to_none=True)
+
+        # only synchronize gradients across processes on the last sub-batch
+        strategy = self.trainer.strategy
+        if hasattr(strategy, "block_backward_sync"):
+            no_sync = strategy.block_backward_sync
+        else:
+            no_sync = nullcontext
+
+        # gradients of the loss w.r.t. the cached outputs. Like any backward, the loss is scaled
+        # under fp16 mixed precision so that they do not underflow. They are unscaled in fp32
+        # because the backward of each sub-batch scales them again
+        with no_sync():
+            self.manual_backward(loss)
+        scaler = getattr(self.trainer.precision_plugin, "scaler", None)
+        scale = scaler.get_scale() if scaler is not None and scaler.is_enabled() else 1.0
+
+        self._grad_cache_replay = True
+        for i, (sub_batch, rand_state, out) in enumerate(zip(sub_batches, rand_states, outs)):
+            with no_sync() if i < len(sub_batches) - 1 else nullcontext():
+                with rand_state:
+                    replayed = flatten_tensors(forward_fn(sub_batch, batch_idx))
+                surrogate = sum(
+                    (t.float() * (cached.grad.float() / scale)).sum()
+                    for t, cached in zip(replayed, flatten_tensors(out))
+                    if t.requires_grad and cached.grad is not None
+                )
+                self.manual_backward(surrogate)
+        self._grad_cache_replay = False
+
+        optimizer.step()
+        for config in self.trainer.lr_scheduler_configs:
+            if config.interval == "step" or self.trainer.is_last_batch:
+                config.scheduler.step()
+
+        return loss.detach()
+
     def base_validation_step(self, X: torch.Tensor, targets: torch.Tensor) -> Dict:
         """Allows user to re-write how the forward step behaves for the validation_step.
         Should always return a dict containing, at least, "loss", "acc1" and "acc5".
@@ -632,6 +1020,13 @@ class BaseMomentumMethod(BaseMethod):
                 final_tau (float): final value of the weighting decrease coefficient in [0,1].
                 classifier (bool): whether or not to train a classifier on top of the
                     momentum backbone.
+                update_buffers (bool): whether to also update the buffers (e.g. BN running
+                    statistics) of the momentum networks with exponential moving average.
+                update_every (int): number of optimization steps between momentum updates.
+                    Tau is corrected so that each update accounts for the skipped steps.
+                flat_params (bool): whether to pack the parameters of each momentum network
+                    into one contiguous buffer when training starts, so that the decay of the
+                    momentum update is a single kernel. Checkpoints are unaffected.
         """
 
         super().__init__(cfg)
@@ -660,7 +1055,13 @@ class BaseMomentumMethod(BaseMethod):
             self.momentum_classifier = None
 
         # momentum updater
-        self.momentum_updater = MomentumUpdater(cfg.momentum.base_tau, cfg.momentum.final_tau)
+        self.momentum_updater = MomentumUpdater(
+            cfg.momentum.base_tau,
+            cfg.momentum.final_tau,
+            update_buffers=cfg.momentum.update_buffers,
+            update_every=cfg.momentum.update_every,
+            flat_params=cfg.momentum.flat_params,
+        )
 
     @property
     def learnable_params(self) -> List[Dict[str, Any]]:
@@ -709,6 +1110,11 @@ class BaseMomentumMethod(BaseMethod):
         cfg.momentum.base_tau = omegaconf_select(cfg, "momentum.base_tau", 0.99)
         cfg.momentum.final_tau = omegaconf_select(cfg, "momentum.final_tau", 1.0)
         cfg.momentum.classifier = omegaconf_select(cfg, "momentum.classifier", False)
+        cfg.momentum.update_buffers = omegaconf_select(cfg, "momentum.update_buffers", False)
+        cfg.momentum.update_every = omegaconf_select(cfg, "momentum.update_every", 1)
+        cfg.momentum.flat_params = omegaconf_select(cfg, "momentum.flat_params", False)
+
+        assert cfg.momentum.update_every >= 1
 
         return cfg
 
@@ -781,7 +1187,8 @@ class BaseMomentumMethod(BaseMethod):
         # remove small crops
         X = X[: self.num_large_crops]
 
-        momentum_outs = [self._shared_step_momentum(x, targets) for x in X]
+        with profile_region("momentum_forward"):
+            momentum_outs = self.forward_crops(self._shared_step_momentum, X, targets)
         momentum_outs = {
             "momentum_" + k: [out[k] for out in momentum_outs] for k in momentum_outs[0].keys()
         }
@@ -824,9 +1231,10 @@ class BaseMomentumMethod(BaseMethod):
 
         if self.trainer.global_step > self.last_step:
             # update momentum backbone and projector
-            momentum_pairs = self.momentum_pairs
-            for mp in momentum_pairs:
-                self.momentum_updater.update(*mp)
+            if self.momentum_updater.should_update(self.trainer.global_step):
+                with profile_region("momentum_update"):
+                    for mp in self.momentum_pairs:
+                        self.momentum_updater.update(*mp)
             # log tau momentum
             self.log("tau", self.momentum_updater.cur_tau)
             # update tau
@@ -836,6 +1244,8 @@ class BaseMomentumMethod(BaseMethod):
             )
         self.last_step = self.trainer.global_step
 
+        super().on_train_batch_end(outputs, batch, batch_idx)
+
     def validation_step(
         self,
         batch: List[torch.Tensor],
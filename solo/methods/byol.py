@@ -71,6 +71,9 @@ class BYOL(BaseMomentumMethod):
             nn.Linear(pred_hidden_dim, proj_output_dim),
         )
 
+        # loss (optionally compiled)
+        self.byol_loss_func = self.compile_loss(byol_loss_func)
+
     @staticmethod
     def add_and_assert_specific_cfg(cfg: omegaconf.DictConfig) -> omegaconf.DictConfig:
         """Adds method specific default values/checks for config.
@@ -187,7 +190,7 @@ class BYOL(BaseMomentumMethod):
         neg_cos_sim = 0
         for v1 in range(self.num_large_crops):
             for v2 in np.delete(range(self.num_crops), v1):
-                neg_cos_sim += byol_loss_func(P[v2], Z_momentum[v1])
+                neg_cos_sim += self.byol_loss_func(P[v2], Z_momentum[v1])
 
         # calculate std of features
         with torch.no_grad():
@@ -17,19 +17,40 @@
 # OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 # DEALINGS IN THE SOFTWARE.
 
-from typing import Any, Dict, List, Sequence
+import logging
+import time
+from typing import Any, Dict, List, Optional, Sequence
 
 import omegaconf
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
+from torch.utils.data import DistributedSampler
 from solo.losses.deepclusterv2 import deepclusterv2_loss_func
 from solo.methods.base import BaseMethod
-from solo.utils.kmeans import KMeans
+from solo.utils.kmeans import KMeans, MiniBatchKMeans
 from solo.utils.misc import omegaconf_select
 
 
 class DeepClusterV2(BaseMethod):
+    # prototype logits are stacked as PxNxC
+    _OUTPUT_BATCH_DIMS = {**BaseMethod._OUTPUT_BATCH_DIMS, "p": 1}
+
+    _KMEANS = {
+        "kmeans": KMeans,
+        "minibatch_kmeans": MiniBatchKMeans,
+    }
+    _MEMORY_BANK_DTYPES = {
+        "float32": torch.float32,
+        "float16": torch.float16,
+        "bfloat16": torch.bfloat16,
+    }
+    _ASSIGNMENTS_DTYPES = {
+        "int64": torch.int64,
+        "int32": torch.int32,
+        "int16": torch.int16,
+    }
+
     def __init__(self, cfg: omegaconf.DictConfig):
         """Implements DeepCluster V2 (https://arxiv.org/abs/2006.09882).
 
@@ -39,7 +60,21 @@ class DeepClusterV2(BaseMethod):
                 proj_hidden_dim (int): number of neurons in the hidden layers of the projector.
                 num_prototypes (Sequence[int]): number of prototypes.
                 temperature (float): temperature for the softmax.
-                kmeans_iters (int): number of iterations for k-means clustering.
+                kmeans_iters (int): number of iterations for k-means clustering. For
+                    minibatch_kmeans, this is the number of mini-batches per clustering.
+                kmeans_algorithm (str): clustering backend, either kmeans or minibatch_kmeans.
+                kmeans_init (str): centroid initialization, either random or kmeans++.
+                kmeans_warm_start (bool): whether to initialize the centroids with the ones of
+                    the previous epoch instead of kmeans_init.
+                kmeans_batch_size (int): number of samples per process in each mini-batch of
+                    minibatch_kmeans.
+                memory_bank_dtype (str): dtype of the embeddings in the memory bank, either
+                    float32, float16 or bfloat16. K-means always accumulates in float32.
+                memory_bank_on_cpu (bool): whether to keep the memory bank in pinned cpu memory.
+                    Embeddings are copied asynchronously at every step and moved to the gpu one
+                    crop at a time for clustering.
+                assignments_dtype (str): dtype of the stored assignments, either int64, int32
+                    or int16.
         """
 
         super().__init__(cfg)
@@ -48,6 +83,16 @@ class DeepClusterV2(BaseMethod):
         self.temperature: float = cfg.method_kwargs.temperature
         self.num_prototypes: Sequence[int] = cfg.method_kwargs.num_prototypes
         self.kmeans_iters: int = cfg.method_kwargs.kmeans_iters
+        self.kmeans_algorithm: str = cfg.method_kwargs.kmeans_algorithm
+        self.kmeans_init: str = cfg.method_kwargs.kmeans_init
+        self.kmeans_warm_start: bool = cfg.method_kwargs.kmeans_warm_start
+        self.kmeans_batch_size: int = cfg.method_kwargs.kmeans_batch_size
+        self.memory_bank_dtype = self._MEMORY_BANK_DTYPES[cfg.method_kwargs.memory_bank_dtype]
+        self.memory_bank_on_cpu: bool = cfg.method_kwargs.memory_bank_on_cpu
+        self.assignments_dtype = self._ASSIGNMENTS_DTYPES[cfg.method_kwargs.assignments_dtype]
+
+        # sorted dataset indices of the columns of self.assignments (None means all samples)
+        self.assignment_indices: Optional[torch.Tensor] = None
 
         proj_hidden_dim: int = cfg.method_kwargs.proj_hidden_dim
         proj_output_dim: int = cfg.method_kwargs.proj_output_dim
@@ -70,6 +115,9 @@ class DeepClusterV2(BaseMethod):
                 params.requires_grad = False
             proto.weight.copy_(F.normalize(proto.weight.data.clone(), dim=-1))
 
+        # loss (optionally compiled)
+        self.deepclusterv2_loss_func = self.compile_loss(deepclusterv2_loss_func)
+
     @staticmethod
     def add_and_assert_specific_cfg(cfg: omegaconf.DictConfig) -> omegaconf.DictConfig:
         """Adds method specific default values/checks for config.
@@ -93,6 +141,35 @@ class DeepClusterV2(BaseMethod):
             [3000, 3000, 3000],
         )
         cfg.method_kwargs.kmeans_iters = omegaconf_select(cfg, "method_kwargs.kmeans_iters", 10)
+        cfg.method_kwargs.kmeans_algorithm = omegaconf_select(
+            cfg, "method_kwargs.kmeans_algorithm", "kmeans"
+        )
+        cfg.method_kwargs.kmeans_init = omegaconf_select(cfg, "method_kwargs.kmeans_init", "random")
+        cfg.method_kwargs.kmeans_warm_start = omegaconf_select(
+            cfg, "method_kwargs.kmeans_warm_start", False
+        )
+        cfg.method_kwargs.kmeans_batch_size = omegaconf_select(
+            cfg, "method_kwargs.kmeans_batch_size", 4096
+        )
+
+        cfg.method_kwargs.memory_bank_dtype = omegaconf_select(
+            cfg, "method_kwargs.memory_bank_dtype", "float32"
+        )
+        cfg.method_kwargs.memory_bank_on_cpu = omegaconf_select(
+            cfg, "method_kwargs.memory_bank_on_cpu", False
+        )
+        cfg.method_kwargs.assignments_dtype = omegaconf_select(
+            cfg, "method_kwargs.assignments_dtype", "int64"
+        )
+
+        assert cfg.method_kwargs.kmeans_algorithm in DeepClusterV2._KMEANS
+        assert cfg.method_kwargs.kmeans_init in ["random", "kmeans++"]
+        assert cfg.method_kwargs.memory_bank_dtype in DeepClusterV2._MEMORY_BANK_DTYPES
+        assert cfg.method_kwargs.assignments_dtype in DeepClusterV2._ASSIGNMENTS_DTYPES
+        assignments_dtype = DeepClusterV2._ASSIGNMENTS_DTYPES[cfg.method_kwargs.assignments_dtype]
+        assert (
+            max(cfg.method_kwargs.num_prototypes) <= torch.iinfo(assignments_dtype).max
+        ), "assignments_dtype is too small for the number of prototypes"
 
         return cfg
 
@@ -119,7 +196,10 @@ class DeepClusterV2(BaseMethod):
             self.dataset_size = self.trainer.train_dataloader.loaders.dataset_size
 
         # build k-means helper object
-        self.kmeans = KMeans(
+        kmeans_kwargs = {}
+        if self.kmeans_algorithm == "minibatch_kmeans":
+            kmeans_kwargs["batch_size"] = self.kmeans_batch_size
+        self.kmeans = self._KMEANS[self.kmeans_algorithm](
             world_size=self.world_size,
             rank=self.global_rank,
             num_large_crops=self.num_large_crops,
@@ -127,6 +207,10 @@ class DeepClusterV2(BaseMethod):
             proj_features_dim=self.proj_output_dim,
             num_prototypes=self.num_prototypes,
             kmeans_iters=self.kmeans_iters,
+            init=self.kmeans_init,
+            assignments_dtype=self.assignments_dtype,
+            device=self.device,
+            **kmeans_kwargs,
         )
 
         # initialize memory banks
@@ -135,25 +219,124 @@ class DeepClusterV2(BaseMethod):
             "local_memory_index",
             torch.zeros(size_memory_per_process).long().to(self.device, non_blocking=True),
         )
-        self.register_buffer(
-            "local_memory_embeddings",
-            F.normalize(
-                torch.randn(self.num_large_crops, size_memory_per_process, self.proj_output_dim),
-                dim=-1,
-            ).to(self.device, non_blocking=True),
+        memory_bank_device = "cpu" if self.memory_bank_on_cpu else self.device
+        local_memory_embeddings = torch.empty(
+            self.num_large_crops,
+            size_memory_per_process,
+            self.proj_output_dim,
+            dtype=self.memory_bank_dtype,
+            device=memory_bank_device,
         )
+        if self.memory_bank_on_cpu and torch.cuda.is_available():
+            local_memory_embeddings = local_memory_embeddings.pin_memory()
+        # fill one crop at a time to avoid a full float32 copy of the memory bank
+        for embeddings in local_memory_embeddings:
+            embeddings.copy_(
+                F.normalize(torch.randn(size_memory_per_process, self.proj_output_dim), dim=-1)
+            )
+        self.register_buffer("local_memory_embeddings", local_memory_embeddings)
+
+        self.log_memory_usage(size_memory_per_process)
+
+    def log_memory_usage(self, size_memory_per_process: int):
+        """Logs the memory used per process by the memory banks and the assignments.
+
+        Args:
+            size_memory_per_process (int): number of samples in the local memory bank.
+        """
+
+        def to_mb(num_elements: int, dtype: torch.dtype) -> float:
+            element_size = torch.empty(0, dtype=dtype).element_size()
+            return num_elements * element_size / 2**20
+
+        sampler_indices = self._sampler_indices()
+        num_assignments = self.dataset_size if sampler_indices is None else len(sampler_indices)
+        stats = {
+            "memory/memory_bank_mb": to_mb(
+                self.num_large_crops * size_memory_per_process * self.proj_output_dim,
+                self.memory_bank_dtype,
+            ),
+            "memory/memory_index_mb": to_mb(size_memory_per_process, torch.long),
+            "memory/assignments_mb": to_mb(
+                len(self.num_prototypes) * num_assignments, self.assignments_dtype
+            ),
+        }
+        memory_bank_device = "pinned cpu" if self.memory_bank_on_cpu else str(self.device)
+        logging.info(
+            f"DeepClusterV2 memory usage per process: {stats['memory/memory_bank_mb']:.1f}MB "
+            f"of {self.memory_bank_dtype} embeddings on {memory_bank_device}, "
+            f"{stats['memory/memory_index_mb']:.1f}MB of indices and "
+            f"{stats['memory/assignments_mb']:.1f}MB of {self.assignments_dtype} assignments "
+            f"({num_assignments} samples)."
+        )
+        if self.logger is not None:
+            self.logger.log_metrics(stats)
+
+    def _sampler_indices(self) -> Optional[torch.Tensor]:
+        """Gets the sorted dataset indices that this process will see in the current epoch.
+        They can only be known ahead of time for the default DistributedSampler, which is
+        deterministic given the epoch. For other samplers, None is returned and the
+        assignments of the whole dataset are kept.
+
+        Returns:
+            Optional[torch.Tensor]: sorted indices or None.
+        """
+
+        sampler = getattr(self.trainer.train_dataloader, "sampler", None)
+        # subclasses (e.g. lightning's DistributedSamplerWrapper) may wrap random samplers
+        if type(sampler) is not DistributedSampler:
+            return None
+        return torch.tensor(sorted(sampler), dtype=torch.long, device=self.device)
+
+    def get_assignments(self, idxs: torch.Tensor) -> torch.Tensor:
+        """Gets the k-means assignments of a batch of samples.
+
+        Args:
+            idxs (torch.Tensor): dataset indices of the samples.
+
+        Returns:
+            torch.Tensor: int64 assignments of the samples for each set of prototypes.
+        """
+
+        if self.assignment_indices is not None:
+            idxs = torch.searchsorted(self.assignment_indices, idxs)
+        return self.assignments[:, idxs].long()
 
     def on_train_epoch_start(self) -> None:
         """Prepares assigments and prototype centroids for the next epoch."""
 
+        self.assignment_indices = self._sampler_indices()
         if self.current_epoch == 0:
-            self.assignments = -torch.ones(
-                len(self.num_prototypes), self.dataset_size, device=self.device
-            ).long()
+            num_assignments = (
+                self.dataset_size
+                if self.assignment_indices is None
+                else len(self.assignment_indices)
+            )
+            self.assignments = torch.full(
+                (len(self.num_prototypes), num_assignments),
+                -1,
+                dtype=self.assignments_dtype,
+                device=self.device,
+            )
         else:
+            # prototypes only hold k-means centroids after the first clustering (epoch 1)
+            init_centroids = None
+            if self.kmeans_warm_start and self.current_epoch > 1:
+                init_centroids = [proto.weight.data.clone() for proto in self.prototypes]
+
+            if self.device.type == "cuda":
+                torch.cuda.synchronize(self.device)
+            start = time.perf_counter()
             self.assignments, centroids = self.kmeans.cluster_memory(
-                self.local_memory_index, self.local_memory_embeddings
+                self.local_memory_index,
+                self.local_memory_embeddings,
+                init_centroids,
+                self.assignment_indices,
             )
+            if self.device.type == "cuda":
+                torch.cuda.synchronize(self.device)
+            self.log("kmeans_time", time.perf_counter() - start, sync_dist=True)
+
             for proto, centro in zip(self.prototypes, centroids):
                 proto.weight.copy_(centro)
 
@@ -169,7 +352,9 @@ class DeepClusterV2(BaseMethod):
         start_idx, end_idx = batch_idx * self.batch_size, (batch_idx + 1) * self.batch_size
         self.local_memory_index[start_idx:end_idx] = idxs
         for c, z_c in enumerate(z):
-            self.local_memory_embeddings[c][start_idx:end_idx] = z_c.detach()
+            # asynchronous when the memory bank is in pinned cpu memory
+            memory = self.local_memory_embeddings[c][start_idx:end_idx]
+            memory.copy_(z_c.detach(), non_blocking=True)
 
     def forward(self, X: torch.Tensor) -> Dict[str, Any]:
         """Performs the forward pass of the backbone, the projector and the prototypes.
@@ -210,8 +395,8 @@ class DeepClusterV2(BaseMethod):
 
         # ------- deepclusterv2 loss -------
         preds = torch.stack([p1.unsqueeze(1), p2.unsqueeze(1)], dim=1)
-        assignments = self.assignments[:, idxs]
-        deepcluster_loss = deepclusterv2_loss_func(preds, assignments, self.temperature)
+        assignments = self.get_assignments(idxs)
+        deepcluster_loss = self.deepclusterv2_loss_func(preds, assignments, self.temperature)
 
         # ------- update memory banks -------
         self.update_memory_banks(idxs, [z1, z2], batch_idx)
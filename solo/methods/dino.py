@@ -112,6 +112,8 @@ class DINOHead(nn.Module):
 
 
 class DINO(BaseMomentumMethod):
+    _COMPILE_HEADS = ["head", "momentum_head"]
+
     def __init__(self, cfg: omegaconf.DictConfig):
         """Adds DINO head to the student and momentum DINO head to the teacher.
 
@@ -167,14 +169,16 @@ class DINO(BaseMomentumMethod):
         )
         initialize_momentum_params(self.head, self.momentum_head)
 
-        # dino loss
-        self.dino_loss_func = DINOLoss(
-            num_prototypes=num_prototypes,
-            student_temp=student_temperature,
-            warmup_teacher_temp=warmup_teacher_temperature,
-            teacher_temp=teacher_temperature,
-            warmup_teacher_temp_epochs=warmup_teacher_temperature_epochs,
-            num_epochs=self.max_epochs,
+        # dino loss (optionally compiled)
+        self.dino_loss_func = self.compile_loss(
+            DINOLoss(
+                num_prototypes=num_prototypes,
+                student_temp=student_temperature,
+                warmup_teacher_temp=warmup_teacher_temperature,
+                teacher_temp=teacher_temperature,
+                warmup_teacher_temp_epochs=warmup_teacher_temperature_epochs,
+                num_epochs=self.max_epochs,
+            )
         )
 
     @staticmethod
@@ -27,10 +27,17 @@ import torch.nn as nn
 import torch.nn.functional as F
 from torch.optim.lr_scheduler import ExponentialLR, MultiStepLR, ReduceLROnPlateau
 
+from solo.utils.compiler import (
+    COMPILE_MODES,
+    CompiledFunction,
+    compile_module,
+    compile_report,
+)
 from solo.utils.lars import LARS
 from solo.utils.lr_scheduler import LinearWarmupCosineAnnealingLR
 from solo.utils.metrics import accuracy_at_k, weighted_mean
 from solo.utils.misc import (
+    enable_grad_checkpointing,
     omegaconf_select,
     param_groups_layer_decay,
     remove_bias_and_norm_from_weight_decay,
@@ -86,11 +93,27 @@ class LinearModel(pl.LightningModule):
                 interval (str): interval to update the lr scheduler. Defaults to 'step'.
 
             finetune (bool): whether or not to finetune the backbone. Defaults to False.
+            backbone:
+                grad_checkpointing:
+                    enabled (bool): recomputes the activations of the backbone during backward
+                        instead of storing them. Only used when finetuning. Defaults to False.
+                    fraction (float): fraction of the blocks/stages that are checkpointed,
+                        starting from the input. Defaults to 1.0.
 
             performance:
                 disable_channel_last (bool). Disables channel last conversion operation which
                 speeds up training considerably. Defaults to False.
                 https://pytorch.org/tutorials/intermediate/memory_format_tutorial.html#converting-existing-models
+                compile:
+                    enabled (bool): compiles the backbone, classifier and loss with
+                        torch.compile, falling back to eager mode if compilation fails.
+                        Defaults to False.
+                    mode (str): torch.compile mode. Defaults to "default".
+                    backend (str): torch.compile backend. Defaults to "inductor".
+                    dynamic (Optional[bool]): compiles with dynamic shapes. Defaults to None.
+                    backbone (bool): compiles the backbone. Defaults to True.
+                    heads (bool): compiles the classifier. Defaults to True.
+                    losses (bool): compiles the loss function. Defaults to True.
 
         loss_func (Callable): loss function to use (for mixup, label smoothing or default).
         Defaults to None mixup_func (Callable, optional). function to convert data and targets
@@ -151,10 +174,22 @@ class LinearModel(pl.LightningModule):
 
         # for performance
         self.no_channel_last = cfg.performance.disable_channel_last
+        self.compile_enabled: bool = cfg.performance.compile.enabled
+        self.compile_backbone: bool = cfg.performance.compile.backbone
+        self.compile_heads: bool = cfg.performance.compile.heads
+        self.compile_losses: bool = cfg.performance.compile.losses
+        self.compile_kwargs: Dict[str, Any] = {
+            "mode": cfg.performance.compile.mode,
+            "backend": cfg.performance.compile.backend,
+            "dynamic": cfg.performance.compile.dynamic,
+        }
+        self.compiled: Dict[str, CompiledFunction] = {}
 
         if not self.finetune:
             for param in self.backbone.parameters():
                 param.requires_grad = False
+        elif cfg.backbone.grad_checkpointing.enabled:
+            enable_grad_checkpointing(self.backbone, cfg.backbone.grad_checkpointing.fraction)
 
         # keep track of validation metrics
         self.validation_step_outputs = []
@@ -181,6 +216,17 @@ class LinearModel(pl.LightningModule):
         # whether or not to finetune the backbone
         cfg.finetune = omegaconf_select(cfg, "finetune", False)
 
+        # default parameters for activation checkpointing of the backbone
+        cfg.backbone = omegaconf_select(cfg, "backbone", {})
+        cfg.backbone.grad_checkpointing = omegaconf_select(cfg, "backbone.grad_checkpointing", {})
+        cfg.backbone.grad_checkpointing.enabled = omegaconf_select(
+            cfg, "backbone.grad_checkpointing.enabled", False
+        )
+        cfg.backbone.grad_checkpointing.fraction = omegaconf_select(
+            cfg, "backbone.grad_checkpointing.fraction", 1.0
+        )
+        assert 0 <= cfg.backbone.grad_checkpointing.fraction <= 1
+
         # default for acc grad batches
         cfg.accumulate_grad_batches = omegaconf_select(cfg, "accumulate_grad_batches", 1)
 
@@ -196,6 +242,24 @@ class LinearModel(pl.LightningModule):
         cfg.performance.disable_channel_last = omegaconf_select(
             cfg, "performance.disable_channel_last", False
         )
+        cfg.performance.compile = omegaconf_select(cfg, "performance.compile", {})
+        cfg.performance.compile.enabled = omegaconf_select(
+            cfg, "performance.compile.enabled", False
+        )
+        cfg.performance.compile.mode = omegaconf_select(cfg, "performance.compile.mode", "default")
+        cfg.performance.compile.backend = omegaconf_select(
+            cfg, "performance.compile.backend", "inductor"
+        )
+        cfg.performance.compile.dynamic = omegaconf_select(cfg, "performance.compile.dynamic", None)
+        cfg.performance.compile.backbone = omegaconf_select(
+            cfg, "performance.compile.backbone", True
+        )
+        cfg.performance.compile.heads = omegaconf_select(cfg, "performance.compile.heads", True)
+        cfg.performance.compile.losses = omegaconf_select(cfg, "performance.compile.losses", True)
+        assert cfg.performance.compile.mode in COMPILE_MODES
+        assert not cfg.performance.compile.enabled or hasattr(
+            torch, "compile"
+        ), "performance.compile requires torch>=2.0."
 
         return cfg
 
@@ -284,6 +348,38 @@ class LinearModel(pl.LightningModule):
 
         return [optimizer], [scheduler]
 
+    def on_fit_start(self):
+        """Compiles the backbone, classifier and loss if performance.compile is enabled."""
+
+        if not self.compile_enabled or self.compiled:
+            return
+
+        if self.compile_backbone:
+            self.compiled["backbone"] = compile_module(
+                self.backbone, "backbone", **self.compile_kwargs
+            )
+        if self.compile_heads:
+            self.compiled["classifier"] = compile_module(
+                self.classifier, "classifier", **self.compile_kwargs
+            )
+        if self.compile_losses:
+            if isinstance(self.loss_func, nn.Module):
+                self.compiled["loss"] = compile_module(
+                    self.loss_func, "loss", **self.compile_kwargs
+                )
+            else:
+                self.loss_func = CompiledFunction(self.loss_func, "loss", **self.compile_kwargs)
+                self.compiled["loss"] = self.loss_func
+
+    def compile_report(self) -> str:
+        """Summarizes the compilation of the backbone, classifier and loss.
+
+        Returns:
+            str: human-readable report.
+        """
+
+        return compile_report(self.compiled)
+
     def forward(self, X: torch.tensor) -> Dict[str, Any]:
         """Performs forward pass of the frozen backbone and the linear layer for evaluation.
 
@@ -119,6 +119,8 @@ class MAEDecoder(nn.Module):
 
 
 class MAE(BaseMethod):
+    _COMPILE_HEADS = ["decoder"]
+
     def __init__(
         self,
         cfg: omegaconf.DictConfig,
@@ -164,6 +166,9 @@ class MAE(BaseMethod):
             mlp_ratio=4.0,
         )
 
+        # loss (optionally compiled)
+        self.mae_loss_func = self.compile_loss(mae_loss_func)
+
     @staticmethod
     def add_and_assert_specific_cfg(cfg: omegaconf.DictConfig) -> omegaconf.DictConfig:
         """Adds method specific default values/checks for config.
@@ -248,7 +253,7 @@ class MAE(BaseMethod):
         imgs = batch[1]
         reconstruction_loss = 0
         for i in range(self.num_large_crops):
-            reconstruction_loss += mae_loss_func(
+            reconstruction_loss += self.mae_loss_func(
                 imgs[i],
                 out["pred"][i],
                 out["mask"][i],
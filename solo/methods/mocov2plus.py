@@ -25,6 +25,7 @@ import torch.nn as nn
 import torch.nn.functional as F
 from solo.losses.mocov2plus import mocov2plus_loss_func
 from solo.methods.base import BaseMomentumMethod
+from solo.utils.feature_queue import QUEUE_DTYPES, FeatureQueue
 from solo.utils.misc import gather, omegaconf_select
 from solo.utils.momentum import initialize_momentum_params
 
@@ -39,6 +40,8 @@ class MoCoV2Plus(BaseMomentumMethod):
                 proj_hidden_dim (int): number of neurons of the hidden layers of the projector.
                 temperature (float): temperature for the softmax in the contrastive loss.
                 queue_size (int): number of samples to keep in the queue.
+                queue_dtype (str): dtype of the features in the queue, either float32,
+                    float16 or bfloat16.
         """
 
         super().__init__(cfg)
@@ -65,9 +68,16 @@ class MoCoV2Plus(BaseMomentumMethod):
         initialize_momentum_params(self.projector, self.momentum_projector)
 
         # create the queue
-        self.register_buffer("queue", torch.randn(2, proj_output_dim, self.queue_size))
-        self.queue = nn.functional.normalize(self.queue, dim=1)
-        self.register_buffer("queue_ptr", torch.zeros(1, dtype=torch.long))
+        self.queue = FeatureQueue(
+            self.queue_size,
+            proj_output_dim,
+            num_views=2,
+            dtype=QUEUE_DTYPES[cfg.method_kwargs.queue_dtype],
+        )
+        self.keys_to_enqueue = None
+
+        # loss (optionally compiled)
+        self.mocov2plus_loss_func = self.compile_loss(mocov2plus_loss_func)
 
     @staticmethod
     def add_and_assert_specific_cfg(cfg: omegaconf.DictConfig) -> omegaconf.DictConfig:
@@ -87,6 +97,10 @@ class MoCoV2Plus(BaseMomentumMethod):
         assert not omegaconf.OmegaConf.is_missing(cfg, "method_kwargs.temperature")
 
         cfg.method_kwargs.queue_size = omegaconf_select(cfg, "method_kwargs.queue_size", 65536)
+        cfg.method_kwargs.queue_dtype = omegaconf_select(
+            cfg, "method_kwargs.queue_dtype", "float32"
+        )
+        assert cfg.method_kwargs.queue_dtype in QUEUE_DTYPES
 
         return cfg
 
@@ -112,6 +126,19 @@ class MoCoV2Plus(BaseMomentumMethod):
         extra_momentum_pairs = [(self.projector, self.momentum_projector)]
         return super().momentum_pairs + extra_momentum_pairs
 
+    def on_load_checkpoint(self, checkpoint: Dict[str, Any]):
+        """Transposes the queue of checkpoints saved before the queue was a FeatureQueue, which
+        stored it as (2, proj_output_dim, queue_size).
+
+        Args:
+            checkpoint (Dict[str, Any]): checkpoint being loaded.
+        """
+
+        state_dict = checkpoint["state_dict"]
+        if "queue" in state_dict:
+            state_dict["queue"] = state_dict["queue"].transpose(1, 2)
+        super().on_load_checkpoint(checkpoint)
+
     @torch.no_grad()
     def _dequeue_and_enqueue(self, keys: torch.Tensor):
         """Adds new samples and removes old samples from the queue in a fifo manner.
@@ -120,15 +147,7 @@ class MoCoV2Plus(BaseMomentumMethod):
             keys (torch.Tensor): output features of the momentum backbone.
         """
 
-        batch_size = keys.shape[1]
-        ptr = int(self.queue_ptr)  # type: ignore
-        assert self.queue_size % batch_size == 0  # for simplicity
-
-        # replace the keys at ptr (dequeue and enqueue)
-        keys = keys.permute(0, 2, 1)
-        self.queue[:, :, ptr : ptr + batch_size] = keys
-        ptr = (ptr + batch_size) % self.queue_size  # move pointer
-        self.queue_ptr[0] = ptr  # type: ignore
+        self.queue.enqueue(keys)
 
     def forward(self, X: torch.Tensor) -> Dict[str, Any]:
         """Performs the forward pass of the online backbone and projector.
@@ -183,16 +202,31 @@ class MoCoV2Plus(BaseMomentumMethod):
 
         # ------- contrastive loss -------
         # symmetric
-        queue = self.queue.clone().detach()
+        queue = self.queue.get(q1.dtype)
         nce_loss = (
-            mocov2plus_loss_func(q1, k2, queue[1], self.temperature)
-            + mocov2plus_loss_func(q2, k1, queue[0], self.temperature)
+            self.mocov2plus_loss_func(q1, k2, queue[1].T, self.temperature)
+            + self.mocov2plus_loss_func(q2, k1, queue[0].T, self.temperature)
         ) / 2
 
         # ------- update queue -------
-        keys = torch.stack((gather(k1), gather(k2)))
-        self._dequeue_and_enqueue(keys)
+        # the loss holds a view of the queue, so it is only updated after the backward pass
+        self.keys_to_enqueue = torch.stack((gather(k1), gather(k2))).detach()
 
         self.log("train_nce_loss", nce_loss, on_epoch=True, sync_dist=True)
 
         return nce_loss + class_loss
+
+    def on_train_batch_end(self, outputs: Dict[str, Any], batch: Sequence[Any], batch_idx: int):
+        """Performs the momentum update and adds the keys of the current batch to the queue.
+
+        Args:
+            outputs (Dict[str, Any]): the outputs of the training step.
+            batch (Sequence[Any]): a batch of data in the format of [img_indexes, [X], Y], where
+                [X] is a list of size self.num_crops containing batches of images.
+            batch_idx (int): index of the batch.
+        """
+
+        super().on_train_batch_end(outputs, batch, batch_idx)
+        if self.keys_to_enqueue is not None:
+            self._dequeue_and_enqueue(self.keys_to_enqueue)
+            self.keys_to_enqueue = None
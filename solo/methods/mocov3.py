@@ -28,6 +28,8 @@ from solo.utils.momentum import initialize_momentum_params
 
 
 class MoCoV3(BaseMomentumMethod):
+    supports_grad_cache = True
+
     def __init__(self, cfg: omegaconf.DictConfig):
         """Implements MoCo V3 (https://arxiv.org/abs/2104.02057).
 
@@ -98,6 +100,9 @@ class MoCoV3(BaseMomentumMethod):
 
         initialize_momentum_params(self.projector, self.momentum_projector)
 
+        # loss (optionally compiled)
+        self.mocov3_loss_func = self.compile_loss(mocov3_loss_func)
+
     def _build_mlp(self, num_layers, input_dim, mlp_dim, output_dim, last_bn=True):
         mlp = []
         for l in range(num_layers):
@@ -205,18 +210,18 @@ class MoCoV3(BaseMomentumMethod):
             torch.Tensor: total loss composed of MoCo V3 and classification loss.
         """
 
-        out = super().training_step(batch, batch_idx)
+        out = self.cached_forward(super().training_step, batch, batch_idx)
         class_loss = out["loss"]
         Q = out["q"]
         K = out["momentum_k"]
 
-        contrastive_loss = mocov3_loss_func(
+        contrastive_loss = self.mocov3_loss_func(
             Q[0], K[1], temperature=self.temperature
-        ) + mocov3_loss_func(Q[1], K[0], temperature=self.temperature)
+        ) + self.mocov3_loss_func(Q[1], K[0], temperature=self.temperature)
 
         metrics = {
             "train_contrastive_loss": contrastive_loss,
         }
         self.log_dict(metrics, on_epoch=True, sync_dist=True)
 
-        return contrastive_loss + class_loss
+        return self.cached_backward(contrastive_loss + class_loss)
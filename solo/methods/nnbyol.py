@@ -25,6 +25,7 @@ import torch.nn as nn
 import torch.nn.functional as F
 from solo.losses.byol import byol_loss_func
 from solo.methods.base import BaseMomentumMethod
+from solo.utils.feature_queue import QUEUE_DTYPES, FeatureQueue
 from solo.utils.misc import gather, omegaconf_select
 from solo.utils.momentum import initialize_momentum_params
 
@@ -39,6 +40,8 @@ class NNBYOL(BaseMomentumMethod):
                 proj_hidden_dim (int): number of neurons of the hidden layers of the projector.
                 pred_hidden_dim (int): number of neurons of the hidden layers of the predictor.
                 queue_size (int): number of samples to keep in the queue.
+                queue_dtype (str): dtype of the features in the queue, either float32,
+                    float16 or bfloat16.
 
         .. note::
             NNBYOL is similar to NNSiam but the queue from which the neighbors are retrieved is
@@ -81,10 +84,15 @@ class NNBYOL(BaseMomentumMethod):
         )
 
         # queue
-        self.register_buffer("queue", torch.randn(self.queue_size, proj_output_dim))
-        self.register_buffer("queue_y", -torch.ones(self.queue_size, dtype=torch.long))
-        self.queue = F.normalize(self.queue, dim=1)
-        self.register_buffer("queue_ptr", torch.zeros(1, dtype=torch.long))
+        self.queue = FeatureQueue(
+            self.queue_size,
+            proj_output_dim,
+            dtype=QUEUE_DTYPES[cfg.method_kwargs.queue_dtype],
+            extra_fields=("y",),
+        )
+
+        # loss (optionally compiled)
+        self.byol_loss_func = self.compile_loss(byol_loss_func)
 
     @staticmethod
     def add_and_assert_specific_cfg(cfg: omegaconf.DictConfig) -> omegaconf.DictConfig:
@@ -104,6 +112,10 @@ class NNBYOL(BaseMomentumMethod):
         assert not omegaconf.OmegaConf.is_missing(cfg, "method_kwargs.pred_hidden_dim")
 
         cfg.method_kwargs.queue_size = omegaconf_select(cfg, "method_kwargs.queue_size", 65536)
+        cfg.method_kwargs.queue_dtype = omegaconf_select(
+            cfg, "method_kwargs.queue_dtype", "float32"
+        )
+        assert cfg.method_kwargs.queue_dtype in QUEUE_DTYPES
 
         return cfg
 
@@ -145,16 +157,7 @@ class NNBYOL(BaseMomentumMethod):
         z = gather(z)
         y = gather(y)
 
-        batch_size = z.shape[0]
-
-        ptr = int(self.queue_ptr)  # type: ignore
-        assert self.queue_size % batch_size == 0
-
-        self.queue[ptr : ptr + batch_size, :] = z
-        self.queue_y[ptr : ptr + batch_size] = y  # type: ignore
-        ptr = (ptr + batch_size) % self.queue_size
-
-        self.queue_ptr[0] = ptr  # type: ignore
+        self.queue.enqueue(z, y=y)
 
     @torch.no_grad()
     def find_nn(self, z: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
@@ -168,9 +171,8 @@ class NNBYOL(BaseMomentumMethod):
                 indices and projected features of the nearest neighbors.
         """
 
-        idx = (z @ self.queue.T).max(dim=1)[1]
-        nn = self.queue[idx]
-        return idx, nn
+        out = self.queue.find_nn(z)
+        return out["indices"][:, 0], out["neighbors"][:, 0]
 
     def forward(self, X: torch.Tensor, *args, **kwargs) -> Dict[str, Any]:
         """Performs forward pass of the online backbone, projector and predictor.
@@ -231,11 +233,11 @@ class NNBYOL(BaseMomentumMethod):
         _, nn2_momentum = self.find_nn(z2_momentum)
 
         # ------- negative cosine similarity loss -------
-        neg_cos_sim = byol_loss_func(p1, nn2_momentum) + byol_loss_func(p2, nn1_momentum)
+        neg_cos_sim = self.byol_loss_func(p1, nn2_momentum) + self.byol_loss_func(p2, nn1_momentum)
 
         # compute nn accuracy
         b = targets.size(0)
-        nn_acc = (targets == self.queue_y[idx1]).sum() / b
+        nn_acc = (targets == self.queue.y[idx1]).sum() / b
 
         # dequeue and enqueue
         self.dequeue_and_enqueue(z1_momentum, targets)
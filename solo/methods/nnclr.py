@@ -25,10 +25,13 @@ import torch.nn as nn
 import torch.nn.functional as F
 from solo.losses.nnclr import nnclr_loss_func
 from solo.methods.base import BaseMethod
+from solo.utils.feature_queue import QUEUE_DTYPES, FeatureQueue
 from solo.utils.misc import gather, omegaconf_select
 
 
 class NNCLR(BaseMethod):
+    supports_grad_cache = True
+
     def __init__(self, cfg: omegaconf.DictConfig):
         """Implements NNCLR (https://arxiv.org/abs/2104.14548).
 
@@ -39,6 +42,8 @@ class NNCLR(BaseMethod):
                 pred_hidden_dim (int): number of neurons in the hidden layers of the predictor.
                 temperature (float): temperature for the softmax in the contrastive loss.
                 queue_size (int): number of samples to keep in the queue.
+                queue_dtype (str): dtype of the features in the queue, either float32,
+                    float16 or bfloat16.
         """
         super().__init__(cfg)
 
@@ -70,10 +75,15 @@ class NNCLR(BaseMethod):
         )
 
         # queue
-        self.register_buffer("queue", torch.randn(self.queue_size, proj_output_dim))
-        self.register_buffer("queue_y", -torch.ones(self.queue_size, dtype=torch.long))
-        self.queue = F.normalize(self.queue, dim=1)
-        self.register_buffer("queue_ptr", torch.zeros(1, dtype=torch.long))
+        self.queue = FeatureQueue(
+            self.queue_size,
+            proj_output_dim,
+            dtype=QUEUE_DTYPES[cfg.method_kwargs.queue_dtype],
+            extra_fields=("y",),
+        )
+
+        # loss (optionally compiled)
+        self.nnclr_loss_func = self.compile_loss(nnclr_loss_func)
 
     @staticmethod
     def add_and_assert_specific_cfg(cfg: omegaconf.DictConfig) -> omegaconf.DictConfig:
@@ -94,6 +104,10 @@ class NNCLR(BaseMethod):
         assert not omegaconf.OmegaConf.is_missing(cfg, "method_kwargs.temperature")
 
         cfg.method_kwargs.queue_size = omegaconf_select(cfg, "method_kwargs.queue_size", 65536)
+        cfg.method_kwargs.queue_dtype = omegaconf_select(
+            cfg, "method_kwargs.queue_dtype", "float32"
+        )
+        assert cfg.method_kwargs.queue_dtype in QUEUE_DTYPES
 
         return cfg
 
@@ -124,16 +138,7 @@ class NNCLR(BaseMethod):
         z = gather(z)
         y = gather(y)
 
-        batch_size = z.shape[0]
-
-        ptr = int(self.queue_ptr)  # type: ignore
-        assert self.queue_size % batch_size == 0
-
-        self.queue[ptr : ptr + batch_size, :] = z
-        self.queue_y[ptr : ptr + batch_size] = y  # type: ignore
-        ptr = (ptr + batch_size) % self.queue_size
-
-        self.queue_ptr[0] = ptr  # type: ignore
+        self.queue.enqueue(z, y=y)
 
     @torch.no_grad()
     def find_nn(self, z: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
@@ -147,9 +152,8 @@ class NNCLR(BaseMethod):
                 indices and projected features of the nearest neighbors.
         """
 
-        idx = (z @ self.queue.T).max(dim=1)[1]
-        nn = self.queue[idx]
-        return idx, nn
+        out = self.queue.find_nn(z)
+        return out["indices"][:, 0], out["neighbors"][:, 0]
 
     def forward(self, X: torch.Tensor) -> Dict[str, Any]:
         """Performs the forward pass of the backbone, the projector and the predictor.
@@ -184,7 +188,7 @@ class NNCLR(BaseMethod):
 
         targets = batch[-1]
 
-        out = super().training_step(batch, batch_idx)
+        out = self.cached_forward(super().training_step, batch, batch_idx)
         class_loss = out["loss"]
         z1, z2 = out["z"]
         p1, p2 = out["p"]
@@ -195,13 +199,13 @@ class NNCLR(BaseMethod):
 
         # ------- contrastive loss -------
         nnclr_loss = (
-            nnclr_loss_func(nn1, p2, temperature=self.temperature) / 2
-            + nnclr_loss_func(nn2, p1, temperature=self.temperature) / 2
+            self.nnclr_loss_func(nn1, p2, temperature=self.temperature) / 2
+            + self.nnclr_loss_func(nn2, p1, temperature=self.temperature) / 2
         )
 
         # compute nn accuracy
         b = targets.size(0)
-        nn_acc = (targets == self.queue_y[idx1]).sum() / b
+        nn_acc = (targets == self.queue.y[idx1]).sum() / b
 
         # dequeue and enqueue
         self.dequeue_and_enqueue(z1, targets)
@@ -212,4 +216,4 @@ class NNCLR(BaseMethod):
         }
         self.log_dict(metrics, on_epoch=True, sync_dist=True)
 
-        return nnclr_loss + class_loss
+        return self.cached_backward(nnclr_loss + class_loss)
@@ -25,6 +25,7 @@ import torch.nn as nn
 import torch.nn.functional as F
 from solo.losses.simsiam import simsiam_loss_func
 from solo.methods.base import BaseMethod
+from solo.utils.feature_queue import QUEUE_DTYPES, FeatureQueue
 from solo.utils.misc import gather, omegaconf_select
 
 
@@ -38,6 +39,8 @@ class NNSiam(BaseMethod):
                 proj_hidden_dim (int): number of neurons of the hidden layers of the projector.
                 pred_hidden_dim (int): number of neurons of the hidden layers of the predictor.
                 queue_size (int): number of samples to keep in the queue.
+                queue_dtype (str): dtype of the features in the queue, either float32,
+                    float16 or bfloat16.
         """
 
         super().__init__(cfg)
@@ -70,10 +73,15 @@ class NNSiam(BaseMethod):
         )
 
         # queue
-        self.register_buffer("queue", torch.randn(self.queue_size, proj_output_dim))
-        self.register_buffer("queue_y", -torch.ones(self.queue_size, dtype=torch.long))
-        self.queue = F.normalize(self.queue, dim=1)
-        self.register_buffer("queue_ptr", torch.zeros(1, dtype=torch.long))
+        self.queue = FeatureQueue(
+            self.queue_size,
+            proj_output_dim,
+            dtype=QUEUE_DTYPES[cfg.method_kwargs.queue_dtype],
+            extra_fields=("y",),
+        )
+
+        # loss (optionally compiled)
+        self.simsiam_loss_func = self.compile_loss(simsiam_loss_func)
 
     @staticmethod
     def add_and_assert_specific_cfg(cfg: omegaconf.DictConfig) -> omegaconf.DictConfig:
@@ -93,6 +101,10 @@ class NNSiam(BaseMethod):
         assert not omegaconf.OmegaConf.is_missing(cfg, "method_kwargs.pred_hidden_dim")
 
         cfg.method_kwargs.queue_size = omegaconf_select(cfg, "method_kwargs.queue_size", 65536)
+        cfg.method_kwargs.queue_dtype = omegaconf_select(
+            cfg, "method_kwargs.queue_dtype", "float32"
+        )
+        assert cfg.method_kwargs.queue_dtype in QUEUE_DTYPES
 
         return cfg
 
@@ -123,16 +135,7 @@ class NNSiam(BaseMethod):
         z = gather(z)
         y = gather(y)
 
-        batch_size = z.shape[0]
-
-        ptr = int(self.queue_ptr)  # type: ignore
-        assert self.queue_size % batch_size == 0
-
-        self.queue[ptr : ptr + batch_size, :] = z
-        self.queue_y[ptr : ptr + batch_size] = y  # type: ignore
-        ptr = (ptr + batch_size) % self.queue_size
-
-        self.queue_ptr[0] = ptr  # type: ignore
+        self.queue.enqueue(z, y=y)
 
     @torch.no_grad()
     def find_nn(self, z: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
@@ -146,9 +149,8 @@ class NNSiam(BaseMethod):
                 indices and projected features of the nearest neighbors.
         """
 
-        idx = (z @ self.queue.T).max(dim=1)[1]
-        nn = self.queue[idx]
-        return idx, nn
+        out = self.queue.find_nn(z)
+        return out["indices"][:, 0], out["neighbors"][:, 0]
 
     def forward(self, X: torch.Tensor) -> Dict[str, Any]:
         """Performs the forward pass of the backbone, the projector and the predictor.
@@ -193,11 +195,11 @@ class NNSiam(BaseMethod):
         _, nn2 = self.find_nn(z2)
 
         # ------- negative cosine similarity loss -------
-        neg_cos_sim = simsiam_loss_func(p1, nn2) / 2 + simsiam_loss_func(p2, nn1) / 2
+        neg_cos_sim = self.simsiam_loss_func(p1, nn2) / 2 + self.simsiam_loss_func(p2, nn1) / 2
 
         # compute nn accuracy
         b = targets.size(0)
-        nn_acc = (targets == self.queue_y[idx1]).sum() / b
+        nn_acc = (targets == self.queue.y[idx1]).sum() / b
 
         # dequeue and enqueue
         self.dequeue_and_enqueue(z1, targets)
@@ -25,6 +25,7 @@ import torch.nn as nn
 import torch.nn.functional as F
 from solo.losses.ressl import ressl_loss_func
 from solo.methods.base import BaseMomentumMethod
+from solo.utils.feature_queue import QUEUE_DTYPES, FeatureQueue
 from solo.utils.misc import gather, omegaconf_select
 from solo.utils.momentum import initialize_momentum_params
 
@@ -40,6 +41,9 @@ class ReSSL(BaseMomentumMethod):
                 pred_hidden_dim (int): number of neurons of the hidden layers of the predictor.
                 temperature_q (float): temperature for the contrastive augmentations.
                 temperature_k (float): temperature for the weak augmentation.
+                queue_size (int): number of samples to keep in the queue.
+                queue_dtype (str): dtype of the features in the queue, either float32,
+                    float16 or bfloat16.
         """
 
         super().__init__(cfg)
@@ -67,9 +71,13 @@ class ReSSL(BaseMomentumMethod):
         initialize_momentum_params(self.projector, self.momentum_projector)
 
         # queue
-        self.register_buffer("queue", torch.randn(self.queue_size, proj_output_dim))
-        self.queue = F.normalize(self.queue, dim=1)
-        self.register_buffer("queue_ptr", torch.zeros(1, dtype=torch.long))
+        self.queue = FeatureQueue(
+            self.queue_size, proj_output_dim, dtype=QUEUE_DTYPES[cfg.method_kwargs.queue_dtype]
+        )
+        self.keys_to_enqueue = None
+
+        # loss (optionally compiled)
+        self.ressl_loss_func = self.compile_loss(ressl_loss_func)
 
     @staticmethod
     def add_and_assert_specific_cfg(cfg: omegaconf.DictConfig) -> omegaconf.DictConfig:
@@ -90,6 +98,10 @@ class ReSSL(BaseMomentumMethod):
         assert not omegaconf.OmegaConf.is_missing(cfg, "method_kwargs.temperature_k")
 
         cfg.method_kwargs.queue_size = omegaconf_select(cfg, "method_kwargs.queue_size", 65536)
+        cfg.method_kwargs.queue_dtype = omegaconf_select(
+            cfg, "method_kwargs.queue_dtype", "float32"
+        )
+        assert cfg.method_kwargs.queue_dtype in QUEUE_DTYPES
 
         return cfg
 
@@ -126,16 +138,7 @@ class ReSSL(BaseMomentumMethod):
         """
 
         k = gather(k)
-
-        batch_size = k.shape[0]
-
-        ptr = int(self.queue_ptr)  # type: ignore
-        assert self.queue_size % batch_size == 0
-
-        self.queue[ptr : ptr + batch_size, :] = k
-        ptr = (ptr + batch_size) % self.queue_size
-
-        self.queue_ptr[0] = ptr  # type: ignore
+        self.queue.enqueue(k)
 
     def forward(self, X: torch.Tensor) -> Dict[str, Any]:
         """Performs forward pass of the online backbone, projector and predictor.
@@ -186,12 +189,27 @@ class ReSSL(BaseMomentumMethod):
         _, k = out["momentum_z"]
 
         # ------- contrastive loss -------
-        queue = self.queue.clone().detach()
-        ressl_loss = ressl_loss_func(q, k, queue, self.temperature_q, self.temperature_k)
+        queue = self.queue.get(q.dtype)
+        ressl_loss = self.ressl_loss_func(q, k, queue, self.temperature_q, self.temperature_k)
 
         self.log("train_ressl_loss", ressl_loss, on_epoch=True, sync_dist=True)
 
-        # dequeue and enqueue
-        self.dequeue_and_enqueue(k)
+        # the loss holds a view of the queue, so it is only updated after the backward pass
+        self.keys_to_enqueue = k.detach()
 
         return ressl_loss + class_loss
+
+    def on_train_batch_end(self, outputs: Dict[str, Any], batch: Sequence[Any], batch_idx: int):
+        """Performs the momentum update and adds the keys of the current batch to the queue.
+
+        Args:
+            outputs (Dict[str, Any]): the outputs of the training step.
+            batch (Sequence[Any]): a batch of data in the format of [img_indexes, [X], Y], where
+                [X] is a list of size self.num_crops containing batches of images.
+            batch_idx (int): index of the batch.
+        """
+
+        super().on_train_batch_end(outputs, batch, batch_idx)
+        if self.keys_to_enqueue is not None:
+            self.dequeue_and_enqueue(self.keys_to_enqueue)
+            self.keys_to_enqueue = None
@@ -17,16 +17,19 @@
 # OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 # DEALINGS IN THE SOFTWARE.
 
-from typing import Any, Dict, List, Sequence
+from typing import Any, Dict, List, Optional, Sequence
 
 import omegaconf
 import torch
 import torch.nn as nn
 from solo.losses.simclr import simclr_loss_func
 from solo.methods.base import BaseMethod
+from solo.utils.misc import omegaconf_select
 
 
 class SimCLR(BaseMethod):
+    supports_grad_cache = True
+
     def __init__(self, cfg: omegaconf.DictConfig):
         """Implements SimCLR (https://arxiv.org/abs/2002.05709).
 
@@ -35,11 +38,15 @@ class SimCLR(BaseMethod):
                 proj_output_dim (int): number of dimensions of the projected features.
                 proj_hidden_dim (int): number of neurons in the hidden layers of the projector.
                 temperature (float): temperature for the softmax in the contrastive loss.
+                loss_chunk_size (Optional[int]): number of rows of the similarity matrix computed
+                    at once by the contrastive loss. Chunks are recomputed in the backward pass,
+                    trading compute for memory. Defaults to None (whole matrix at once).
         """
 
         super().__init__(cfg)
 
         self.temperature: float = cfg.method_kwargs.temperature
+        self.loss_chunk_size: Optional[int] = cfg.method_kwargs.loss_chunk_size
 
         proj_hidden_dim: int = cfg.method_kwargs.proj_hidden_dim
         proj_output_dim: int = cfg.method_kwargs.proj_output_dim
@@ -51,6 +58,9 @@ class SimCLR(BaseMethod):
             nn.Linear(proj_hidden_dim, proj_output_dim),
         )
 
+        # loss (optionally compiled)
+        self.simclr_loss_func = self.compile_loss(simclr_loss_func)
+
     @staticmethod
     def add_and_assert_specific_cfg(cfg: omegaconf.DictConfig) -> omegaconf.DictConfig:
         """Adds method specific default values/checks for config.
@@ -68,6 +78,11 @@ class SimCLR(BaseMethod):
         assert not omegaconf.OmegaConf.is_missing(cfg, "method_kwargs.proj_hidden_dim")
         assert not omegaconf.OmegaConf.is_missing(cfg, "method_kwargs.temperature")
 
+        cfg.method_kwargs.loss_chunk_size = omegaconf_select(
+            cfg, "method_kwargs.loss_chunk_size", None
+        )
+        assert cfg.method_kwargs.loss_chunk_size is None or cfg.method_kwargs.loss_chunk_size > 0
+
         return cfg
 
     @property
@@ -128,7 +143,7 @@ class SimCLR(BaseMethod):
 
         indexes = batch[0]
 
-        out = super().training_step(batch, batch_idx)
+        out = self.cached_forward(super().training_step, batch, batch_idx)
         class_loss = out["loss"]
         z = torch.cat(out["z"])
 
@@ -136,12 +151,13 @@ class SimCLR(BaseMethod):
         n_augs = self.num_large_crops + self.num_small_crops
         indexes = indexes.repeat(n_augs)
 
-        nce_loss = simclr_loss_func(
+        nce_loss = self.simclr_loss_func(
             z,
             indexes=indexes,
             temperature=self.temperature,
+            chunk_size=self.loss_chunk_size,
         )
 
         self.log("train_nce_loss", nce_loss, on_epoch=True, sync_dist=True)
 
-        return nce_loss + class_loss
+        return self.cached_backward(nce_loss + class_loss)
@@ -17,7 +17,7 @@
 # OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 # DEALINGS IN THE SOFTWARE.
 
-from typing import Any, Dict, List, Sequence
+from typing import Any, Dict, List, Optional, Sequence
 
 import omegaconf
 import torch
@@ -25,6 +25,7 @@ import torch.nn as nn
 import torch.nn.functional as F
 from solo.losses.swav import swav_loss_func
 from solo.methods.base import BaseMethod
+from solo.utils.feature_queue import QUEUE_DTYPES, FeatureQueue
 from solo.utils.misc import omegaconf_select
 from solo.utils.sinkhorn_knopp import SinkhornKnopp
 
@@ -40,8 +41,19 @@ class SwAV(BaseMethod):
                 num_prototypes (int): number of prototypes.
                 sk_iters (int): number of iterations for the sinkhorn-knopp algorithm.
                 sk_epsilon (float): weight for the entropy regularization term.
+                sk_log_domain (bool): whether to run sinkhorn-knopp in the log domain, which
+                    does not overflow for small epsilon or half precision.
+                sk_tol (Optional[float]): stops sinkhorn-knopp before sk_iters iterations once
+                    the prototype marginals are within sk_tol of their target.
                 temperature (float): temperature for the softmax normalization.
                 queue_size (int): number of samples to hold in the queue.
+                queue_dtype (str): dtype of the features in the queue, either float32,
+                    float16 or bfloat16.
+                queue_scores_staleness (int): number of training steps during which the
+                    prototype scores of the queued features are reused instead of recomputed.
+                    Scores of new features are taken from the forward pass and the scores of the
+                    whole queue are refreshed every queue_scores_staleness steps. If 0, scores
+                    are recomputed every step.
                 epoch_queue_starts (int): epochs the queue starts.
                 freeze_prototypes_epochs (int): number of epochs during which
                     the prototypes are frozen.
@@ -52,14 +64,19 @@ class SwAV(BaseMethod):
         self.proj_output_dim: int = cfg.method_kwargs.proj_output_dim
         self.sk_iters: int = cfg.method_kwargs.sk_iters
         self.sk_epsilon: float = cfg.method_kwargs.sk_epsilon
+        self.sk_log_domain: bool = cfg.method_kwargs.sk_log_domain
+        self.sk_tol: Optional[float] = cfg.method_kwargs.sk_tol
         self.temperature: float = cfg.method_kwargs.temperature
         self.queue_size: int = cfg.method_kwargs.queue_size
+        self.queue_dtype = QUEUE_DTYPES[cfg.method_kwargs.queue_dtype]
+        self.queue_scores_staleness: int = cfg.method_kwargs.queue_scores_staleness
         self.epoch_queue_starts: int = cfg.method_kwargs.epoch_queue_starts
         self.freeze_prototypes_epochs: int = cfg.method_kwargs.freeze_prototypes_epochs
 
         proj_hidden_dim: int = cfg.method_kwargs.proj_hidden_dim
         proj_output_dim: int = cfg.method_kwargs.proj_output_dim
         num_prototypes: int = cfg.method_kwargs.num_prototypes
+        self.num_prototypes = num_prototypes
 
         # projector
         self.projector = nn.Sequential(
@@ -76,6 +93,12 @@ class SwAV(BaseMethod):
         self.prototypes.weight_g.data.fill_(1)  # type: ignore
         self.prototypes.weight_g.requires_grad = False
 
+        # loss (optionally compiled)
+        self.swav_loss_func = self.compile_loss(swav_loss_func)
+
+        # state of the queue of a loaded checkpoint, restored once the queue is created
+        self.queue_state: Dict[str, torch.Tensor] = {}
+
     @staticmethod
     def add_and_assert_specific_cfg(cfg: omegaconf.DictConfig) -> omegaconf.DictConfig:
         """Adds method specific default values/checks for config.
@@ -94,6 +117,14 @@ class SwAV(BaseMethod):
         assert not omegaconf.OmegaConf.is_missing(cfg, "method_kwargs.temperature")
 
         cfg.method_kwargs.queue_size = omegaconf_select(cfg, "method_kwargs.queue_size", 65536)
+        cfg.method_kwargs.queue_dtype = omegaconf_select(
+            cfg, "method_kwargs.queue_dtype", "float32"
+        )
+        cfg.method_kwargs.queue_scores_staleness = omegaconf_select(
+            cfg, "method_kwargs.queue_scores_staleness", 0
+        )
+        assert cfg.method_kwargs.queue_dtype in QUEUE_DTYPES
+        assert cfg.method_kwargs.queue_scores_staleness >= 0
         cfg.method_kwargs.num_prototypes = omegaconf_select(
             cfg,
             "method_kwargs.num_prototypes",
@@ -101,6 +132,10 @@ class SwAV(BaseMethod):
         )
         cfg.method_kwargs.sk_epsilon = omegaconf_select(cfg, "method_kwargs.sk_epsilon", 0.05)
         cfg.method_kwargs.sk_iters = omegaconf_select(cfg, "method_kwargs.sk_iters", 3)
+        cfg.method_kwargs.sk_log_domain = omegaconf_select(
+            cfg, "method_kwargs.sk_log_domain", False
+        )
+        cfg.method_kwargs.sk_tol = omegaconf_select(cfg, "method_kwargs.sk_tol", None)
         cfg.method_kwargs.freeze_prototypes_epochs = omegaconf_select(
             cfg,
             "method_kwargs.freeze_prototypes_epochs",
@@ -132,18 +167,59 @@ class SwAV(BaseMethod):
         """Gets the world size and sets it in the sinkhorn and the queue."""
         # sinkhorn-knopp needs the world size
         world_size = self.trainer.world_size if self.trainer else 1
-        self.sk = SinkhornKnopp(self.sk_iters, self.sk_epsilon, world_size)
+        self.sk = SinkhornKnopp(
+            self.sk_iters,
+            self.sk_epsilon,
+            world_size,
+            log_domain=self.sk_log_domain,
+            tol=self.sk_tol,
+        )
         # queue also needs the world size
         if self.queue_size > 0:
-            self.register_buffer(
-                "queue",
-                torch.zeros(
-                    2,
+            self.queue = FeatureQueue(
+                self.queue_size // world_size,
+                self.proj_output_dim,
+                num_views=self.num_large_crops,
+                dtype=self.queue_dtype,
+            ).to(self.device)
+            self.queue.features.zero_()
+            # queues of a different size (e.g. another world size) are not restored
+            if self.queue_state.get("features", torch.empty(0)).shape == self.queue.features.shape:
+                self.queue.features.copy_(self.queue_state["features"])
+                if "ptr" in self.queue_state:
+                    self.queue.ptr.copy_(self.queue_state["ptr"])
+            self.queue_state = {}
+
+            # cached prototype scores of the queued features
+            if self.queue_scores_staleness > 0:
+                self.score_queue = FeatureQueue(
                     self.queue_size // world_size,
-                    self.proj_output_dim,
-                    device=self.device,
-                ),
-            )
+                    self.num_prototypes,
+                    num_views=self.num_large_crops,
+                ).to(self.device)
+                self.score_queue.features.zero_()
+                # forces a refresh the first time the queue is used
+                self.steps_since_scores_refresh = self.queue_scores_staleness
+
+    def on_load_checkpoint(self, checkpoint: Dict[str, Any]):
+        """Sets aside the queue of the checkpoint, which is only restored in on_train_start
+        because the queue is created there. The cached prototype scores are not restored and
+        are recomputed the first time the queue is used.
+
+        Args:
+            checkpoint (Dict[str, Any]): checkpoint being loaded.
+        """
+
+        super().on_load_checkpoint(checkpoint)
+
+        state_dict = checkpoint["state_dict"]
+        # checkpoints saved before the queue was a FeatureQueue only hold its features
+        if "queue" in state_dict:
+            state_dict["queue.features"] = state_dict.pop("queue")
+        for key in [k for k in state_dict if k.startswith(("queue.", "score_queue."))]:
+            value = state_dict.pop(key)
+            if key.startswith("queue."):
+                self.queue_state[key[len("queue.") :]] = value
 
     def forward(self, X: torch.Tensor) -> Dict[str, Any]:
         """Performs the forward pass of the backbone, the projector and the prototypes.
@@ -195,14 +271,29 @@ class SwAV(BaseMethod):
         """
 
         bs = preds[0].size(0)
+        use_queue = self.queue_size > 0 and self.current_epoch >= self.epoch_queue_starts
+        use_cached_scores = use_queue and self.queue_scores_staleness > 0
+        if use_cached_scores:
+            if self.steps_since_scores_refresh >= self.queue_scores_staleness:
+                queue = self.queue.get(preds[0].dtype)
+                for i in range(len(preds)):
+                    self.score_queue.features[i].copy_(self.prototypes(queue[i]))
+                self.steps_since_scores_refresh = 0
+            self.steps_since_scores_refresh += 1
+
         assignments = []
+        self.sk_iters_done, self.sk_time = 0, 0.0
         for i, p in enumerate(preds):
             # optionally use the queue
-            if self.queue_size > 0 and self.current_epoch >= self.epoch_queue_starts:
-                p_queue = self.prototypes(self.queue[i])  # type: ignore
+            if use_cached_scores:
+                p = torch.cat((p, self.score_queue.get(p.dtype)[i]))
+            elif use_queue:
+                p_queue = self.prototypes(self.queue.get(p.dtype)[i])
                 p = torch.cat((p, p_queue))
             # compute assignments with sinkhorn-knopp
             assignments.append(self.sk(p)[:bs])
+            self.sk_iters_done += self.sk.last_num_iters
+            self.sk_time += self.sk.last_time
         return assignments
 
     def training_step(self, batch: Sequence[Any], batch_idx: int) -> torch.Tensor:
@@ -223,15 +314,22 @@ class SwAV(BaseMethod):
 
         # ------- swav loss -------
         assignments = self.get_assignments(preds[: self.num_large_crops])
-        swav_loss = swav_loss_func(preds, assignments, self.temperature)
+        swav_loss = self.swav_loss_func(preds, assignments, self.temperature)
 
         # ------- update queue -------
         if self.queue_size > 0:
-            z = torch.stack(out["z"][: self.num_large_crops])
-            self.queue[:, z.size(1) :] = self.queue[:, : -z.size(1)].clone()
-            self.queue[:, : z.size(1)] = z.detach()
+            self.queue.enqueue(torch.stack(out["z"][: self.num_large_crops]))
+            if self.queue_scores_staleness > 0:
+                self.score_queue.enqueue(torch.stack(preds[: self.num_large_crops]))
 
         self.log("train_swav_loss", swav_loss, on_epoch=True, sync_dist=True)
+        # sinkhorn-knopp diagnostics of the local process, not synchronized across processes.
+        # The time is measured on the host without device synchronization
+        metrics = {
+            "train_sk_iters": self.sk_iters_done / len(assignments),
+            "train_sk_time": self.sk_time,
+        }
+        self.log_dict(metrics, on_epoch=True)
 
         return swav_loss + class_loss
 
@@ -64,6 +64,9 @@ class VIbCReg(BaseMethod):
             IterNorm(proj_output_dim, num_groups=64, T=5, dim=2) if iternorm else nn.Identity(),
         )
 
+        # loss (optionally compiled)
+        self.vibcreg_loss_func = self.compile_loss(vibcreg_loss_func)
+
     @staticmethod
     def add_and_assert_specific_cfg(cfg: omegaconf.DictConfig) -> omegaconf.DictConfig:
         """Adds method specific default values/checks for config.
@@ -142,7 +145,7 @@ class VIbCReg(BaseMethod):
         z1, z2 = out["z"]
 
         # ------- vibcreg loss -------
-        vibcreg_loss = vibcreg_loss_func(
+        vibcreg_loss = self.vibcreg_loss_func(
             z1,
             z2,
             sim_loss_weight=self.sim_loss_weight,
@@ -17,7 +17,7 @@
 # OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 # DEALINGS IN THE SOFTWARE.
 
-from typing import Any, Dict, List, Sequence
+from typing import Any, Dict, List, Optional, Sequence
 
 import omegaconf
 import torch
@@ -38,6 +38,9 @@ class VICReg(BaseMethod):
                 sim_loss_weight (float): weight of the invariance term.
                 var_loss_weight (float): weight of the variance term.
                 cov_loss_weight (float): weight of the covariance term.
+                loss_chunk_size (Optional[int]): number of columns of the DxD matrix of the loss
+                    computed at once. Chunks are recomputed in the backward pass, trading compute
+                    for memory. Defaults to None.
         """
 
         super().__init__(cfg)
@@ -45,6 +48,7 @@ class VICReg(BaseMethod):
         self.sim_loss_weight: float = cfg.method_kwargs.sim_loss_weight
         self.var_loss_weight: float = cfg.method_kwargs.var_loss_weight
         self.cov_loss_weight: float = cfg.method_kwargs.cov_loss_weight
+        self.loss_chunk_size: Optional[int] = cfg.method_kwargs.loss_chunk_size
 
         proj_hidden_dim: int = cfg.method_kwargs.proj_hidden_dim
         proj_output_dim: int = cfg.method_kwargs.proj_output_dim
@@ -60,6 +64,9 @@ class VICReg(BaseMethod):
             nn.Linear(proj_hidden_dim, proj_output_dim),
         )
 
+        # loss (optionally compiled)
+        self.vicreg_loss_func = self.compile_loss(vicreg_loss_func)
+
     @staticmethod
     def add_and_assert_specific_cfg(cfg: omegaconf.DictConfig) -> omegaconf.DictConfig:
         """Adds method specific default values/checks for config.
@@ -92,6 +99,11 @@ class VICReg(BaseMethod):
             1.0,
         )
 
+        cfg.method_kwargs.loss_chunk_size = omegaconf_select(
+            cfg, "method_kwargs.loss_chunk_size", None
+        )
+        assert cfg.method_kwargs.loss_chunk_size is None or cfg.method_kwargs.loss_chunk_size > 0
+
         return cfg
 
     @property
@@ -137,12 +149,13 @@ class VICReg(BaseMethod):
         z1, z2 = out["z"]
 
         # ------- vicreg loss -------
-        vicreg_loss = vicreg_loss_func(
+        vicreg_loss = self.vicreg_loss_func(
             z1,
             z2,
             sim_loss_weight=self.sim_loss_weight,
             var_loss_weight=self.var_loss_weight,
             cov_loss_weight=self.cov_loss_weight,
+            chunk_size=self.loss_chunk_size,
         )
 
         self.log("train_vicreg_loss", vicreg_loss, on_epoch=True, sync_dist=True)
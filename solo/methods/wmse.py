@@ -62,6 +62,9 @@ class WMSE(BaseMethod):
 
         self.whitening = Whitening2d(proj_output_dim, eps=whitening_eps)
 
+        # loss (optionally compiled)
+        self.wmse_loss_func = self.compile_loss(wmse_loss_func)
+
     @staticmethod
     def add_and_assert_specific_cfg(cfg: omegaconf.DictConfig) -> omegaconf.DictConfig:
         """Adds method specific default values/checks for config.
@@ -136,18 +139,18 @@ class WMSE(BaseMethod):
 
         # ------- wmse loss -------
         bs = self.batch_size
+        v = v[: self.num_large_crops * bs].view(self.num_large_crops, bs, -1)
         num_losses, wmse_loss = 0, 0
         for _ in range(self.whitening_iters):
-            z = torch.empty_like(v)
-            perm = torch.randperm(bs).view(-1, self.whitening_size)
-            for idx in perm:
-                for i in range(self.num_large_crops):
-                    z[idx + i * bs] = self.whitening(v[idx + i * bs]).type_as(z)
+            # whiten the slices of all crops at once as a (crops x slices) x whitening_size x D
+            # tensor. All crops are permuted in the same way, so pairs of views stay aligned and
+            # the loss, which averages over samples, is unchanged
+            perm = torch.randperm(bs, device=v.device)
+            z = self.whitening(v[:, perm].reshape(-1, self.whitening_size, v.size(-1)))
+            z = z.view(self.num_large_crops, bs, -1).type_as(v)
             for i in range(self.num_large_crops - 1):
                 for j in range(i + 1, self.num_large_crops):
-                    x0 = z[i * bs : (i + 1) * bs]
-                    x1 = z[j * bs : (j + 1) * bs]
-                    wmse_loss += wmse_loss_func(x0, x1)
+                    wmse_loss += self.wmse_loss_func(z[i], z[j])
                     num_losses += 1
         wmse_loss /= num_losses
 
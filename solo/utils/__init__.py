@@ -19,23 +19,35 @@
 
 from solo.utils import (
     checkpointer,
+    comm_stats,
+    compiler,
+    feature_queue,
+    feature_store,
     knn,
     lars,
     metrics,
     misc,
     momentum,
+    nn_search,
     positional_encodings,
+    profiler,
     sinkhorn_knopp,
 )
 
 __all__ = [
     "checkpointer",
+    "comm_stats",
+    "compiler",
+    "feature_queue",
+    "feature_store",
     "knn",
     "misc",
     "lars",
     "metrics",
     "momentum",
+    "nn_search",
     "positional_encodings",
+    "profiler",
     "sinkhorn_knopp",
 ]
 
@@ -37,7 +37,7 @@ from omegaconf import DictConfig
 from tqdm import tqdm
 
 import wandb
-from solo.utils.misc import gather, omegaconf_select
+from solo.utils.misc import gather, inference_autocast, omegaconf_select
 
 
 class AutoUMAP(Callback):
@@ -242,6 +242,7 @@ class OfflineUMAP:
         model: nn.Module,
         dataloader: torch.utils.data.DataLoader,
         plot_path: str,
+        bf16: bool = False,
     ):
         """Produces a UMAP visualization by forwarding all data of the
         first validation dataloader through the model.
@@ -252,6 +253,7 @@ class OfflineUMAP:
             model (nn.Module): current model.
             dataloader (torch.utils.data.Dataloader): current dataloader containing data.
             plot_path (str): path to save the figure.
+            bf16 (bool, optional): whether to use bf16 autocast. Defaults to False.
         """
 
         data = []
@@ -264,13 +266,24 @@ class OfflineUMAP:
                 x = x.to(device, non_blocking=True)
                 y = y.to(device, non_blocking=True)
 
-                feats = model(x)
-                data.append(feats.cpu())
+                with inference_autocast(torch.device(device), bf16):
+                    feats = model(x)
+                data.append(feats.float().cpu())
                 Y.append(y.cpu())
         model.train()
 
-        data = torch.cat(data, dim=0).numpy()
-        Y = torch.cat(Y, dim=0)
+        self.plot_features(torch.cat(data, dim=0), torch.cat(Y, dim=0), plot_path)
+
+    def plot_features(self, data: torch.Tensor, Y: torch.Tensor, plot_path: str):
+        """Produces a UMAP visualization of already extracted features.
+
+        Args:
+            data (torch.Tensor): features of the samples.
+            Y (torch.Tensor): labels of the samples.
+            plot_path (str): path to save the figure.
+        """
+
+        data = data.float().numpy()
         num_classes = len(torch.unique(Y))
         Y = Y.numpy()
 
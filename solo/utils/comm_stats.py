@@ -0,0 +1,308 @@
+# Copyright 2023 solo-learn development team.
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the
+# Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies
+# or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+# PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE
+# FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+from functools import wraps
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+import lightning.pytorch as pl
+import torch
+import torch.distributed as dist
+from lightning.pytorch.callbacks import Callback
+from omegaconf import DictConfig
+
+from solo.utils.misc import get_rank, omegaconf_select
+
+# collectives that are instrumented and the argument holding the tensors whose bytes are counted
+COLLECTIVES: Dict[str, Tuple[int, Optional[str]]] = {
+    "all_reduce": (0, "tensor"),
+    "broadcast": (0, "tensor"),
+    "all_gather": (0, "tensor_list"),
+    "all_gather_into_tensor": (0, "output_tensor"),
+    "reduce_scatter": (1, "input_list"),
+    "reduce_scatter_tensor": (1, "input"),
+    "barrier": (-1, None),
+}
+
+# gather helpers of solo.utils.misc, skipped when looking for the code that issued a collective
+_PLUMBING = {
+    "<lambda>",
+    "__init__",
+    "_gather_backward",
+    "_padded_all_gather",
+    "_run_collective",
+    "all_gather_into_tensor",
+    "backward",
+    "concat_all_gather_no_grad",
+    "fallback",
+    "forward",
+    "gather",
+    "gather_async",
+    "gather_sizes",
+    "gathered_matmul",
+    "reduce_scatter_tensor",
+    "wait",
+}
+
+
+def _nbytes(x: Any) -> int:
+    if isinstance(x, torch.Tensor):
+        return x.numel() * x.element_size()
+    if isinstance(x, (list, tuple)):
+        return sum(_nbytes(t) for t in x)
+    return 0
+
+
+def _call_site() -> str:
+    """Finds the code that issued a collective, skipping torch.distributed, this module and the
+    gather helpers of solo.utils.misc.
+
+    Returns:
+        str: call site as "module:line". Gathers in the backward pass have no Python caller
+            and are attributed to the outermost gather helper.
+    """
+
+    frame = sys._getframe(2)
+    fallback = None
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "")
+        if module != __name__ and not module.startswith("torch."):
+            site = f"{module}:{frame.f_lineno}"
+            if module != "solo.utils.misc" or frame.f_code.co_name not in _PLUMBING:
+                return site
+            fallback = site
+        frame = frame.f_back
+    return fallback or "unknown"
+
+
+class CommStats:
+    def __init__(self, sync_cuda: bool = False):
+        """Records the bytes moved, number of calls and wall time of every collective issued
+        through torch.distributed, per call site. Collectives are only wrapped between enable
+        and disable, so there is no overhead otherwise.
+
+        The time of asynchronous collectives is the time to launch them. CUDA collectives are
+        also asynchronous with respect to the host, so their time is only meaningful with
+        sync_cuda, which synchronizes the device before and after each collective.
+
+        Args:
+            sync_cuda (bool, optional): whether to synchronize CUDA around each collective.
+                Defaults to False.
+        """
+
+        self.sync_cuda = sync_cuda
+        self.originals: Dict[str, Callable] = {}
+        self.records: Dict[Tuple[str, str], List[float]] = defaultdict(lambda: [0, 0, 0.0])
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.originals)
+
+    def _wrap(self, name: str, fn: Callable) -> Callable:
+        index, keyword = COLLECTIVES[name]
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if keyword in kwargs:
+                nbytes = _nbytes(kwargs[keyword])
+            else:
+                nbytes = _nbytes(args[index]) if 0 <= index < len(args) else 0
+
+            sync = self.sync_cuda and torch.cuda.is_available()
+            if sync:
+                torch.cuda.synchronize()
+            start = time.perf_counter()
+            out = fn(*args, **kwargs)
+            if sync:
+                torch.cuda.synchronize()
+            elapsed = time.perf_counter() - start
+
+            record = self.records[(name, _call_site())]
+            record[0] += 1
+            record[1] += nbytes
+            record[2] += elapsed
+            return out
+
+        return wrapper
+
+    def enable(self):
+        """Wraps the collectives of torch.distributed."""
+
+        if self.enabled:
+            return
+        for name in COLLECTIVES:
+            fn = getattr(dist, name, None)
+            if fn is not None:
+                self.originals[name] = fn
+                setattr(dist, name, self._wrap(name, fn))
+
+    def disable(self):
+        """Restores the original collectives of torch.distributed."""
+
+        for name, fn in self.originals.items():
+            setattr(dist, name, fn)
+        self.originals = {}
+
+    def __enter__(self) -> "CommStats":
+        self.enable()
+        return self
+
+    def __exit__(self, *args):
+        self.disable()
+
+    def pop(self) -> Dict[str, Dict[str, Dict[str, float]]]:
+        """Returns the statistics recorded since the last call and resets them.
+
+        Returns:
+            Dict[str, Dict[str, Dict[str, float]]]: calls, bytes and time (in seconds) of each
+                collective, indexed by collective and call site.
+        """
+
+        stats = defaultdict(dict)
+        for (name, site), (calls, nbytes, elapsed) in self.records.items():
+            stats[name][site] = {"calls": calls, "bytes": nbytes, "time": elapsed}
+        self.records.clear()
+        return dict(stats)
+
+
+def merge_comm_stats(
+    total: Dict[str, Dict[str, Dict[str, float]]], stats: Dict[str, Dict[str, Dict[str, float]]]
+):
+    """Adds the statistics of stats to total in place.
+
+    Args:
+        total (Dict[str, Dict[str, Dict[str, float]]]): accumulated statistics.
+        stats (Dict[str, Dict[str, Dict[str, float]]]): statistics returned by CommStats.pop.
+    """
+
+    for name, sites in stats.items():
+        for site, values in sites.items():
+            acc = total.setdefault(name, {}).setdefault(site, {"calls": 0, "bytes": 0, "time": 0.0})
+            for k, v in values.items():
+                acc[k] += v
+
+
+class CommStatsCallback(Callback):
+    def __init__(self, logdir: Optional[Union[str, Path]] = None, sync_cuda: bool = False):
+        """Callback that records the collectives of each training step with CommStats. The totals
+        of each collective are logged every step and the statistics of each call site are
+        aggregated per epoch and optionally stored as json.
+
+        Args:
+            logdir (Optional[Union[str, Path]], optional): directory to store the per epoch
+                statistics of each process in. Defaults to None (not stored).
+            sync_cuda (bool, optional): whether to synchronize CUDA around each collective
+                so that its time is measured. Defaults to False.
+        """
+
+        super().__init__()
+
+        self.logdir = Path(logdir) if logdir is not None else None
+        self.comm_stats = CommStats(sync_cuda=sync_cuda)
+        self.epoch_stats: Dict[str, Dict[str, Dict[str, float]]] = {}
+        self.history: List[Dict[str, Any]] = []
+
+    @staticmethod
+    def add_and_assert_specific_cfg(cfg: DictConfig) -> DictConfig:
+        """Adds specific default values/checks for config.
+
+        Args:
+            cfg (omegaconf.DictConfig): DictConfig object.
+
+        Returns:
+            omegaconf.DictConfig: same as the argument, used to avoid errors.
+        """
+
+        cfg.comm_stats = omegaconf_select(cfg, "comm_stats", default={})
+        cfg.comm_stats.enabled = omegaconf_select(cfg, "comm_stats.enabled", default=False)
+        cfg.comm_stats.dir = omegaconf_select(cfg, "comm_stats.dir", default=None)
+        cfg.comm_stats.sync_cuda = omegaconf_select(cfg, "comm_stats.sync_cuda", default=False)
+
+        return cfg
+
+    def on_train_start(self, trainer: pl.Trainer, pl_module: pl.LightningModule):
+        """Starts recording the collectives.
+
+        Args:
+            trainer (pl.Trainer): pytorch lightning trainer object.
+            pl_module (pl.LightningModule): pytorch lightning module.
+        """
+
+        self.comm_stats.pop()
+        self.comm_stats.enable()
+
+    def on_train_batch_end(
+        self,
+        trainer: pl.Trainer,
+        pl_module: pl.LightningModule,
+        outputs: Any,
+        batch: Any,
+        batch_idx: int,
+    ):
+        """Logs the total calls, bytes and time of each collective of the step.
+
+        Args:
+            trainer (pl.Trainer): pytorch lightning trainer object.
+            pl_module (pl.LightningModule): pytorch lightning module.
+            outputs (Any): outputs of the training step.
+            batch (Any): the batch of data.
+            batch_idx (int): index of the batch.
+        """
+
+        stats = self.comm_stats.pop()
+        merge_comm_stats(self.epoch_stats, stats)
+
+        metrics = {}
+        for name, sites in stats.items():
+            for key in ("calls", "bytes", "time"):
+                metrics[f"comm_{name}_{key}"] = float(sum(v[key] for v in sites.values()))
+        if metrics:
+            pl_module.log_dict(metrics, on_step=True, on_epoch=False)
+
+    def on_train_epoch_end(self, trainer: pl.Trainer, pl_module: pl.LightningModule):
+        """Stores the statistics of each call site for the epoch.
+
+        Args:
+            trainer (pl.Trainer): pytorch lightning trainer object.
+            pl_module (pl.LightningModule): pytorch lightning module.
+        """
+
+        self.history.append({"epoch": trainer.current_epoch, "collectives": self.epoch_stats})
+        self.epoch_stats = {}
+
+        if self.logdir is not None:
+            os.makedirs(self.logdir, exist_ok=True)
+            path = self.logdir / f"comm_stats_rank{get_rank()}.json"
+            with open(path, "w") as f:
+                json.dump(self.history, f, indent=2)
+
+    def on_train_end(self, trainer: pl.Trainer, pl_module: pl.LightningModule):
+        """Stops recording the collectives.
+
+        Args:
+            trainer (pl.Trainer): pytorch lightning trainer object.
+            pl_module (pl.LightningModule): pytorch lightning module.
+        """
+
+        self.comm_stats.disable()
@@ -0,0 +1,142 @@
+# Copyright 2023 solo-learn development team.
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the
+# Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies
+# or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+# PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE
+# FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import logging
+import time
+from typing import Any, Callable, Dict, Optional
+
+import torch
+import torch.nn as nn
+
+try:
+    from torch._dynamo.exc import BackendCompilerFailed, TorchDynamoException
+except ImportError:
+    COMPILE_ERRORS = ()
+else:
+    COMPILE_ERRORS = (TorchDynamoException, BackendCompilerFailed)
+
+COMPILE_MODES = ["default", "reduce-overhead", "max-autotune", "max-autotune-no-cudagraphs"]
+
+
+def _shapes(args: Any) -> str:
+    """Describes the shapes of all tensors of a (possibly nested) input.
+
+    Args:
+        args (Any): tensor, list, tuple or dict of inputs.
+
+    Returns:
+        str: shapes of the tensors, e.g. "(2x3x224x224)".
+    """
+
+    if isinstance(args, torch.Tensor):
+        return "x".join(str(s) for s in args.shape)
+    if isinstance(args, dict):
+        args = list(args.values())
+    if isinstance(args, (list, tuple)):
+        return "(" + ", ".join(s for s in (_shapes(a) for a in args) if s) + ")"
+    return ""
+
+
+class CompiledFunction:
+    def __init__(
+        self,
+        fn: Callable,
+        name: str,
+        mode: str = "default",
+        backend: str = "inductor",
+        dynamic: Optional[bool] = None,
+    ):
+        """Wraps a function with torch.compile, falling back to the eager function if
+        compilation fails. Only dynamo and inductor errors trigger the fallback, errors raised
+        by the function itself are propagated. The duration of the first call for each new
+        input shape, which includes tracing and compilation, is recorded and reported.
+
+        Args:
+            fn (Callable): function or bound method to compile.
+            name (str): name used when reporting.
+            mode (str, optional): torch.compile mode. Defaults to "default".
+            backend (str, optional): torch.compile backend. Defaults to "inductor".
+            dynamic (Optional[bool], optional): whether to compile with dynamic shapes. None
+                compiles a static graph first and recompiles with dynamic shapes when the input
+                shapes change. Defaults to None.
+        """
+
+        self.fn = fn
+        self.name = name
+        self.compiled = torch.compile(fn, mode=mode, backend=backend, dynamic=dynamic)
+        self.failed = False
+        self.compile_times: Dict[str, float] = {}
+
+    def __call__(self, *args, **kwargs):
+        if self.failed:
+            return self.fn(*args, **kwargs)
+
+        shapes = _shapes(list(args) + list(kwargs.values()))
+        start = time.perf_counter()
+        try:
+            out = self.compiled(*args, **kwargs)
+        except COMPILE_ERRORS as e:
+            logging.warning(f"Compiling {self.name} failed, falling back to eager mode: {e}")
+            self.failed = True
+            return self.fn(*args, **kwargs)
+
+        if shapes not in self.compile_times:
+            self.compile_times[shapes] = time.perf_counter() - start
+            logging.info(
+                f"First call of compiled {self.name} with inputs {shapes} "
+                f"took {self.compile_times[shapes]:.2f}s"
+            )
+        return out
+
+
+def compile_module(module: nn.Module, name: str, **compile_kwargs) -> CompiledFunction:
+    """Compiles the forward of a module in place. Unlike torch.compile(module), the module is
+    not wrapped, so parameter names and checkpoints are unchanged.
+
+    Args:
+        module (nn.Module): module to compile.
+        name (str): name used when reporting.
+        **compile_kwargs: mode, backend and dynamic, see CompiledFunction.
+
+    Returns:
+        CompiledFunction: the compiled forward.
+    """
+
+    module.forward = CompiledFunction(module.forward, name, **compile_kwargs)
+    return module.forward
+
+
+def compile_report(compiled: Dict[str, CompiledFunction]) -> str:
+    """Summarizes the compilation of several compiled functions.
+
+    Args:
+        compiled (Dict[str, CompiledFunction]): compiled functions indexed by their name.
+
+    Returns:
+        str: human-readable report.
+    """
+
+    lines = []
+    for name, fn in compiled.items():
+        if fn.failed:
+            lines.append(f"{name}: failed to compile, ran in eager mode")
+        else:
+            times = ", ".join(f"{s} {t:.2f}s" for s, t in fn.compile_times.items())
+            lines.append(f"{name}: {times or 'never called'}")
+    return "torch.compile first call times (includes compilation)\n" + "\n".join(lines)
@@ -0,0 +1,174 @@
+# Copyright 2023 solo-learn development team.
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the
+# Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies
+# or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+# PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE
+# FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+from typing import Dict, Optional
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from solo.utils.nn_search import chunked_topk
+
+QUEUE_DTYPES = {
+    "float32": torch.float32,
+    "float16": torch.float16,
+    "bfloat16": torch.bfloat16,
+}
+
+
+class FeatureQueue(nn.Module):
+    def __init__(
+        self,
+        size: int,
+        feature_dim: int,
+        num_views: Optional[int] = None,
+        dtype: torch.dtype = torch.float32,
+        extra_fields: tuple = (),
+    ):
+        """Fixed-size fifo queue of features implemented as a ring buffer.
+
+        New samples overwrite the oldest ones starting at a write pointer that lives on the same
+        device as the queue, so enqueueing never synchronizes with the host. Batches of any size
+        are supported (writes wrap around the end of the buffer) and features can be stored in
+        half precision. Each extra field (e.g. labels or dataset indices) is stored as an int64
+        buffer of the same length, initialized with -1, and is accessible as an attribute.
+
+        Args:
+            size (int): number of samples in the queue.
+            feature_dim (int): number of dimensions of the features.
+            num_views (Optional[int], optional): if not None, keeps a separate queue for each
+                view and features are stored as (num_views, size, feature_dim).
+                Defaults to None.
+            dtype (torch.dtype, optional): dtype of the stored features.
+                Defaults to torch.float32.
+            extra_fields (tuple, optional): names of the extra int64 fields. Defaults to ().
+        """
+
+        super().__init__()
+
+        assert size > 0
+
+        self.size = size
+        self.extra_fields = tuple(extra_fields)
+
+        shape = (size, feature_dim) if num_views is None else (num_views, size, feature_dim)
+        self.register_buffer("features", F.normalize(torch.randn(shape), dim=-1).to(dtype))
+        for name in self.extra_fields:
+            self.register_buffer(name, -torch.ones(size, dtype=torch.long))
+        self.register_buffer("ptr", torch.zeros(1, dtype=torch.long))
+
+    def convert_legacy_state_dict(self, state_dict: Dict[str, torch.Tensor], name: str):
+        """Renames, in place, the buffers of a queue stored before FeatureQueue existed, i.e.,
+        name (features), name_ptr and name_<field> for each extra field, to the keys of this
+        module. Does nothing if the state dict does not contain a legacy queue.
+
+        Args:
+            state_dict (Dict[str, torch.Tensor]): state dict of the module holding the queue.
+            name (str): name of the queue in the module holding it.
+        """
+
+        if name not in state_dict:
+            return
+
+        state_dict[f"{name}.features"] = state_dict.pop(name)
+        ptr = state_dict.pop(f"{name}_ptr", None)
+        state_dict[f"{name}.ptr"] = ptr if ptr is not None else torch.zeros_like(self.ptr)
+        for field in self.extra_fields:
+            if f"{name}_{field}" in state_dict:
+                state_dict[f"{name}.{field}"] = state_dict.pop(f"{name}_{field}")
+
+    def get(self, dtype: Optional[torch.dtype] = None) -> torch.Tensor:
+        """Returns the features of the queue without copying them. A copy is only made when
+        dtype differs from the storage dtype.
+
+        Note that the returned tensor is a view of the queue, so it must not be used in the
+        autograd graph if the queue is updated before the backward pass.
+
+        Args:
+            dtype (Optional[torch.dtype], optional): dtype of the returned features.
+                Defaults to None (storage dtype).
+
+        Returns:
+            torch.Tensor: features of the queue.
+        """
+
+        if dtype is None or dtype == self.features.dtype:
+            return self.features
+        return self.features.to(dtype)
+
+    @torch.no_grad()
+    def enqueue(self, features: torch.Tensor, **extras: torch.Tensor):
+        """Adds new samples to the queue, overwriting the oldest ones.
+
+        Args:
+            features (torch.Tensor): batch of features of shape (batch_size, feature_dim) or
+                (num_views, batch_size, feature_dim).
+            **extras (torch.Tensor): values of the extra fields for the samples of the batch.
+        """
+
+        assert set(extras) == set(self.extra_fields)
+
+        batch_size = features.size(-2)
+        # only the last size samples survive if the batch is larger than the queue
+        offset = max(batch_size - self.size, 0)
+        if offset > 0:
+            features = features[..., offset:, :]
+            extras = {name: value[offset:] for name, value in extras.items()}
+
+        positions = self.ptr + offset + torch.arange(batch_size - offset, device=self.ptr.device)
+        positions.remainder_(self.size)
+
+        self.features.index_copy_(
+            self.features.dim() - 2, positions, features.detach().to(self.features.dtype)
+        )
+        for name, value in extras.items():
+            getattr(self, name).index_copy_(0, positions, value.to(torch.long))
+        self.ptr.add_(batch_size).remainder_(self.size)
+
+    @torch.no_grad()
+    def find_nn(
+        self,
+        z: torch.Tensor,
+        k: int = 1,
+        max_distance_matrix_size: int = int(5e7),
+        dtype: Optional[torch.dtype] = None,
+    ) -> Dict[str, torch.Tensor]:
+        """Retrieves the k nearest neighbors (largest dot product) of each sample in the queue.
+        The search is chunked over the queue (see chunked_topk), so its peak memory does not
+        depend on the size of the queue. Only supported for queues without views.
+
+        Args:
+            z (torch.Tensor): batch of features (B x D).
+            k (int, optional): number of neighbors. Defaults to 1.
+            max_distance_matrix_size (int, optional): maximum number of elements of the
+                similarity matrix computed at once. Defaults to 5e7.
+            dtype (Optional[torch.dtype], optional): dtype used to compute similarities.
+                Defaults to None (storage dtype).
+
+        Returns:
+            Dict[str, torch.Tensor]: dict with the queue indices ("indices", B x k) and the
+                features ("neighbors", B x k x D, in the dtype of z) of the neighbors, plus the
+                values of each extra field for the neighbors (B x k).
+        """
+
+        assert self.features.dim() == 2
+        _, indices = chunked_topk(z, self.features, k, max_distance_matrix_size, dtype)
+        out = {"indices": indices, "neighbors": self.features[indices].to(z.dtype)}
+        for name in self.extra_fields:
+            out[name] = getattr(self, name)[indices]
+        return out
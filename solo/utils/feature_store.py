@@ -0,0 +1,374 @@
+# Copyright 2023 solo-learn development team.
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the
+# Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies
+# or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+# PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE
+# FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import hashlib
+import json
+import os
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader, Dataset, Subset
+from tqdm import tqdm
+
+
+@lru_cache(maxsize=None)
+def hash_file(path: Union[str, Path], chunk_size: int = 1 << 20) -> str:
+    """Computes the sha1 hash of the content of a file without loading it fully in memory.
+    Results are cached so that checkpoints are only hashed once per process.
+
+    Args:
+        path (Union[str, Path]): path to the file.
+        chunk_size (int, optional): number of bytes read at a time. Defaults to 1MB.
+
+    Returns:
+        str: hex digest of the file.
+    """
+
+    sha = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+class FeatureStore:
+    def __init__(
+        self,
+        root: Union[str, Path],
+        checkpoint: Union[str, Path],
+        dataset: str,
+        transform: Any = None,
+        flush_every: int = 50,
+    ):
+        """On-disk store of extracted features so that they are computed once and reused by
+        all offline evaluations (k-NN, UMAP, ...).
+
+        Each entry is keyed by (checkpoint hash, dataset, split, transform, feature type) and
+        is composed of two memory-mapped .npy files (fp16 features and int64 labels) plus a
+        meta.json file. Features are written batch by batch, so the full feature bank never
+        needs to be in memory, and the number of written samples is periodically committed
+        to meta.json, which allows interrupted extractions to resume where they stopped.
+
+        Args:
+            root (Union[str, Path]): directory where the features are stored.
+            checkpoint (Union[str, Path]): path to the checkpoint used to extract features.
+            dataset (str): name of the dataset.
+            transform (Any, optional): transformation pipeline applied to the images. Only its
+                string representation is used to compute the key. Defaults to None.
+            flush_every (int, optional): number of batches between each commit of the
+                extraction progress. Defaults to 50.
+        """
+
+        self.root = Path(root)
+        self.checkpoint_hash = hash_file(checkpoint)
+        self.dataset = dataset
+        self.transform = repr(transform)
+        self.flush_every = flush_every
+
+        self.hits: List[str] = []
+        self.misses: List[str] = []
+
+    def key(self, split: str, feature_type: str) -> str:
+        """Computes the key of an entry of the store.
+
+        Args:
+            split (str): dataset split (e.g. train or val).
+            feature_type (str): type of feature (e.g. backbone or projector).
+
+        Returns:
+            str: hex digest identifying the entry.
+        """
+
+        key = json.dumps([self.checkpoint_hash, self.dataset, split, self.transform, feature_type])
+        return hashlib.sha1(key.encode()).hexdigest()
+
+    def path(self, split: str, feature_type: str) -> Path:
+        return self.root / f"{self.dataset}-{split}-{feature_type}-{self.key(split, feature_type)}"
+
+    def _read_meta(self, split: str, feature_type: str) -> Optional[Dict[str, Any]]:
+        meta_path = self.path(split, feature_type) / "meta.json"
+        if not meta_path.exists():
+            return None
+        with open(meta_path) as f:
+            return json.load(f)
+
+    def _write_meta(self, split: str, feature_type: str, meta: Dict[str, Any]):
+        # write to a temporary file first so that meta.json is never left half written
+        meta_path = self.path(split, feature_type) / "meta.json"
+        tmp_path = meta_path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, meta_path)
+
+    def exists(self, split: str, feature_type: str) -> bool:
+        """Checks if an entry is fully extracted.
+
+        Args:
+            split (str): dataset split.
+            feature_type (str): type of feature.
+
+        Returns:
+            bool: whether the entry is complete.
+        """
+
+        meta = self._read_meta(split, feature_type)
+        return meta is not None and meta["num_written"] == meta["num_samples"]
+
+    def load(
+        self, split: str, feature_type: str, dtype: Optional[torch.dtype] = None
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Loads features and labels of a complete entry. The returned tensors are backed by
+        the memory-mapped files, so they are only read from disk when accessed.
+
+        Args:
+            split (str): dataset split.
+            feature_type (str): type of feature.
+            dtype (Optional[torch.dtype], optional): dtype of the returned features. Converting
+                to a dtype other than the stored fp16 reads all features in memory.
+                Defaults to None (fp16, memory-mapped).
+
+        Returns:
+            Tuple[torch.Tensor, torch.Tensor]: features and labels.
+        """
+
+        assert self.exists(split, feature_type), f"{split}/{feature_type} was not extracted."
+        path = self.path(split, feature_type)
+        # copy-on-write maps are writable, as required by torch, without touching the files
+        features = torch.from_numpy(np.load(path / "features.npy", mmap_mode="c"))
+        labels = torch.from_numpy(np.load(path / "labels.npy", mmap_mode="c"))
+        if dtype is not None:
+            features = features.to(dtype)
+        return features, labels
+
+    def _open(
+        self, split: str, feature_type: str, num_samples: int, feature_dim: int
+    ) -> Tuple[np.memmap, np.memmap]:
+        """Opens the memory-mapped arrays of an entry, creating them if needed.
+
+        Returns:
+            Tuple[np.memmap, np.memmap]: features and labels.
+        """
+
+        path = self.path(split, feature_type)
+        meta = self._read_meta(split, feature_type)
+        if meta is not None and meta["num_samples"] != num_samples:
+            meta = None
+
+        if meta is None:
+            os.makedirs(path, exist_ok=True)
+            features = np.lib.format.open_memmap(
+                path / "features.npy", mode="w+", dtype=np.float16, shape=(num_samples, feature_dim)
+            )
+            labels = np.lib.format.open_memmap(
+                path / "labels.npy", mode="w+", dtype=np.int64, shape=(num_samples,)
+            )
+            meta = {
+                "checkpoint_hash": self.checkpoint_hash,
+                "dataset": self.dataset,
+                "split": split,
+                "feature_type": feature_type,
+                "transform": self.transform,
+                "num_samples": num_samples,
+                "feature_dim": feature_dim,
+                "num_written": 0,
+            }
+            self._write_meta(split, feature_type, meta)
+        else:
+            features = np.load(path / "features.npy", mmap_mode="r+")
+            labels = np.load(path / "labels.npy", mmap_mode="r+")
+
+        return features, labels
+
+    def _record(self, split: str, feature_types: Sequence[str]) -> List[str]:
+        """Records the cache hits and misses of a split and returns the missing feature types."""
+
+        missing = [ft for ft in feature_types if not self.exists(split, ft)]
+        for ft in feature_types:
+            if ft in missing:
+                self.misses.append(f"{split}/{ft}")
+            else:
+                self.hits.append(f"{split}/{ft}")
+        return missing
+
+    def extract(
+        self,
+        forward_fn: Callable[[torch.Tensor], Dict[str, torch.Tensor]],
+        dataset: Dataset,
+        split: str,
+        feature_types: Sequence[str],
+        batch_size: int = 64,
+        num_workers: int = 4,
+        device: Union[str, torch.device] = "cuda",
+    ) -> Dict[str, Tuple[torch.Tensor, torch.Tensor]]:
+        """Extracts the missing entries of a split and returns features and labels for
+        all requested feature types. Complete entries are read from disk (cache hit).
+
+        Args:
+            forward_fn (Callable[[torch.Tensor], Dict[str, torch.Tensor]]): function that
+                receives a batch of images and returns a dict with one tensor per feature type.
+            dataset (Dataset): dataset to extract features from. Must be deterministic,
+                i.e., index i must always correspond to the same sample.
+            split (str): dataset split.
+            feature_types (Sequence[str]): feature types to extract.
+            batch_size (int, optional): batch size. Defaults to 64.
+            num_workers (int, optional): number of parallel workers. Defaults to 4.
+            device (Union[str, torch.device], optional): device used for the forward.
+                Defaults to "cuda".
+
+        Returns:
+            Dict[str, Tuple[torch.Tensor, torch.Tensor]]: memory-mapped fp16 features and labels
+                per feature type.
+        """
+
+        return FeatureStore.extract_multi(
+            [self], [forward_fn], dataset, split, feature_types, batch_size, num_workers, device
+        )[0]
+
+    @staticmethod
+    def extract_multi(
+        stores: Sequence["FeatureStore"],
+        forward_fns: Sequence[Callable[[torch.Tensor], Dict[str, torch.Tensor]]],
+        dataset: Dataset,
+        split: str,
+        feature_types: Sequence[str],
+        batch_size: int = 64,
+        num_workers: int = 4,
+        device: Union[str, torch.device] = "cuda",
+    ) -> List[Dict[str, Tuple[torch.Tensor, torch.Tensor]]]:
+        """Same as extract for several stores (e.g. one per checkpoint) of the same dataset, so
+        that each batch is only loaded once for all of them. The features of each store are
+        written batch by batch and committed periodically, as in extract.
+
+        Args:
+            stores (Sequence[FeatureStore]): feature stores to fill.
+            forward_fns (Sequence[Callable[[torch.Tensor], Dict[str, torch.Tensor]]]): forward
+                function of each store, see extract.
+            dataset (Dataset): dataset to extract features from. Must be deterministic.
+            split (str): dataset split.
+            feature_types (Sequence[str]): feature types to extract.
+            batch_size (int, optional): batch size. Defaults to 64.
+            num_workers (int, optional): number of parallel workers. Defaults to 4.
+            device (Union[str, torch.device], optional): device used for the forward.
+                Defaults to "cuda".
+
+        Returns:
+            List[Dict[str, Tuple[torch.Tensor, torch.Tensor]]]: memory-mapped fp16 features and
+                labels per feature type of each store.
+        """
+
+        jobs = []
+        for store, forward_fn in zip(stores, forward_fns):
+            missing = store._record(split, feature_types)
+            if missing:
+                jobs.append((store, forward_fn, missing))
+
+        if jobs:
+            _extract(jobs, dataset, split, batch_size, num_workers, device)
+
+        return [{ft: store.load(split, ft) for ft in feature_types} for store in stores]
+
+    def _commit(self, stores: Dict[str, Tuple[np.memmap, np.memmap]], split: str, num_written: int):
+        for ft, (features, labels) in stores.items():
+            features.flush()
+            labels.flush()
+            meta = self._read_meta(split, ft)
+            meta["num_written"] = num_written
+            self._write_meta(split, ft, meta)
+
+    def report(self) -> str:
+        """Summarizes the cache hits and misses of this store.
+
+        Returns:
+            str: human-readable report.
+        """
+
+        total = len(self.hits) + len(self.misses)
+        return (
+            f"Feature store: {len(self.hits)}/{total} cache hits"
+            f" (hits: {', '.join(self.hits) or '-'}; misses: {', '.join(self.misses) or '-'})"
+        )
+
+
+@torch.no_grad()
+def _extract(
+    jobs: List[Tuple[FeatureStore, Callable[[torch.Tensor], Dict[str, torch.Tensor]], List[str]]],
+    dataset: Dataset,
+    split: str,
+    batch_size: int,
+    num_workers: int,
+    device: Union[str, torch.device],
+):
+    """Fills the missing entries of several stores in a single pass over a dataset.
+
+    Args:
+        jobs (List[Tuple[FeatureStore, Callable, List[str]]]): store, forward function and
+            missing feature types of each store.
+        dataset (Dataset): dataset to extract features from.
+        split (str): dataset split.
+        batch_size (int): batch size.
+        num_workers (int): number of parallel workers.
+        device (Union[str, torch.device]): device used for the forward.
+    """
+
+    num_samples = len(dataset)
+
+    # all entries are filled in the same pass, so resume from the least advanced one
+    start = num_samples
+    for store, _, feature_types in jobs:
+        for ft in feature_types:
+            meta = store._read_meta(split, ft)
+            valid = meta is not None and meta["num_samples"] == num_samples
+            start = min(start, meta["num_written"] if valid else 0)
+
+    loader = DataLoader(
+        Subset(dataset, range(start, num_samples)),
+        batch_size=batch_size,
+        shuffle=False,
+        num_workers=num_workers,
+        pin_memory=torch.device(device).type == "cuda",
+        drop_last=False,
+    )
+
+    entries = [None] * len(jobs)
+    num_written = start
+    for batch_idx, (im, lab) in enumerate(tqdm(loader, desc=f"Extracting {split} features")):
+        im = im.to(device, non_blocking=True)
+        end = num_written + lab.size(0)
+        for i, (store, forward_fn, feature_types) in enumerate(jobs):
+            outs = forward_fn(im)
+
+            # arrays are only created after the first batch, when the feature dims are known
+            if entries[i] is None:
+                entries[i] = {
+                    ft: store._open(split, ft, num_samples, outs[ft].size(1))
+                    for ft in feature_types
+                }
+
+            for ft in feature_types:
+                features, labels = entries[i][ft]
+                features[num_written:end] = outs[ft].float().cpu().numpy()
+                labels[num_written:end] = lab.numpy()
+            del outs
+
+            if (batch_idx + 1) % store.flush_every == 0 or end == num_samples:
+                store._commit(entries[i], split, end)
+        num_written = end
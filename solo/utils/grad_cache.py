@@ -0,0 +1,142 @@
+# Copyright 2023 solo-learn development team.
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the
+# Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies
+# or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+# PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE
+# FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+from typing import Any, Dict, List, Sequence
+
+import torch
+
+
+class RandContext:
+    def __init__(self):
+        """Captures the current CPU and CUDA random states so that a forward pass can be replayed
+        with exactly the same randomness (e.g. dropout or stochastic depth masks).
+        """
+
+        self.cpu_state = torch.get_rng_state()
+        if torch.cuda.is_available() and torch.cuda.is_initialized():
+            self.device = torch.cuda.current_device()
+            self.cuda_state = torch.cuda.get_rng_state(self.device)
+        else:
+            self.device = None
+            self.cuda_state = None
+
+    def __enter__(self):
+        devices = [] if self.device is None else [self.device]
+        self._fork = torch.random.fork_rng(devices=devices)
+        self._fork.__enter__()
+        torch.set_rng_state(self.cpu_state)
+        if self.cuda_state is not None:
+            torch.cuda.set_rng_state(self.cuda_state, self.device)
+
+    def __exit__(self, *args):
+        self._fork.__exit__(*args)
+        self._fork = None
+
+
+def split_batch(batch: Sequence[Any], sub_batch_size: int) -> List[List[Any]]:
+    """Splits a batch in the format of [img_indexes, [X], Y] into sub-batches of the same format.
+
+    Args:
+        batch (Sequence[Any]): batch of data in the format of [img_indexes, [X], Y].
+        sub_batch_size (int): maximum number of samples of each sub-batch.
+
+    Returns:
+        List[List[Any]]: list of sub-batches.
+    """
+
+    indexes, X, targets = batch
+    X = [X] if isinstance(X, torch.Tensor) else X
+
+    sub_batches = []
+    for start in range(0, targets.size(0), sub_batch_size):
+        end = start + sub_batch_size
+        sub_batches.append([indexes[start:end], [x[start:end] for x in X], targets[start:end]])
+    return sub_batches
+
+
+def detach_outputs(out: Any) -> Any:
+    """Replaces all floating point tensors of a (possibly nested) output by leaf tensors that
+    require gradients, so that the gradients of a loss w.r.t. them can be cached.
+
+    Args:
+        out (Any): tensor, list or dict of outputs.
+
+    Returns:
+        Any: outputs with the same structure.
+    """
+
+    if isinstance(out, torch.Tensor):
+        if not out.is_floating_point():
+            return out
+        # half precision outputs are cached in fp32 so that their gradients do not underflow
+        leaf = out.detach()
+        if leaf.element_size() < 4:
+            leaf = leaf.float()
+        return leaf.requires_grad_()
+    if isinstance(out, dict):
+        return {k: detach_outputs(v) for k, v in out.items()}
+    if isinstance(out, (list, tuple)):
+        return type(out)(detach_outputs(v) for v in out)
+    return out
+
+
+def flatten_tensors(out: Any) -> List[torch.Tensor]:
+    """Lists all tensors of a (possibly nested) output in a deterministic order.
+
+    Args:
+        out (Any): tensor, list or dict of outputs.
+
+    Returns:
+        List[torch.Tensor]: tensors of the output.
+    """
+
+    if isinstance(out, torch.Tensor):
+        return [out]
+    if isinstance(out, dict):
+        return [t for v in out.values() for t in flatten_tensors(v)]
+    if isinstance(out, (list, tuple)):
+        return [t for v in out for t in flatten_tensors(v)]
+    return []
+
+
+def merge_outputs(outs: List[Dict[str, Any]], sizes: List[int]) -> Dict[str, Any]:
+    """Merges the outputs of the training step of several sub-batches into the output of the
+    full batch. Per-crop lists of tensors are concatenated along the batch dimension and scalar
+    tensors (losses and accuracies) are averaged according to the size of each sub-batch.
+
+    Args:
+        outs (List[Dict[str, Any]]): outputs of each sub-batch.
+        sizes (List[int]): number of samples of each sub-batch.
+
+    Returns:
+        Dict[str, Any]: outputs of the full batch.
+    """
+
+    total = sum(sizes)
+    merged = {}
+    for k, v in outs[0].items():
+        if isinstance(v, (list, tuple)):
+            merged[k] = [torch.cat([out[k][i] for out in outs]) for i in range(len(v))]
+        elif isinstance(v, torch.Tensor) and v.dim() == 0:
+            merged[k] = sum(out[k] * size for out, size in zip(outs, sizes)) / total
+        elif isinstance(v, torch.Tensor):
+            merged[k] = torch.cat([out[k] for out in outs])
+        else:
+            merged[k] = v
+    return merged
@@ -17,13 +17,15 @@
 # OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 # DEALINGS IN THE SOFTWARE.
 
-from typing import Any, Sequence
+from typing import Any, List, Optional, Sequence, Tuple
 
-import numpy as np
 import torch
 import torch.distributed as dist
 import torch.nn.functional as F
-from scipy.sparse import csr_matrix
+
+
+def _is_distributed() -> bool:
+    return dist.is_available() and dist.is_initialized()
 
 
 class KMeans:
@@ -36,6 +38,10 @@ class KMeans:
         proj_features_dim: int,
         num_prototypes: int,
         kmeans_iters: int = 10,
+        max_distance_matrix_size: int = int(5e7),
+        init: str = "random",
+        assignments_dtype: torch.dtype = torch.long,
+        device: Optional[torch.device] = None,
     ):
         """Class that performs K-Means on the hypersphere.
 
@@ -48,6 +54,17 @@ class KMeans:
             num_prototypes (int): number of prototypes.
             kmeans_iters (int, optional): number of iterations for the k-means clustering.
                 Defaults to 10.
+            max_distance_matrix_size (int, optional): maximum number of elements of the
+                samples x centroids dot product matrix computed at once in the E step.
+                Defaults to 5e7.
+            init (str, optional): centroid initialization, either "random" (random samples
+                of the memory bank of rank 0) or "kmeans++" (distributed k-means++ seeding).
+                Defaults to "random".
+            assignments_dtype (torch.dtype, optional): integer dtype of the returned
+                assignments. Defaults to torch.long.
+            device (Optional[torch.device], optional): device where clustering is performed.
+                Memory banks stored elsewhere (e.g. pinned CPU memory) are moved to it one crop
+                at a time. If None, uses the device of the memory bank. Defaults to None.
         """
         self.world_size = world_size
         self.rank = rank
@@ -56,17 +73,166 @@ class KMeans:
         self.proj_features_dim = proj_features_dim
         self.num_prototypes = num_prototypes
         self.kmeans_iters = kmeans_iters
+        self.max_distance_matrix_size = max_distance_matrix_size
+
+        assert init in ["random", "kmeans++"]
+        self.init = init
+
+        assert not assignments_dtype.is_floating_point
+        assert max(num_prototypes) <= torch.iinfo(assignments_dtype).max
+        self.assignments_dtype = assignments_dtype
+        self.device = device
+
+        # seeded identically on all ranks so that they make the same random choices
+        # without communicating
+        self.generator = torch.Generator().manual_seed(0)
+
+    def assign(self, embeddings: torch.Tensor, centroids: torch.Tensor) -> torch.Tensor:
+        """Assigns each embedding to its closest centroid (E step). The dot products are
+        computed in chunks so that at most max_distance_matrix_size elements are materialized.
+        Low precision embeddings are upcast chunk by chunk to the dtype of the centroids.
+
+        Args:
+            embeddings (torch.Tensor): embeddings of the samples (N x D).
+            centroids (torch.Tensor): centroids (K x D).
+
+        Returns:
+            torch.Tensor: index of the closest centroid for each sample.
+        """
+
+        chunk_size = max(1, self.max_distance_matrix_size // centroids.size(0))
+        assignments = torch.empty(embeddings.size(0), dtype=torch.long, device=embeddings.device)
+        for start in range(0, embeddings.size(0), chunk_size):
+            end = start + chunk_size
+            dot_products = torch.mm(embeddings[start:end].to(centroids.dtype), centroids.t())
+            assignments[start:end] = dot_products.argmax(dim=1)
+        return assignments
+
+    def accumulate(
+        self, embeddings: torch.Tensor, assignments: torch.Tensor, K: int
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Computes the number of samples and the fp32 sum of the embeddings assigned to each
+        centroid (M step), upcasting low precision embeddings chunk by chunk.
+
+        Args:
+            embeddings (torch.Tensor): embeddings of the samples (N x D).
+            assignments (torch.Tensor): index of the centroid of each sample.
+            K (int): number of centroids.
+
+        Returns:
+            Tuple[torch.Tensor, torch.Tensor]: counts and sums of the embeddings per centroid.
+        """
+
+        counts = torch.bincount(assignments, minlength=K)
+        emb_sums = torch.zeros(K, self.proj_features_dim, device=embeddings.device)
+        chunk_size = max(1, self.max_distance_matrix_size // self.proj_features_dim)
+        for start in range(0, embeddings.size(0), chunk_size):
+            end = start + chunk_size
+            emb_sums.index_add_(0, assignments[start:end], embeddings[start:end].float())
+        return counts, emb_sums
+
+    def random_init(self, embeddings: torch.Tensor, K: int) -> torch.Tensor:
+        """Initializes the centroids with random elements from the memory bank of rank 0.
+
+        Args:
+            embeddings (torch.Tensor): local embeddings of the samples (N x D).
+            K (int): number of centroids.
+
+        Returns:
+            torch.Tensor: initial centroids.
+        """
+
+        centroids = torch.empty(K, self.proj_features_dim).to(embeddings.device, non_blocking=True)
+        if self.rank == 0:
+            random_idx = torch.randperm(len(embeddings))[:K]
+            assert len(random_idx) >= K, "please reduce the number of centroids"
+            centroids = embeddings[random_idx].float()
+        if _is_distributed():
+            dist.broadcast(centroids, 0)
+        return centroids
+
+    def kmeans_plus_plus_init(self, embeddings: torch.Tensor, K: int) -> torch.Tensor:
+        """Initializes the centroids with distributed k-means++ seeding. At each step, every
+        rank samples a local candidate with probability proportional to the squared distance
+        to the closest centroid, and one all_gather shares the candidates and the local weight
+        totals. All ranks then pick the same candidate, with probability proportional to the
+        totals, using the shared generator. The totals stay on the device, so seeding needs
+        one collective and no host synchronization per centroid.
+
+        Args:
+            embeddings (torch.Tensor): local embeddings of the samples (N x D).
+            K (int): number of centroids.
+
+        Returns:
+            torch.Tensor: initial centroids.
+        """
 
-    @staticmethod
-    def get_indices_sparse(data: np.ndarray):
-        cols = np.arange(data.size)
-        M = csr_matrix((cols, (data.ravel(), cols)), shape=(int(data.max()) + 1, data.size))
-        return [np.unravel_index(row.data, data.shape) for row in M]
+        device = embeddings.device
+        centroids = torch.empty(K, self.proj_features_dim, device=device)
+        # first centroid is sampled uniformly
+        weights = torch.ones(embeddings.size(0), device=device)
+        min_dists = torch.full((embeddings.size(0),), float("inf"), device=device)
+        for k in range(K):
+            total = weights.sum()
+            # samples uniformly if all samples of this rank are already centroids
+            idx = torch.multinomial(weights + (total <= 0).float(), 1)
+            candidate = torch.cat((total.view(1), embeddings[idx].view(-1).float()))
+
+            if _is_distributed():
+                candidates = torch.empty(self.world_size, candidate.size(0), device=device)
+                dist.all_gather(list(candidates.unbind(0)), candidate)
+                totals = candidates[:, 0]
+                cum_totals = (totals + (totals.sum() <= 0).float()).cumsum(0)
+                u = torch.rand(1, generator=self.generator).to(device, non_blocking=True)
+                choice = torch.searchsorted(cum_totals, u * cum_totals[-1], right=True)
+                candidate = candidates[choice.clamp_(max=self.world_size - 1)].squeeze(0)
+
+            centroids[k] = candidate[1:]
+            # squared euclidean distance on the hypersphere
+            dists = (2 - 2 * (embeddings @ centroids[k].to(embeddings.dtype)).float()).clamp_(min=0)
+            torch.minimum(min_dists, dists, out=min_dists)
+            weights = min_dists
+        return centroids
+
+    def init_centroids(self, embeddings: torch.Tensor, K: int) -> torch.Tensor:
+        if self.init == "kmeans++":
+            return self.kmeans_plus_plus_init(embeddings, K)
+        return self.random_init(embeddings, K)
+
+    def fit(self, embeddings: torch.Tensor, centroids: torch.Tensor) -> torch.Tensor:
+        """Runs full-batch Lloyd iterations.
+
+        Args:
+            embeddings (torch.Tensor): local embeddings of the samples (N x D).
+            centroids (torch.Tensor): initial centroids (K x D).
+
+        Returns:
+            torch.Tensor: final centroids.
+        """
+
+        K = centroids.size(0)
+        for _ in range(self.kmeans_iters):
+            # E step
+            local_assignments = self.assign(embeddings, centroids)
+
+            # M step
+            counts, emb_sums = self.accumulate(embeddings, local_assignments, K)
+            if _is_distributed():
+                dist.all_reduce(counts)
+                dist.all_reduce(emb_sums)
+            mask = counts > 0
+            centroids[mask] = emb_sums[mask] / counts[mask].unsqueeze(1)
+
+            # normalize centroids
+            centroids = F.normalize(centroids, dim=1, p=2)
+        return centroids
 
     def cluster_memory(
         self,
         local_memory_index: torch.Tensor,
         local_memory_embeddings: torch.Tensor,
+        init_centroids: Optional[List[torch.Tensor]] = None,
+        needed_indices: Optional[torch.Tensor] = None,
     ) -> Sequence[Any]:
         """Performs K-Means clustering on the hypersphere and returns centroids and
         assignments for each sample.
@@ -76,59 +242,45 @@ class KMeans:
                 samples.
             local_memory_embeddings (torch.Tensor): memory bank cointaining embeddings
                 of the samples.
+            init_centroids (Optional[List[torch.Tensor]]): initial centroids for each set of
+                prototypes (e.g. the centroids of the previous epoch for warm-starting).
+                If None, centroids are initialized according to self.init. Defaults to None.
+            needed_indices (Optional[torch.Tensor]): sorted dataset indices whose assignments
+                are needed by this process. If given, only these assignments are stored and the
+                i-th column of the returned assignments corresponds to needed_indices[i].
+                Otherwise, assignments are returned for the whole dataset. Defaults to None.
 
         Returns:
             Sequence[Any]: assignments and centroids.
         """
         j = 0
-        device = local_memory_embeddings.device
-        assignments = -torch.ones(len(self.num_prototypes), self.dataset_size).long()
+        device = self.device if self.device is not None else local_memory_embeddings.device
+        local_memory_index = local_memory_index.to(device, non_blocking=True)
+        num_assignments = self.dataset_size if needed_indices is None else len(needed_indices)
+        assignments = torch.full(
+            (len(self.num_prototypes), num_assignments),
+            -1,
+            dtype=self.assignments_dtype,
+            device=device,
+        )
         centroids_list = []
         with torch.no_grad():
             for i_K, K in enumerate(self.num_prototypes):
+                embeddings = local_memory_embeddings[j].to(device, non_blocking=True)
+
                 # run distributed k-means
+                if init_centroids is not None:
+                    centroids = init_centroids[i_K].clone().to(device)
+                else:
+                    centroids = self.init_centroids(embeddings, K)
 
-                # init centroids with elements from memory bank of rank 0
-                centroids = torch.empty(K, self.proj_features_dim).to(device, non_blocking=True)
-                if self.rank == 0:
-                    random_idx = torch.randperm(len(local_memory_embeddings[j]))[:K]
-                    assert len(random_idx) >= K, "please reduce the number of centroids"
-                    centroids = local_memory_embeddings[j][random_idx]
-                if dist.is_available() and dist.is_initialized():
-                    dist.broadcast(centroids, 0)
-
-                for n_iter in range(self.kmeans_iters + 1):
-                    # E step
-                    dot_products = torch.mm(local_memory_embeddings[j], centroids.t())
-                    _, local_assignments = dot_products.max(dim=1)
-
-                    # finish
-                    if n_iter == self.kmeans_iters:
-                        break
-
-                    # M step
-                    where_helper = self.get_indices_sparse(local_assignments.cpu().numpy())
-                    counts = torch.zeros(K).to(device, non_blocking=True).int()
-                    emb_sums = torch.zeros(K, self.proj_features_dim).to(device, non_blocking=True)
-                    for k in range(len(where_helper)):
-                        if len(where_helper[k][0]) > 0:
-                            emb_sums[k] = torch.sum(
-                                local_memory_embeddings[j][where_helper[k][0]],
-                                dim=0,
-                            )
-                            counts[k] = len(where_helper[k][0])
-                    if dist.is_available() and dist.is_initialized():
-                        dist.all_reduce(counts)
-                        dist.all_reduce(emb_sums)
-                    mask = counts > 0
-                    centroids[mask] = emb_sums[mask] / counts[mask].unsqueeze(1)
-
-                    # normalize centroids
-                    centroids = F.normalize(centroids, dim=1, p=2)
+                centroids = self.fit(embeddings, centroids)
+                local_assignments = self.assign(embeddings, centroids)
+                del embeddings
 
                 centroids_list.append(centroids)
 
-                if dist.is_available() and dist.is_initialized():
+                if _is_distributed():
                     # gather the assignments
                     assignments_all = torch.empty(
                         self.world_size,
@@ -142,7 +294,7 @@ class KMeans:
                         assignments_all, local_assignments, async_op=True
                     )
                     dist_process.wait()
-                    assignments_all = torch.cat(assignments_all).cpu()
+                    assignments_all = torch.cat(assignments_all)
 
                     # gather the indexes
                     indexes_all = torch.empty(
@@ -154,16 +306,74 @@ class KMeans:
                     indexes_all = list(indexes_all.unbind(0))
                     dist_process = dist.all_gather(indexes_all, local_memory_index, async_op=True)
                     dist_process.wait()
-                    indexes_all = torch.cat(indexes_all).cpu()
+                    indexes_all = torch.cat(indexes_all)
 
                 else:
                     assignments_all = local_assignments
                     indexes_all = local_memory_index
 
                 # log assignments
-                assignments[i_K][indexes_all] = assignments_all
+                assignments_all = assignments_all.to(self.assignments_dtype)
+                if needed_indices is None:
+                    assignments[i_K][indexes_all] = assignments_all
+                else:
+                    pos = torch.searchsorted(needed_indices, indexes_all)
+                    pos.clamp_(max=len(needed_indices) - 1)
+                    found = needed_indices[pos] == indexes_all
+                    assignments[i_K][pos[found]] = assignments_all[found]
 
                 # next memory bank to use
                 j = (j + 1) % self.num_large_crops
 
         return assignments, centroids_list
+
+
+class MiniBatchKMeans(KMeans):
+    def __init__(self, *args, batch_size: int = 4096, **kwargs):
+        """Mini-batch K-Means on the hypersphere (Sculley, 2010). Instead of full-batch
+        Lloyd iterations, each of the kmeans_iters iterations only assigns a random
+        mini-batch of the memory bank of each process and moves the centroids towards it
+        with a per-centroid learning rate of 1 / (number of samples assigned so far).
+
+        Args:
+            batch_size (int, optional): number of samples per process in each mini-batch.
+                Defaults to 4096.
+            *args, **kwargs: arguments of KMeans.
+        """
+
+        super().__init__(*args, **kwargs)
+        self.batch_size = batch_size
+
+    def fit(self, embeddings: torch.Tensor, centroids: torch.Tensor) -> torch.Tensor:
+        """Runs mini-batch k-means iterations.
+
+        Args:
+            embeddings (torch.Tensor): local embeddings of the samples (N x D).
+            centroids (torch.Tensor): initial centroids (K x D).
+
+        Returns:
+            torch.Tensor: final centroids.
+        """
+
+        K = centroids.size(0)
+        device = embeddings.device
+        total_counts = torch.zeros(K, device=device)
+        for _ in range(self.kmeans_iters):
+            idx = torch.randint(embeddings.size(0), (self.batch_size,), device=device)
+            batch = embeddings[idx].float()
+            batch_assignments = self.assign(batch, centroids)
+
+            counts, emb_sums = self.accumulate(batch, batch_assignments, K)
+            counts = counts.float()
+            if _is_distributed():
+                dist.all_reduce(counts)
+                dist.all_reduce(emb_sums)
+
+            total_counts += counts
+            mask = counts > 0
+            lr = (1 / total_counts[mask]).unsqueeze(1)
+            centroids[mask] += lr * (emb_sums[mask] - counts[mask].unsqueeze(1) * centroids[mask])
+
+            # normalize centroids
+            centroids = F.normalize(centroids, dim=1, p=2)
+        return centroids
@@ -17,10 +17,13 @@
 # OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 # DEALINGS IN THE SOFTWARE.
 
+import contextlib
 import logging
 import math
 import os
-from typing import Dict, List, Optional, Tuple
+import time
+from functools import partial
+from typing import Callable, Dict, List, Optional, Tuple, Union
 
 import numpy as np
 import torch
@@ -29,6 +32,7 @@ import torch.nn as nn
 from omegaconf import OmegaConf
 from timm.models.helpers import group_parameters
 from timm.optim.optim_factory import _layer_map
+from torch.utils.checkpoint import checkpoint
 
 
 try:
@@ -184,6 +188,184 @@ def get_rank():
     return 0
 
 
+def get_world_size():
+    if dist.is_available() and dist.is_initialized():
+        return dist.get_world_size()
+    return 1
+
+
+# whether the backend supports the single-buffer collectives, probed on first use
+_NATIVE_COLLECTIVES: Dict[Tuple[str, str], bool] = {}
+
+
+def _run_collective(name: str, native: Callable, fallback: Callable):
+    """Runs a single-buffer collective, falling back to its list-based equivalent for backends
+    that do not implement it (e.g. older gloo versions). The result is cached per backend.
+
+    Args:
+        name (str): name of the collective.
+        native (Callable): runs the single-buffer collective.
+        fallback (Callable): runs the list-based equivalent.
+
+    Returns:
+        Any: the work handle of asynchronous collectives, None otherwise.
+    """
+
+    key = (str(dist.get_backend()), name)
+    if _NATIVE_COLLECTIVES.get(key, True):
+        try:
+            work = native()
+            _NATIVE_COLLECTIVES[key] = True
+            return work
+        except (AttributeError, NotImplementedError, RuntimeError, ValueError):
+            if key in _NATIVE_COLLECTIVES:
+                raise
+            _NATIVE_COLLECTIVES[key] = False
+    return fallback()
+
+
+def all_gather_into_tensor(output: torch.Tensor, x: torch.Tensor, async_op: bool = False):
+    """Gathers x from all processes into the preallocated output, whose first dimension is
+    world_size times the first dimension of x.
+
+    Args:
+        output (torch.Tensor): contiguous output buffer.
+        x (torch.Tensor): contiguous local tensor.
+        async_op (bool, optional): whether to return without waiting for the gather.
+            Defaults to False.
+
+    Returns:
+        Any: the work handle if async_op is True, None otherwise.
+    """
+
+    return _run_collective(
+        "all_gather_into_tensor",
+        lambda: dist.all_gather_into_tensor(output, x, async_op=async_op),
+        lambda: dist.all_gather(list(output.chunk(get_world_size())), x, async_op=async_op),
+    )
+
+
+def reduce_scatter_tensor(output: torch.Tensor, x: torch.Tensor):
+    """Sums x over all processes and keeps this process' chunk of the first dimension.
+
+    Args:
+        output (torch.Tensor): contiguous output buffer, with first dimension equal to the
+            first dimension of x divided by world_size.
+        x (torch.Tensor): contiguous tensor to reduce.
+    """
+
+    def fallback():
+        reduced = x.clone()
+        dist.all_reduce(reduced)
+        output.copy_(reduced.chunk(get_world_size())[get_rank()])
+
+    _run_collective(
+        "reduce_scatter_tensor", lambda: dist.reduce_scatter_tensor(output, x), fallback
+    )
+
+
+def gather_sizes(x: torch.Tensor) -> List[int]:
+    """Exchanges the size of the first dimension of x between all processes.
+
+    Args:
+        x (torch.Tensor): local tensor.
+
+    Returns:
+        List[int]: size of the first dimension of x in each process.
+    """
+
+    size = torch.tensor([x.size(0)], dtype=torch.long, device=x.device)
+    sizes = torch.empty(get_world_size(), dtype=torch.long, device=x.device)
+    all_gather_into_tensor(sizes, size)
+    return sizes.tolist()
+
+
+def _pad_for_gather(
+    x: torch.Tensor, sizes: Optional[List[int]] = None
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    """Pads x to the largest size of all processes and allocates the gather buffer.
+
+    Args:
+        x (torch.Tensor): local tensor.
+        sizes (Optional[List[int]]): size of the first dimension of x in each process. None
+            means that all processes have the same size. Defaults to None.
+
+    Returns:
+        Tuple[torch.Tensor, torch.Tensor]: the contiguous padded tensor and the output buffer.
+    """
+
+    max_size = x.size(0) if sizes is None else max(sizes)
+    if x.size(0) < max_size:
+        x = torch.cat((x, x.new_zeros(max_size - x.size(0), *x.shape[1:])))
+    return x.contiguous(), x.new_empty(get_world_size() * max_size, *x.shape[1:])
+
+
+def _unpad_gathered(output: torch.Tensor, sizes: Optional[List[int]] = None) -> torch.Tensor:
+    """Removes the padding of each process from a gather buffer.
+
+    Args:
+        output (torch.Tensor): gather buffer.
+        sizes (Optional[List[int]]): size of the first dimension of x in each process. None
+            means that all processes have the same size. Defaults to None.
+
+    Returns:
+        torch.Tensor: tensors of all processes concatenated along the first dimension.
+    """
+
+    if sizes is None or len(set(sizes)) == 1:
+        return output
+    chunks = output.chunk(get_world_size())
+    return torch.cat([chunk[:size] for chunk, size in zip(chunks, sizes)])
+
+
+def _padded_all_gather(x: torch.Tensor, sizes: Optional[List[int]] = None) -> torch.Tensor:
+    """Gathers x from all processes along the first dimension into a single buffer. If the
+    processes have different sizes, x is padded to the largest one and the padding is removed
+    from the output.
+
+    Args:
+        x (torch.Tensor): local tensor.
+        sizes (Optional[List[int]]): size of the first dimension of x in each process. None
+            means that all processes have the same size. Defaults to None.
+
+    Returns:
+        torch.Tensor: tensors of all processes concatenated along the first dimension.
+    """
+
+    x, output = _pad_for_gather(x, sizes)
+    all_gather_into_tensor(output, x)
+    return _unpad_gathered(output, sizes)
+
+
+def _gather_backward(grad: torch.Tensor, sizes: Optional[List[int]] = None) -> torch.Tensor:
+    """Sums the gradients of the gathered tensor over all processes and keeps the rows of
+    this process.
+
+    Args:
+        grad (torch.Tensor): gradient of the gathered tensor.
+        sizes (Optional[List[int]]): size of the first dimension of x in each process. None
+            means that all processes have the same size. Defaults to None.
+
+    Returns:
+        torch.Tensor: gradient of the local tensor.
+    """
+
+    world_size = get_world_size()
+    max_size = grad.size(0) // world_size if sizes is None else max(sizes)
+
+    if sizes is not None and any(size != max_size for size in sizes):
+        padded = grad.new_zeros(world_size * max_size, *grad.shape[1:])
+        for chunk, g in zip(padded.chunk(world_size), grad.split(sizes)):
+            chunk[: g.size(0)] = g
+        grad = padded
+
+    grad_out = grad.new_empty(max_size, *grad.shape[1:])
+    reduce_scatter_tensor(grad_out, grad.contiguous())
+    if sizes is not None:
+        grad_out = grad_out[: sizes[get_rank()]]
+    return grad_out
+
+
 class GatherLayer(torch.autograd.Function):
     """
     Gathers tensors from all process and supports backward propagation
@@ -191,48 +373,243 @@ class GatherLayer(torch.autograd.Function):
     """
 
     @staticmethod
-    def forward(ctx, x):
+    def forward(ctx, x, sizes=None):
+        ctx.sizes = sizes
         if dist.is_available() and dist.is_initialized():
-            output = [torch.zeros_like(x) for _ in range(dist.get_world_size())]
-            dist.all_gather(output, x)
-        else:
-            output = [x]
-        return tuple(output)
+            return _padded_all_gather(x, sizes)
+        return x
 
     @staticmethod
-    def backward(ctx, *grads):
+    def backward(ctx, grad):
         if dist.is_available() and dist.is_initialized():
-            all_gradients = torch.stack(grads)
-            dist.all_reduce(all_gradients)
-            grad_out = all_gradients[get_rank()]
+            grad_out = _gather_backward(grad, ctx.sizes)
         else:
-            grad_out = grads[0]
-        return grad_out
+            grad_out = grad
+        return grad_out, None
+
+
+class _AsyncGatherLayer(torch.autograd.Function):
+    """Connects the output of an asynchronous gather to the autograd graph of its input."""
+
+    @staticmethod
+    def forward(ctx, x, handle):
+        ctx.sizes = handle.sizes
+        if handle.work is None:
+            return x
+        return _unpad_gathered(handle.output, handle.sizes)
+
+    @staticmethod
+    def backward(ctx, grad):
+        if dist.is_available() and dist.is_initialized():
+            return _gather_backward(grad, ctx.sizes), None
+        return grad, None
 
 
-def gather(X, dim=0):
-    """Gathers tensors from all processes, supporting backward propagation."""
-    return torch.cat(GatherLayer.apply(X), dim=dim)
+# time spent blocked on asynchronous gathers since the last call to pop_exposed_gather_time
+_EXPOSED_GATHER_TIME = [0.0]
+
+
+def pop_exposed_gather_time() -> float:
+    """Returns the time spent waiting for asynchronous gathers since the last call and resets it.
+    With NCCL, waiting only blocks the host until the gather is enqueued on the current stream,
+    so this underestimates the exposed time unless NCCL_BLOCKING_WAIT is set.
+
+    Returns:
+        float: exposed communication time in seconds.
+    """
+
+    exposed_time = _EXPOSED_GATHER_TIME[0]
+    _EXPOSED_GATHER_TIME[0] = 0.0
+    return exposed_time
+
+
+class GatherHandle:
+    def __init__(self, x: torch.Tensor, sizes: Optional[List[int]] = None):
+        """Handle of an asynchronous gather launched by gather_async. The gather runs while the
+        caller computes terms that only depend on local tensors and is resolved with wait.
+
+        Args:
+            x (torch.Tensor): local tensor.
+            sizes (Optional[List[int]]): size of the first dimension of x in each process. None
+                means that all processes have the same size. Defaults to None.
+        """
+
+        self.x = x
+        self.sizes = sizes
+        self.work = None
+        self.result = None
+
+        if dist.is_available() and dist.is_initialized():
+            padded, self.output = _pad_for_gather(x.detach(), sizes)
+            self.work = all_gather_into_tensor(self.output, padded, async_op=True)
+
+    @property
+    def offset(self) -> int:
+        """Row of the gathered tensor corresponding to the first row of x."""
+
+        if self.sizes is None:
+            return self.x.size(0) * get_rank()
+        return sum(self.sizes[: get_rank()])
+
+    def wait(self) -> torch.Tensor:
+        """Waits for the gather to finish.
+
+        Returns:
+            torch.Tensor: tensors of all processes concatenated along the first dimension,
+                supporting backward propagation.
+        """
+
+        if self.result is None:
+            if self.work is not None:
+                start = time.perf_counter()
+                self.work.wait()
+                _EXPOSED_GATHER_TIME[0] += time.perf_counter() - start
+            self.result = _AsyncGatherLayer.apply(self.x, self)
+        return self.result
+
+
+def gather_async(X: torch.Tensor, uneven: bool = False) -> GatherHandle:
+    """Launches the gather of X from all processes along the first dimension without waiting
+    for it to finish.
+
+    Args:
+        X (torch.Tensor): local tensor.
+        uneven (bool, optional): whether X may have a different size in each process.
+            Defaults to False.
+
+    Returns:
+        GatherHandle: handle whose wait method returns the gathered tensor.
+    """
+
+    sizes = None
+    if uneven and dist.is_available() and dist.is_initialized():
+        sizes = gather_sizes(X)
+    return GatherHandle(X, sizes)
+
+
+def gathered_matmul(
+    x: torch.Tensor, y: torch.Tensor, handle: Optional[GatherHandle] = None
+) -> torch.Tensor:
+    """Computes x @ gather(y).T. The block of the local y is computed while the other processes'
+    y are being gathered, so only the remote blocks wait for the communication.
+
+    Args:
+        x (torch.Tensor): NxD local tensor.
+        y (torch.Tensor): MxD local tensor.
+        handle (Optional[GatherHandle]): handle of an already launched gather of y.
+            Defaults to None (the gather is launched here).
+
+    Returns:
+        torch.Tensor: N x (M*world_size) products, in the same column order as gather(y).
+    """
+
+    if handle is None:
+        handle = gather_async(y)
+    local = x @ y.T
+    gathered_y = handle.wait()
+    start, end = handle.offset, handle.offset + y.size(0)
+    return torch.cat((x @ gathered_y[:start].T, local, x @ gathered_y[end:].T), dim=1)
+
+
+def gather(X, dim=0, uneven=False):
+    """Gathers tensors from all processes, supporting backward propagation.
+
+    Args:
+        X (torch.Tensor): local tensor.
+        dim (int, optional): dimension to concatenate along. Defaults to 0.
+        uneven (bool, optional): whether X may have a different size along dim in each
+            process, which requires exchanging the sizes first. Defaults to False.
+
+    Returns:
+        torch.Tensor: tensors of all processes concatenated along dim.
+    """
+
+    if dim != 0:
+        return gather(X.movedim(dim, 0), uneven=uneven).movedim(0, dim)
+
+    sizes = None
+    if uneven and dist.is_available() and dist.is_initialized():
+        sizes = gather_sizes(X)
+    return GatherLayer.apply(X, sizes)
 
 
 @torch.no_grad()
-def concat_all_gather_no_grad(tensor: torch.Tensor) -> torch.Tensor:
+def concat_all_gather_no_grad(tensor: torch.Tensor, uneven: bool = False) -> torch.Tensor:
     """
     Performs all_gather operation on the provided tensors.
     *** Warning ***: torch.distributed.all_gather has no gradient.
     """
 
     if dist.is_available() and dist.is_initialized():
-        tensors_gather = [
-            torch.ones_like(tensor) for _ in range(torch.distributed.get_world_size())
-        ]
-        torch.distributed.all_gather(tensors_gather, tensor, async_op=False)
-
-        output = torch.cat(tensors_gather, dim=0)
-        return output
+        sizes = gather_sizes(tensor) if uneven else None
+        return _padded_all_gather(tensor, sizes)
     return tensor
 
 
+def _block_sq_norm(x: torch.Tensor, y: torch.Tensor, average: bool) -> torch.Tensor:
+    block = torch.einsum("nd, ne -> de", x, y)
+    if average:
+        dist.all_reduce(block)
+        block /= dist.get_world_size()
+    return torch.einsum("de, de ->", block, block)
+
+
+def matmul_sq_norm_and_diag(
+    x: torch.Tensor,
+    y: torch.Tensor,
+    chunk_size: Optional[int] = None,
+    average_across_processes: bool = False,
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    """Computes the squared Frobenius norm and the diagonal of the DxD matrix x^T y, given two
+    NxD tensors. This allows splitting losses over correlation or covariance matrices into
+    diagonal and off-diagonal terms without identity matrices or boolean masks.
+
+    The DxD matrix is never materialized when N < D, as its squared norm is computed from the
+    NxN Gram matrices (||x^T y||^2 = <x x^T, y y^T>). Otherwise, if chunk_size is set, it is
+    computed in blocks of chunk_size columns that are recomputed during the backward pass.
+
+    Args:
+        x (torch.Tensor): NxD tensor.
+        y (torch.Tensor): NxD tensor.
+        chunk_size (Optional[int], optional): number of columns of x^T y computed at once.
+            Defaults to None (whole matrix or Gram matrices at once).
+        average_across_processes (bool, optional): whether to average x^T y across processes
+            with all_reduce before computing its statistics. As in the official Barlow Twins
+            implementation, gradients only flow through the local matrix. Defaults to False.
+
+    Returns:
+        Tuple[torch.Tensor, torch.Tensor]: squared Frobenius norm and diagonal of x^T y, in
+            full precision.
+    """
+
+    average = average_across_processes and dist.is_available() and dist.is_initialized()
+
+    # computed in full precision, as the squared norm grows with D * N^2 and overflows in half
+    # precision, and the off-diagonal term is obtained by subtracting the squared diagonal from it
+    with torch.autocast(device_type=x.device.type, enabled=False):
+        x, y = x.float(), y.float()
+
+        diag = torch.einsum("nd, nd -> d", x, y)
+        if average:
+            dist.all_reduce(diag)
+            diag /= dist.get_world_size()
+
+        N, D = x.size()
+        if chunk_size is None and N < D and not average:
+            sq_norm = torch.einsum("ij, ij ->", x @ x.T, y @ y.T)
+        elif chunk_size is None or chunk_size >= D:
+            sq_norm = _block_sq_norm(x, y, average)
+        else:
+            sq_norm = 0
+            for start in range(0, D, chunk_size):
+                args = (x, y[:, start : start + chunk_size], average)
+                if torch.is_grad_enabled():
+                    sq_norm = sq_norm + checkpoint(_block_sq_norm, *args, use_reentrant=False)
+                else:
+                    sq_norm = sq_norm + _block_sq_norm(*args)
+    return sq_norm, diag
+
+
 def compute_dataset_size(
     dataset: Optional[str] = None,
     train: Optional[bool] = True,
@@ -451,3 +828,211 @@ def omegaconf_select(cfg, key, default=None):
     if value == "None":
         return None
     return value
+
+
+# backbones that benefit from channels_last when running on cpu (oneDNN convolutions)
+_CHANNELS_LAST_BACKBONES = ("resnet", "wide_resnet", "convnext")
+
+
+def setup_inference_device(
+    device: Union[str, torch.device], num_threads: Optional[int] = None, num_workers: int = 0
+) -> torch.device:
+    """Prepares a device for offline inference. On cpu, the number of intra-op threads is set
+    so that the compute threads don't compete with the dataloader workers.
+
+    Args:
+        device (Union[str, torch.device]): device used for inference (e.g. cuda, cuda:1, cpu).
+        num_threads (Optional[int], optional): number of intra-op threads used on cpu.
+            If None, uses all cores that are not used by dataloader workers. Defaults to None.
+        num_workers (int, optional): number of dataloader workers. Defaults to 0.
+
+    Returns:
+        torch.device: the device.
+    """
+
+    device = torch.device(device)
+    if device.type == "cpu":
+        if num_threads is None:
+            num_threads = max(1, (os.cpu_count() or 1) - num_workers)
+        torch.set_num_threads(num_threads)
+    return device
+
+
+def prepare_model_for_inference(
+    model: nn.Module, device: torch.device, backbone_name: Optional[str] = None
+) -> nn.Module:
+    """Moves a model to the inference device and converts it to channels_last when running
+    a convolutional backbone on cpu.
+
+    Args:
+        model (nn.Module): model or backbone.
+        device (torch.device): inference device.
+        backbone_name (Optional[str], optional): name of the backbone. Defaults to None.
+
+    Returns:
+        nn.Module: the model ready for inference.
+    """
+
+    model = model.to(device)
+    if device.type == "cpu" and str(backbone_name).startswith(_CHANNELS_LAST_BACKBONES):
+        model = model.to(memory_format=torch.channels_last)
+    return model
+
+
+def inference_autocast(device: torch.device, bf16: bool = False):
+    """Context manager that enables bf16 autocast for inference if requested.
+
+    Args:
+        device (torch.device): inference device.
+        bf16 (bool, optional): whether to use bf16 autocast. Defaults to False.
+    """
+
+    if not bf16:
+        return contextlib.nullcontext()
+    return torch.autocast(device_type=device.type, dtype=torch.bfloat16)
+
+
+@contextlib.contextmanager
+def preserve_batch_norm_stats(module: nn.Module):
+    """Context manager that restores the running statistics (including num_batches_tracked) of
+    all batch normalization layers of a module when exiting, so that the forwards inside it do
+    not update them.
+
+    Args:
+        module (nn.Module): module whose batch normalization statistics are preserved.
+    """
+
+    bns = [m for m in module.modules() if isinstance(m, nn.modules.batchnorm._BatchNorm)]
+    stats = [[b.clone() for b in bn.buffers()] for bn in bns]
+    try:
+        yield
+    finally:
+        with torch.no_grad():
+            for bn, buffers in zip(bns, stats):
+                for b, saved in zip(bn.buffers(), buffers):
+                    b.copy_(saved)
+
+
+@contextlib.contextmanager
+def patched_forwards(forwards: Dict[nn.Module, Callable]):
+    """Context manager that temporarily replaces the forward of some modules.
+
+    Args:
+        forwards (Dict[nn.Module, Callable]): forward to install for each module.
+    """
+
+    previous = {m: m.__dict__.get("forward") for m in forwards}
+    for m, forward in forwards.items():
+        m.forward = forward
+    try:
+        yield
+    finally:
+        for m, forward in previous.items():
+            if forward is None:
+                del m.forward
+            else:
+                m.forward = forward
+
+
+@contextlib.contextmanager
+def per_chunk_batch_norm(module: nn.Module, sizes: List[int]):
+    """Context manager that makes all batch normalization layers of a module normalize each chunk
+    of their input batch with its own statistics, as if the chunks were forwarded separately.
+    This allows forwarding several crops at once while keeping per-crop normalization.
+
+    Args:
+        module (nn.Module): module whose batch normalization layers are patched.
+        sizes (List[int]): size of each chunk along the batch dimension.
+    """
+
+    def chunked_forward(bn: nn.Module, x: torch.Tensor) -> torch.Tensor:
+        return torch.cat([type(bn).forward(bn, chunk) for chunk in x.split(sizes)])
+
+    bns = [m for m in module.modules() if isinstance(m, nn.modules.batchnorm._BatchNorm)]
+    with patched_forwards({bn: partial(chunked_forward, bn) for bn in bns}):
+        yield
+
+
+def checkpoint_units(backbone: nn.Module) -> List[nn.Module]:
+    """Lists the units of a backbone that can be individually checkpointed, in forward order:
+    blocks for ViTs, Swins and PoolFormers and stages for ResNets, WideResNets and ConvNeXts.
+
+    Args:
+        backbone (nn.Module): backbone from BaseMethod._BACKBONES.
+
+    Returns:
+        List[nn.Module]: checkpointable units of the backbone.
+    """
+
+    if hasattr(backbone, "layer4"):
+        # torchvision resnets
+        return [backbone.layer1, backbone.layer2, backbone.layer3, backbone.layer4]
+    if hasattr(backbone, "block3"):
+        # wide resnets
+        return [backbone.block1, backbone.block2, backbone.block3]
+    if hasattr(backbone, "stages"):
+        # convnexts
+        return list(backbone.stages)
+    if hasattr(backbone, "layers"):
+        # swins
+        return [block for layer in backbone.layers for block in layer.blocks]
+    if hasattr(backbone, "blocks"):
+        # vits (including the mocov3 and mae variants)
+        return list(backbone.blocks)
+    if hasattr(backbone, "network"):
+        # poolformers, whose network alternates stages of blocks and downsampling layers
+        return [
+            block
+            for stage in backbone.network
+            if isinstance(stage, nn.Sequential)
+            for block in stage
+        ]
+    raise ValueError(f"Gradient checkpointing is not supported for {type(backbone).__name__}.")
+
+
+def _checkpointed_forward(module: nn.Module, *args, **kwargs):
+    forward = type(module).forward
+    if not (module.training and torch.is_grad_enabled()):
+        return forward(module, *args, **kwargs)
+
+    # the recomputation during backward must not update the batch norm statistics a second time.
+    # It runs after the forward has exited contexts that patch the batch norm layers (e.g.
+    # per_chunk_batch_norm), so their patched forwards are reinstalled to recompute the same graph
+    bns = [m for m in module.modules() if isinstance(m, nn.modules.batchnorm._BatchNorm)]
+    patched = {bn: bn.__dict__["forward"] for bn in bns if "forward" in bn.__dict__}
+    recomputing = False
+
+    def run(*args, **kwargs):
+        nonlocal recomputing
+        if not recomputing or not bns:
+            recomputing = True
+            return forward(module, *args, **kwargs)
+
+        with preserve_batch_norm_stats(module), patched_forwards(patched):
+            return forward(module, *args, **kwargs)
+
+    return checkpoint(run, *args, use_reentrant=False, **kwargs)
+
+
+def enable_grad_checkpointing(backbone: nn.Module, fraction: float = 1.0) -> List[nn.Module]:
+    """Enables activation checkpointing on the first units (see checkpoint_units) of a backbone.
+    Activations inside checkpointed units are not kept for backward but recomputed, which
+    trades compute for memory. Units are patched in place, so parameter names are unchanged and
+    checkpoints remain compatible. Checkpointing only happens in training mode with gradients
+    enabled.
+
+    Args:
+        backbone (nn.Module): backbone from BaseMethod._BACKBONES.
+        fraction (float, optional): fraction of the units that are checkpointed, starting from
+            the input, where activations are the largest. Defaults to 1.0.
+
+    Returns:
+        List[nn.Module]: units that are checkpointed.
+    """
+
+    assert 0 <= fraction <= 1
+    units = checkpoint_units(backbone)
+    units = units[: round(fraction * len(units))]
+    for unit in units:
+        unit.forward = partial(_checkpointed_forward, unit)
+    return units
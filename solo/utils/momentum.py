@@ -18,14 +18,81 @@
 # DEALINGS IN THE SOFTWARE.
 
 import math
+from typing import Dict, List, Optional, Sequence, Tuple
 
 import torch
 from torch import nn
 
 
+def _split_buffers(net: nn.Module) -> Tuple[List[torch.Tensor], List[torch.Tensor]]:
+    """Splits the buffers of a network into floating point buffers (e.g. BN running stats)
+    and other buffers (e.g. BN number of tracked batches)."""
+
+    float_buffers, other_buffers = [], []
+    for b in net.buffers():
+        (float_buffers if b.is_floating_point() else other_buffers).append(b)
+    return float_buffers, other_buffers
+
+
+def _foreach_copy_(dst: List[torch.Tensor], src: List[torch.Tensor]):
+    if not dst:
+        return
+    if hasattr(torch, "_foreach_copy_"):
+        torch._foreach_copy_(dst, src)
+    else:
+        for d, s in zip(dst, src):
+            d.copy_(s)
+
+
+@torch.no_grad()
+def flatten_params(params: Sequence[nn.Parameter]) -> Optional[torch.Tensor]:
+    """Packs parameters into a single contiguous buffer and turns each parameter into a view
+    of it. Parameter objects (and therefore their names in the state_dict) are preserved, so
+    checkpoints are unaffected, and loading a state_dict copies into the views in-place.
+
+    Moving the module (e.g. with .to()) replaces the views with separate tensors, which can be
+    detected with is_flat.
+
+    Args:
+        params (Sequence[nn.Parameter]): parameters to pack.
+
+    Returns:
+        Optional[torch.Tensor]: the flat buffer or None if the parameters do not share the same
+            device and dtype.
+    """
+
+    if not params or len({(p.device, p.dtype) for p in params}) > 1:
+        return None
+
+    flat = torch.cat([p.data.reshape(-1) for p in params])
+    offset = 0
+    for p in params:
+        p.data = flat[offset : offset + p.numel()].view_as(p)
+        offset += p.numel()
+    return flat
+
+
+def is_flat(params: Sequence[nn.Parameter], flat: torch.Tensor) -> bool:
+    """Checks if parameters are still views of a flat buffer created by flatten_params.
+
+    Args:
+        params (Sequence[nn.Parameter]): parameters.
+        flat (torch.Tensor): flat buffer.
+
+    Returns:
+        bool: whether the first and last parameters still point to the flat buffer.
+    """
+
+    last_offset = (flat.numel() - params[-1].numel()) * flat.element_size()
+    return (
+        params[0].data_ptr() == flat.data_ptr()
+        and params[-1].data_ptr() == flat.data_ptr() + last_offset
+    )
+
+
 @torch.no_grad()
 def initialize_momentum_params(online_net: nn.Module, momentum_net: nn.Module):
-    """Copies the parameters of the online network to the momentum network.
+    """Copies the parameters and buffers of the online network to the momentum network.
 
     Args:
         online_net (nn.Module): online network (e.g. online backbone, online projection, etc...).
@@ -33,32 +100,96 @@ def initialize_momentum_params(online_net: nn.Module, momentum_net: nn.Module):
             momentum projection, etc...).
     """
 
-    params_online = online_net.parameters()
-    params_momentum = momentum_net.parameters()
-    for po, pm in zip(params_online, params_momentum):
-        pm.data.copy_(po.data)
+    params_online = list(online_net.parameters())
+    params_momentum = list(momentum_net.parameters())
+    assert len(params_online) == len(params_momentum)
+    _foreach_copy_([pm.data for pm in params_momentum], [po.data for po in params_online])
+    for pm in params_momentum:
         pm.requires_grad = False
 
+    buffers_online = list(online_net.buffers())
+    buffers_momentum = list(momentum_net.buffers())
+    if len(buffers_online) == len(buffers_momentum):
+        _foreach_copy_(buffers_momentum, buffers_online)
+
 
 class MomentumUpdater:
-    def __init__(self, base_tau: float = 0.996, final_tau: float = 1.0):
+    def __init__(
+        self,
+        base_tau: float = 0.996,
+        final_tau: float = 1.0,
+        update_buffers: bool = False,
+        update_every: int = 1,
+        flat_params: bool = False,
+    ):
         """Updates momentum parameters using exponential moving average.
 
+        The update is performed with multi-tensor (foreach) kernels over lists of parameters
+        that are grouped once per pair of networks, instead of one or two kernels per parameter.
+
         Args:
             base_tau (float, optional): base value of the weight decrease coefficient
                 (should be in [0,1]). Defaults to 0.996.
             final_tau (float, optional): final value of the weight decrease coefficient
                 (should be in [0,1]). Defaults to 1.0.
+            update_buffers (bool, optional): whether to also update floating point buffers
+                (e.g. BN running statistics) with exponential moving average. Other buffers are
+                copied. Defaults to False.
+            update_every (int, optional): number of optimization steps between updates. Updates
+                use tau ** update_every, so that they approximate update_every consecutive
+                updates. Defaults to 1.
+            flat_params (bool, optional): whether to pack the parameters of the momentum
+                networks into a contiguous buffer (see flatten_params) the first time they are
+                updated, so that the decay becomes a single kernel. Defaults to False.
         """
 
         super().__init__()
 
         assert 0 <= base_tau <= 1
         assert 0 <= final_tau <= 1 and base_tau <= final_tau
+        assert update_every >= 1
 
         self.base_tau = base_tau
         self.cur_tau = base_tau
         self.final_tau = final_tau
+        self.update_buffers = update_buffers
+        self.update_every = update_every
+        self.flat_params = flat_params
+
+        self._params: Dict[Tuple[int, int], Tuple[List[torch.Tensor], ...]] = {}
+
+    def _get_params(
+        self, online_net: nn.Module, momentum_net: nn.Module
+    ) -> Tuple[List[torch.Tensor], List[torch.Tensor], Optional[torch.Tensor]]:
+        """Collects (and caches) the flat lists of online and momentum parameters of a pair
+        and, optionally, the flat buffer of the momentum parameters. Parameter objects are kept,
+        so the lists stay valid when the networks are moved, while the flat buffer is rebuilt."""
+
+        key = (id(online_net), id(momentum_net))
+        if key in self._params:
+            params_online, params_momentum, flat = self._params[key]
+            if flat is None or is_flat(params_momentum, flat):
+                return params_online, params_momentum, flat
+        else:
+            params_online = list(online_net.parameters())
+            params_momentum = list(momentum_net.parameters())
+            assert len(params_online) == len(params_momentum)
+
+        flat = flatten_params(params_momentum) if self.flat_params else None
+        self._params[key] = (params_online, params_momentum, flat)
+        return params_online, params_momentum, flat
+
+    def should_update(self, cur_step: int) -> bool:
+        """Checks if the momentum networks should be updated at the current step.
+
+        Args:
+            cur_step (int): number of gradient steps so far.
+
+        Returns:
+            bool: whether to update.
+        """
+
+        return cur_step % self.update_every == 0
 
     @torch.no_grad()
     def update(self, online_net: nn.Module, momentum_net: nn.Module):
@@ -70,8 +201,22 @@ class MomentumUpdater:
                 momentum projection, etc...).
         """
 
-        for op, mp in zip(online_net.parameters(), momentum_net.parameters()):
-            mp.data = self.cur_tau * mp.data + (1 - self.cur_tau) * op.data
+        online, momentum, flat = self._get_params(online_net, momentum_net)
+        tau = self.cur_tau**self.update_every
+        if flat is not None:
+            flat.mul_(tau)
+        else:
+            torch._foreach_mul_(momentum, tau)
+        torch._foreach_add_(momentum, online, alpha=1 - tau)
+
+        if self.update_buffers:
+            # buffers are replaced when modules are moved, so they are not cached
+            float_online, other_online = _split_buffers(online_net)
+            float_momentum, other_momentum = _split_buffers(momentum_net)
+            if float_momentum:
+                torch._foreach_mul_(float_momentum, tau)
+                torch._foreach_add_(float_momentum, float_online, alpha=1 - tau)
+            _foreach_copy_(other_momentum, other_online)
 
     def update_tau(self, cur_step: int, max_steps: int):
         """Computes the next value for the weighting decrease coefficient tau using cosine annealing.
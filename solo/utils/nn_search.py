@@ -0,0 +1,71 @@
+# Copyright 2023 solo-learn development team.
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the
+# Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies
+# or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+# PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE
+# FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+from typing import Optional, Tuple
+
+import torch
+
+
+@torch.no_grad()
+def chunked_topk(
+    query: torch.Tensor,
+    keys: torch.Tensor,
+    k: int = 1,
+    max_distance_matrix_size: int = int(5e7),
+    dtype: Optional[torch.dtype] = None,
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    """Finds the k keys with the largest dot product with each query.
+
+    The similarity matrix is computed over chunks of keys and a running top-k is merged after
+    each chunk, so at most max_distance_matrix_size similarities (plus 2 * k per query) are
+    materialized at once, regardless of the number of keys.
+
+    Args:
+        query (torch.Tensor): batch of queries (B x D).
+        keys (torch.Tensor): keys to search (N x D).
+        k (int, optional): number of neighbors. Defaults to 1.
+        max_distance_matrix_size (int, optional): maximum number of elements of the
+            similarity matrix computed at once. Defaults to 5e7.
+        dtype (Optional[torch.dtype], optional): dtype used to compute similarities, e.g.
+            torch.float16 for faster scoring. Chunks of keys are cast one at a time.
+            Defaults to None (dtype of the keys).
+
+    Returns:
+        Tuple[torch.Tensor, torch.Tensor]: similarities and indices of the neighbors (B x k),
+            sorted by decreasing similarity.
+    """
+
+    assert 0 < k <= keys.size(0)
+
+    dtype = keys.dtype if dtype is None else dtype
+    query = query.to(dtype)
+    chunk_size = max(k, max_distance_matrix_size // max(query.size(0), 1))
+
+    best_values, best_indices = None, None
+    for start in range(0, keys.size(0), chunk_size):
+        chunk = keys[start : start + chunk_size].to(dtype)
+        values, indices = (query @ chunk.T).topk(min(k, chunk.size(0)), dim=1)
+        indices += start
+        if best_values is not None:
+            values = torch.cat((best_values, values), dim=1)
+            indices = torch.cat((best_indices, indices), dim=1)
+            values, order = values.topk(k, dim=1)
+            indices = indices.gather(1, order)
+        best_values, best_indices = values, indices
+    return best_values, best_indices
@@ -0,0 +1,362 @@
+# Copyright 2023 solo-learn development team.
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the
+# Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies
+# or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+# PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE
+# FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import os
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Any, Deque, Dict, Optional, Union
+
+import lightning.pytorch as pl
+import numpy as np
+import torch
+from lightning.pytorch.callbacks import Callback
+from omegaconf import DictConfig
+
+from solo.utils.misc import get_rank, omegaconf_select
+
+# profiler whose regions are being recorded, None when profiling is disabled
+_ACTIVE_PROFILER: Optional["StepProfiler"] = None
+_NULL_CONTEXT = nullcontext()
+
+
+def profile_region(name: str):
+    """Times the enclosed code as the stage name of the active StepProfiler. When no profiler
+    is active, this returns a shared no-op context, so regions can be left in hot paths.
+
+    Args:
+        name (str): name of the stage.
+
+    Returns:
+        ContextManager: context that times the enclosed code.
+    """
+
+    if _ACTIVE_PROFILER is None:
+        return _NULL_CONTEXT
+    return _ACTIVE_PROFILER.region(name)
+
+
+class StepProfiler:
+    def __init__(self, window: int = 100, sync_cuda: bool = False):
+        """Keeps the durations of the last window occurrences of each named stage.
+
+        Stages are timed on the host. CUDA kernels run asynchronously, so stage times on GPUs
+        are only meaningful with sync_cuda, which synchronizes the device around each region.
+
+        Args:
+            window (int, optional): number of occurrences used for the statistics of each stage.
+                Defaults to 100.
+            sync_cuda (bool, optional): whether to synchronize CUDA around each region.
+                Defaults to False.
+        """
+
+        self.window = window
+        self.sync_cuda = sync_cuda and torch.cuda.is_available()
+        self.times: Dict[str, Deque[float]] = {}
+        self.depth = 0
+        # time of the top-level regions since the last call to pop_region_time
+        self.region_time = 0.0
+        self.tracing = False
+
+    def now(self) -> float:
+        if self.sync_cuda:
+            torch.cuda.synchronize()
+        return time.perf_counter()
+
+    def add(self, name: str, elapsed: float):
+        """Records an occurrence of a stage.
+
+        Args:
+            name (str): name of the stage.
+            elapsed (float): duration in seconds.
+        """
+
+        if name not in self.times:
+            self.times[name] = deque(maxlen=self.window)
+        self.times[name].append(elapsed)
+
+    @contextmanager
+    def region(self, name: str):
+        """Times the enclosed code as the stage name. Nested regions are recorded as well,
+        but only top-level regions count towards pop_region_time.
+
+        Args:
+            name (str): name of the stage.
+        """
+
+        record = torch.profiler.record_function(name) if self.tracing else _NULL_CONTEXT
+        self.depth += 1
+        start = self.now()
+        try:
+            with record:
+                yield
+        finally:
+            elapsed = self.now() - start
+            self.depth -= 1
+            self.add(name, elapsed)
+            if self.depth == 0:
+                self.region_time += elapsed
+
+    def pop_region_time(self) -> float:
+        """Returns the time spent in top-level regions since the last call and resets it.
+
+        Returns:
+            float: time in seconds.
+        """
+
+        region_time = self.region_time
+        self.region_time = 0.0
+        return region_time
+
+    def summary(self) -> Dict[str, float]:
+        """Computes the median and 95th percentile of each stage, in milliseconds.
+
+        Returns:
+            Dict[str, float]: statistics indexed by "{stage}_p50_ms" and "{stage}_p95_ms".
+        """
+
+        summary = {}
+        for name, times in self.times.items():
+            if times:
+                p50, p95 = np.percentile(np.asarray(times) * 1000, [50, 95])
+                summary[f"{name}_p50_ms"] = float(p50)
+                summary[f"{name}_p95_ms"] = float(p95)
+        return summary
+
+
+class StepProfilerCallback(Callback):
+    def __init__(
+        self,
+        window: int = 100,
+        frequency: int = 50,
+        sync_cuda: bool = False,
+        trace_start_step: Optional[int] = None,
+        trace_num_steps: int = 5,
+        trace_dir: Union[str, Path] = Path("traces"),
+    ):
+        """Callback that breaks each training step into stages and logs rolling statistics of
+        their durations. Besides the regions placed in the methods (h2d, online_forward,
+        online_classifier, momentum_forward, knn and momentum_update), it measures data_wait,
+        loss (rest of the training step), backward, optimizer_step and step. Optionally, a
+        torch.profiler trace of a window of steps is stored.
+
+        Args:
+            window (int, optional): number of steps used for the statistics. Defaults to 100.
+            frequency (int, optional): number of steps between each logging of the statistics.
+                Defaults to 50.
+            sync_cuda (bool, optional): whether to synchronize CUDA around each region so that
+                GPU time is attributed to the right stage. Defaults to False.
+            trace_start_step (Optional[int], optional): global step at which the trace starts.
+                Defaults to None (no trace).
+            trace_num_steps (int, optional): number of steps traced. Defaults to 5.
+            trace_dir (Union[str, Path], optional): directory to store the traces in.
+                Defaults to Path("traces").
+        """
+
+        super().__init__()
+
+        self.profiler = StepProfiler(window=window, sync_cuda=sync_cuda)
+        self.frequency = frequency
+        self.trace_start_step = trace_start_step
+        self.trace_num_steps = trace_num_steps
+        self.trace_dir = Path(trace_dir)
+
+        self.torch_profiler: Optional[torch.profiler.profile] = None
+        self.traced_steps = 0
+        self.batch_end: Optional[float] = None
+        self.batch_start = 0.0
+        self.backward_start: Optional[float] = None
+        self.optimizer_start: Optional[float] = None
+
+    @staticmethod
+    def add_and_assert_specific_cfg(cfg: DictConfig) -> DictConfig:
+        """Adds specific default values/checks for config.
+
+        Args:
+            cfg (omegaconf.DictConfig): DictConfig object.
+
+        Returns:
+            omegaconf.DictConfig: same as the argument, used to avoid errors.
+        """
+
+        cfg.step_profiler = omegaconf_select(cfg, "step_profiler", default={})
+        cfg.step_profiler.enabled = omegaconf_select(cfg, "step_profiler.enabled", default=False)
+        cfg.step_profiler.window = omegaconf_select(cfg, "step_profiler.window", default=100)
+        cfg.step_profiler.frequency = omegaconf_select(cfg, "step_profiler.frequency", default=50)
+        cfg.step_profiler.sync_cuda = omegaconf_select(
+            cfg, "step_profiler.sync_cuda", default=False
+        )
+        cfg.step_profiler.trace = omegaconf_select(cfg, "step_profiler.trace", default={})
+        cfg.step_profiler.trace.start_step = omegaconf_select(
+            cfg, "step_profiler.trace.start_step", default=None
+        )
+        cfg.step_profiler.trace.num_steps = omegaconf_select(
+            cfg, "step_profiler.trace.num_steps", default=5
+        )
+        cfg.step_profiler.trace.dir = omegaconf_select(
+            cfg, "step_profiler.trace.dir", default="traces"
+        )
+
+        assert cfg.step_profiler.window > 0
+        assert cfg.step_profiler.frequency > 0
+
+        return cfg
+
+    def _activate(self, active: bool):
+        global _ACTIVE_PROFILER
+        _ACTIVE_PROFILER = self.profiler if active else None
+
+    def on_train_start(self, trainer: pl.Trainer, pl_module: pl.LightningModule):
+        """Activates the regions of the methods.
+
+        Args:
+            trainer (pl.Trainer): pytorch lightning trainer object.
+            pl_module (pl.LightningModule): pytorch lightning module.
+        """
+
+        self._activate(True)
+        self.batch_end = None
+
+    def on_validation_start(self, trainer: pl.Trainer, pl_module: pl.LightningModule):
+        """Pauses the regions during validation.
+
+        Args:
+            trainer (pl.Trainer): pytorch lightning trainer object.
+            pl_module (pl.LightningModule): pytorch lightning module.
+        """
+
+        self._activate(False)
+
+    def on_validation_end(self, trainer: pl.Trainer, pl_module: pl.LightningModule):
+        """Resumes the regions after validation, without counting it as data wait.
+
+        Args:
+            trainer (pl.Trainer): pytorch lightning trainer object.
+            pl_module (pl.LightningModule): pytorch lightning module.
+        """
+
+        if trainer.training:
+            self._activate(True)
+        self.batch_end = None
+
+    def on_train_batch_start(
+        self, trainer: pl.Trainer, pl_module: pl.LightningModule, batch: Any, batch_idx: int
+    ):
+        """Measures the data wait and starts the trace if needed.
+
+        Args:
+            trainer (pl.Trainer): pytorch lightning trainer object.
+            pl_module (pl.LightningModule): pytorch lightning module.
+            batch (Any): the batch of data.
+            batch_idx (int): index of the batch.
+        """
+
+        now = self.profiler.now()
+        # regions between batches (h2d, momentum update) are not data wait
+        between_batches = self.profiler.pop_region_time()
+        if self.batch_end is not None:
+            self.profiler.add("data_wait", max(now - self.batch_end - between_batches, 0.0))
+        self.batch_start = now
+        self.backward_start = None
+        self.optimizer_start = None
+
+        if (
+            self.trace_start_step is not None
+            and self.torch_profiler is None
+            and self.traced_steps == 0
+            and trainer.global_step >= self.trace_start_step
+        ):
+            activities = [torch.profiler.ProfilerActivity.CPU]
+            if torch.cuda.is_available():
+                activities.append(torch.profiler.ProfilerActivity.CUDA)
+            self.torch_profiler = torch.profiler.profile(activities=activities)
+            self.torch_profiler.__enter__()
+            self.profiler.tracing = True
+
+    def on_before_backward(
+        self, trainer: pl.Trainer, pl_module: pl.LightningModule, loss: torch.Tensor
+    ):
+        now = self.profiler.now()
+        # the training step minus the regions of the methods is the loss computation
+        step_regions = self.profiler.pop_region_time()
+        self.profiler.add("loss", max(now - self.batch_start - step_regions, 0.0))
+        self.backward_start = now
+
+    def on_after_backward(self, trainer: pl.Trainer, pl_module: pl.LightningModule):
+        if self.backward_start is not None:
+            self.profiler.add("backward", self.profiler.now() - self.backward_start)
+
+    def on_before_optimizer_step(
+        self, trainer: pl.Trainer, pl_module: pl.LightningModule, optimizer: torch.optim.Optimizer
+    ):
+        self.optimizer_start = self.profiler.now()
+
+    def on_train_batch_end(
+        self,
+        trainer: pl.Trainer,
+        pl_module: pl.LightningModule,
+        outputs: Any,
+        batch: Any,
+        batch_idx: int,
+    ):
+        """Measures the optimizer step, logs the statistics and stops the trace if needed.
+
+        Args:
+            trainer (pl.Trainer): pytorch lightning trainer object.
+            pl_module (pl.LightningModule): pytorch lightning module.
+            outputs (Any): outputs of the training step.
+            batch (Any): the batch of data.
+            batch_idx (int): index of the batch.
+        """
+
+        now = self.profiler.now()
+        if self.optimizer_start is not None:
+            self.profiler.add("optimizer_step", now - self.optimizer_start)
+        self.profiler.add("step", now - self.batch_start)
+        self.batch_end = now
+
+        if self.torch_profiler is not None:
+            self.traced_steps += 1
+            if self.traced_steps >= self.trace_num_steps:
+                self._stop_trace()
+
+        if (batch_idx + 1) % self.frequency == 0:
+            summary = self.profiler.summary()
+            pl_module.log_dict({f"prof_{k}": v for k, v in summary.items()}, on_step=True)
+
+    def _stop_trace(self):
+        self.torch_profiler.__exit__(None, None, None)
+        self.profiler.tracing = False
+        os.makedirs(self.trace_dir, exist_ok=True)
+        path = self.trace_dir / f"trace_rank{get_rank()}_step{self.trace_start_step}.json"
+        self.torch_profiler.export_chrome_trace(str(path))
+        self.torch_profiler = None
+
+    def on_train_end(self, trainer: pl.Trainer, pl_module: pl.LightningModule):
+        """Deactivates the regions and stores an unfinished trace.
+
+        Args:
+            trainer (pl.Trainer): pytorch lightning trainer object.
+            pl_module (pl.LightningModule): pytorch lightning module.
+        """
+
+        if self.torch_profiler is not None:
+            self._stop_trace()
+        self._activate(False)
@@ -19,12 +19,25 @@
 
 # Adapted from https://github.com/facebookresearch/swav.
 
+import math
+import time
+from typing import Optional
+
 import torch
 import torch.distributed as dist
 
+from solo.utils.misc import all_gather_into_tensor, get_world_size
+
 
 class SinkhornKnopp(torch.nn.Module):
-    def __init__(self, num_iters: int = 3, epsilon: float = 0.05, world_size: int = 1):
+    def __init__(
+        self,
+        num_iters: int = 3,
+        epsilon: float = 0.05,
+        world_size: int = 1,
+        log_domain: bool = False,
+        tol: Optional[float] = None,
+    ):
         """Approximates optimal transport using the Sinkhorn-Knopp algorithm.
 
         A simple iterative method to approach the double stochastic matrix is to alternately rescale
@@ -35,50 +48,115 @@ class SinkhornKnopp(torch.nn.Module):
                 Defaults to 3.
             epsilon (float, optional): weight for the entropy regularization term. Defaults to 0.05.
             world_size (int, optional): number of nodes for distributed training. Defaults to 1.
+            log_domain (bool, optional): whether to normalize the log of the matrix in fp32 with
+                logsumexp, which does not overflow for small epsilon or half precision inputs.
+                Defaults to False.
+            tol (Optional[float], optional): stops before num_iters iterations once the row
+                sums are within tol of their target (relative error). Defaults to None.
         """
 
         super().__init__()
         self.num_iters = num_iters
         self.epsilon = epsilon
         self.world_size = world_size
+        self.log_domain = log_domain
+        self.tol = tol
 
-    @torch.no_grad()
-    def forward(self, Q: torch.Tensor) -> torch.Tensor:
-        """Produces assignments using Sinkhorn-Knopp algorithm.
+        # statistics of the last call. last_time is the host wall-clock time without device
+        # synchronization: on GPU it only covers the launch of the kernels, unless tol is set
+        # and the convergence check waits for them at every iteration
+        self.last_num_iters = 0
+        self.last_time = 0.0
 
-        Applies the entropy regularization, normalizes the Q matrix and then normalizes rows and
-        columns in an alternating fashion for num_iter times. Before returning it normalizes again
-        the columns in order for the output to be an assignment of samples to prototypes.
+    @staticmethod
+    def _global_row_sums(Q: torch.Tensor) -> torch.Tensor:
+        """Sums the rows of Q over the columns of all processes with a single all_reduce."""
 
-        Args:
-            Q (torch.Tensor): cosine similarities between the features of the
-                samples and the prototypes.
+        sum_of_rows = torch.sum(Q, dim=1)
+        if dist.is_available() and dist.is_initialized():
+            dist.all_reduce(sum_of_rows)
+        return sum_of_rows
 
-        Returns:
-            torch.Tensor: assignment of samples to prototypes according to optimal transport.
-        """
+    @staticmethod
+    def _global_row_logsumexp(log_Q: torch.Tensor) -> torch.Tensor:
+        """Computes the logsumexp of the rows of log_Q over the columns of all processes. The local
+        logsumexps are exchanged with a single all_gather, as a sum of exponentials can not be
+        all-reduced without first agreeing on a shift."""
+
+        log_rows = torch.logsumexp(log_Q, dim=1)
+        if dist.is_available() and dist.is_initialized():
+            gathered = log_rows.new_empty(get_world_size() * log_rows.size(0))
+            all_gather_into_tensor(gathered, log_rows)
+            log_rows = torch.logsumexp(gathered.view(get_world_size(), -1), dim=0)
+        return log_rows
+
+    def _converged(self, row_error: torch.Tensor) -> bool:
+        return self.tol is not None and row_error.max().item() < self.tol
 
+    def _linear_forward(self, Q: torch.Tensor) -> torch.Tensor:
         Q = torch.exp(Q / self.epsilon).t()
         B = Q.shape[1] * self.world_size
         K = Q.shape[0]  # num prototypes
 
-        # make the matrix sums to 1
-        sum_Q = torch.sum(Q)
-        if dist.is_available() and dist.is_initialized():
-            dist.all_reduce(sum_Q)
-        Q /= sum_Q
-
-        for _ in range(self.num_iters):
+        # the matrix does not need to be scaled to sum to 1 first, as the first row normalization
+        # cancels any global scaling
+        self.last_num_iters = self.num_iters
+        for i in range(self.num_iters):
             # normalize each row: total weight per prototype must be 1/K
-            sum_of_rows = torch.sum(Q, dim=1, keepdim=True)
-            if dist.is_available() and dist.is_initialized():
-                dist.all_reduce(sum_of_rows)
-            Q /= sum_of_rows
-            Q /= K
+            sum_of_rows = self._global_row_sums(Q)
+            if i > 0 and self._converged((sum_of_rows * K - 1).abs()):
+                self.last_num_iters = i
+                break
+            Q /= sum_of_rows.unsqueeze(1) * K
 
             # normalize each column: total weight per sample must be 1/B
-            Q /= torch.sum(Q, dim=0, keepdim=True)
-            Q /= B
+            Q /= torch.sum(Q, dim=0, keepdim=True) * B
 
         Q *= B  # the colomns must sum to 1 so that Q is an assignment
         return Q.t()
+
+    def _log_forward(self, Q: torch.Tensor) -> torch.Tensor:
+        log_Q = (Q.float() / self.epsilon).t()
+        log_B = math.log(Q.shape[0] * self.world_size)
+        log_K = math.log(log_Q.shape[0])  # num prototypes
+
+        self.last_num_iters = self.num_iters
+        for i in range(self.num_iters):
+            # normalize each row: total weight per prototype must be 1/K
+            log_rows = self._global_row_logsumexp(log_Q) + log_K
+            if i > 0 and self._converged(torch.expm1(log_rows).abs()):
+                self.last_num_iters = i
+                break
+            log_Q -= log_rows.unsqueeze(1)
+
+            # normalize each column: total weight per sample must be 1/B
+            log_Q -= torch.logsumexp(log_Q, dim=0, keepdim=True) + log_B
+
+        # the colomns must sum to 1 so that Q is an assignment
+        return torch.exp(log_Q + log_B).t().to(Q.dtype)
+
+    @torch.no_grad()
+    def forward(self, Q: torch.Tensor) -> torch.Tensor:
+        """Produces assignments using Sinkhorn-Knopp algorithm.
+
+        Applies the entropy regularization and then normalizes rows and columns in an
+        alternating fashion for up to num_iter times, stopping early if the rows are within tol
+        of their target. The last normalization is over the columns, in order for the output to
+        be an assignment of samples to prototypes. Each iteration issues a single collective.
+
+        Args:
+            Q (torch.Tensor): cosine similarities between the features of the
+                samples and the prototypes. The features of a queue can be concatenated to the
+                samples, the returned assignments then also include the queue.
+
+        Returns:
+            torch.Tensor: assignment of samples to prototypes according to optimal transport.
+        """
+
+        start = time.perf_counter()
+        if self.log_domain:
+            Q = self._log_forward(Q)
+        else:
+            Q = self._linear_forward(Q)
+        self.last_time = time.perf_counter() - start
+        return Q
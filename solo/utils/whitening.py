@@ -23,7 +23,6 @@ from typing import Optional
 import torch
 import torch.nn as nn
 from torch.cuda.amp import custom_fwd
-from torch.nn.functional import conv2d
 
 
 class Whitening2d(nn.Module):
@@ -42,34 +41,35 @@ class Whitening2d(nn.Module):
 
     @custom_fwd(cast_inputs=torch.float32)
     def forward(self, x: torch.Tensor) -> torch.Tensor:
-        """Performs whitening using the Cholesky decomposition.
+        """Performs whitening using the Cholesky decomposition. Several slices can be whitened
+        independently in a single call by stacking them into a GxNxD tensor.
 
         Args:
-            x (torch.Tensor): a batch or slice of projected features.
+            x (torch.Tensor): a NxD batch or slice of projected features, or a GxNxD stack of
+                slices.
 
         Returns:
-            torch.Tensor: a batch or slice of whitened features.
+            torch.Tensor: a batch or slice of whitened features with the same shape as x.
         """
 
-        x = x.unsqueeze(2).unsqueeze(3)
-        m = x.mean(0).view(self.output_dim, -1).mean(-1).view(1, -1, 1, 1)
-        xn = x - m
+        batched = x.dim() == 3
+        if not batched:
+            x = x.unsqueeze(0)
 
-        T = xn.permute(1, 0, 2, 3).contiguous().view(self.output_dim, -1)
-        f_cov = torch.mm(T, T.permute(1, 0)) / (T.shape[-1] - 1)
+        xn = x - x.mean(1, keepdim=True)
+        f_cov = torch.bmm(xn.transpose(1, 2), xn) / (x.size(1) - 1)
 
-        eye = torch.eye(self.output_dim).type(f_cov.type())
+        # shrink towards the identity without materializing it
+        f_cov_shrinked = (1 - self.eps) * f_cov
+        f_cov_shrinked.diagonal(dim1=-2, dim2=-1).add_(self.eps)
 
-        f_cov_shrinked = (1 - self.eps) * f_cov + self.eps * eye
+        # the whitening matrix is the inverse of the Cholesky factor, so apply it with a
+        # triangular solve instead of inverting it
+        cholesky = torch.linalg.cholesky(f_cov_shrinked)
+        decorrelated = torch.triangular_solve(xn.transpose(1, 2), cholesky, upper=False)[0]
+        decorrelated = decorrelated.transpose(1, 2)
 
-        inv_sqrt = torch.triangular_solve(eye, torch.linalg.cholesky(f_cov_shrinked), upper=False)[
-            0
-        ]
-        inv_sqrt = inv_sqrt.contiguous().view(self.output_dim, self.output_dim, 1, 1)
-
-        decorrelated = conv2d(xn, inv_sqrt)
-
-        return decorrelated.squeeze(2).squeeze(2)
+        return decorrelated if batched else decorrelated.squeeze(0)
 
 
 class iterative_normalization_py(torch.autograd.Function):
@@ -17,6 +17,8 @@
 # OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 # DEALINGS IN THE SOFTWARE.
 
+import copy
+
 import torch
 from solo.backbones import (
     convnext_base,
@@ -41,6 +43,7 @@ from solo.backbones import (
     wide_resnet28w2,
     wide_resnet28w8,
 )
+from solo.utils.misc import checkpoint_units, enable_grad_checkpointing
 
 
 def test_backbones():
@@ -148,3 +151,41 @@ def test_backbones():
     dummy_data = torch.randn(6, 3, 224, 224)
     model = resnet50(method=None)
     assert isinstance(model(dummy_data), torch.Tensor)
+
+
+def test_grad_checkpointing():
+    models = [
+        resnet18(method=None),
+        wide_resnet28w2(method=None),
+        vit_tiny(method=None, patch_size=8, img_size=32),
+        vit_tiny(method="mae", patch_size=8, img_size=32),
+        swin_tiny(method=None, window_size=4, img_size=32),
+        convnext_tiny(method=None),
+        poolformer_s12(method=None),
+    ]
+    num_units = [4, 3, 12, 12, 12, 4, 12]
+
+    for model, n in zip(models, num_units):
+        assert len(checkpoint_units(model)) == n
+        assert len(enable_grad_checkpointing(copy.deepcopy(model), 0.5)) == round(n / 2)
+
+        checkpointed = copy.deepcopy(model)
+        enable_grad_checkpointing(checkpointed)
+        assert checkpointed.state_dict().keys() == model.state_dict().keys()
+
+        # seed both forwards, since the mae vit randomly shuffles the patches
+        x = torch.randn(4, 3, 32, 32)
+        torch.manual_seed(0)
+        out = model(x)
+        out.pow(2).sum().backward()
+        torch.manual_seed(0)
+        out_ckpt = checkpointed(x)
+        out_ckpt.pow(2).sum().backward()
+        assert torch.allclose(out, out_ckpt, atol=1e-5)
+        for p1, p2 in zip(model.parameters(), checkpointed.parameters()):
+            if p1.grad is not None:
+                assert torch.allclose(p1.grad, p2.grad, rtol=1e-4, atol=1e-5)
+
+        # batch norm statistics are only updated once per forward
+        for b1, b2 in zip(model.buffers(), checkpointed.buffers()):
+            assert torch.allclose(b1.float(), b2.float())
@@ -17,6 +17,7 @@
 # OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 # DEALINGS IN THE SOFTWARE.
 
+import pytest
 import torch
 from solo.losses import barlow_loss_func
 
@@ -39,3 +40,49 @@ def test_barlow_loss():
         z1.grad = z2.grad = None
 
     assert loss < initial_loss
+
+
+def reference_barlow_loss(z1, z2, lamb, scale_loss):
+    N, D = z1.size()
+    bn = torch.nn.BatchNorm1d(D, affine=False).to(z1)
+    z1 = bn(z1)
+    z2 = bn(z2)
+    corr = torch.einsum("bi, bj -> ij", z1, z2) / N
+    diag = torch.eye(D, dtype=corr.dtype)
+    cdif = (corr - diag).pow(2)
+    cdif[~diag.bool()] *= lamb
+    return scale_loss * cdif.sum()
+
+
+@pytest.mark.parametrize("b,f", [(16, 64), (64, 16)])
+@pytest.mark.parametrize("chunk_size", [None, 5])
+def test_barlow_loss_equivalence(b, f, chunk_size):
+    z1 = torch.randn(b, f)
+    z2 = torch.randn(b, f)
+
+    z1_ref, z2_ref = z1.clone().requires_grad_(), z2.clone().requires_grad_()
+    ref = reference_barlow_loss(z1_ref, z2_ref, lamb=5e-3, scale_loss=0.025)
+    ref.backward()
+
+    z1.requires_grad_(), z2.requires_grad_()
+    loss = barlow_loss_func(z1, z2, lamb=5e-3, scale_loss=0.025, chunk_size=chunk_size)
+    loss.backward()
+
+    assert torch.allclose(loss, ref, rtol=1e-4)
+    assert torch.allclose(z1.grad, z1_ref.grad, rtol=1e-4, atol=1e-6)
+    assert torch.allclose(z2.grad, z2_ref.grad, rtol=1e-4, atol=1e-6)
+
+
+@pytest.mark.parametrize("dtype", [torch.float16, torch.bfloat16])
+def test_barlow_loss_half_precision(dtype):
+    # the squared norm of the cross-correlation matrix overflows in half precision
+    z1 = torch.randn(256, 2048).to(dtype).requires_grad_()
+    z2 = torch.randn(256, 2048).to(dtype).requires_grad_()
+
+    with torch.autocast(device_type="cpu", dtype=dtype):
+        loss = barlow_loss_func(z1, z2, lamb=5e-3, scale_loss=0.025)
+    loss.backward()
+
+    ref = reference_barlow_loss(z1.detach().float(), z2.detach().float(), 5e-3, 0.025)
+    assert torch.allclose(loss, ref, rtol=1e-4)
+    assert torch.isfinite(z1.grad).all() and torch.isfinite(z2.grad).all()
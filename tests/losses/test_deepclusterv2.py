@@ -0,0 +1,38 @@
+# Copyright 2023 solo-learn development team.
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the
+# Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies
+# or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+# PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE
+# FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import torch
+import torch.nn.functional as F
+from solo.losses import deepclusterv2_loss_func
+
+
+def test_deepclusterv2_loss():
+    num_heads, b, f = 3, 16, 32
+    outputs = torch.randn(num_heads, 2, b, f, dtype=torch.float64)
+    assignments = torch.randint(0, f, (num_heads, b))
+    assignments[:, :3] = -1
+
+    # reference implementation looping over the heads
+    loss = 0
+    for h in range(num_heads):
+        scores = outputs[h].view(-1, f) / 0.1
+        loss += F.cross_entropy(scores, assignments[h].repeat(2), ignore_index=-1)
+    loss = loss / num_heads
+
+    assert torch.allclose(deepclusterv2_loss_func(outputs, assignments, temperature=0.1), loss)
@@ -18,6 +18,7 @@
 # DEALINGS IN THE SOFTWARE.
 
 import torch
+import torch.nn.functional as F
 from solo.losses import DINOLoss
 
 
@@ -49,3 +50,30 @@ def test_dino_loss():
         p.grad = None
 
     assert loss < initial_loss
+
+
+def test_dino_loss_multicrop():
+    b, f, num_crops = 8, 16, 4
+    p = torch.randn(num_crops * b, f, dtype=torch.float64)
+    p_momentum = torch.randn(2 * b, f, dtype=torch.float64)
+
+    dino_loss = DINOLoss(
+        num_prototypes=f,
+        warmup_teacher_temp=0.04,
+        teacher_temp=0.07,
+        warmup_teacher_temp_epochs=1,
+        num_epochs=2,
+        num_large_crops=num_crops,
+    ).double()
+
+    # reference implementation looping over all pairs of views
+    student_out = (p / dino_loss.student_temp).chunk(num_crops)
+    teacher_out = F.softmax((p_momentum - dino_loss.center) / 0.04, dim=-1).chunk(2)
+    losses = [
+        torch.sum(-q * F.log_softmax(v, dim=-1), dim=-1).mean()
+        for iq, q in enumerate(teacher_out)
+        for iv, v in enumerate(student_out)
+        if iv != iq
+    ]
+
+    assert torch.allclose(dino_loss(p, p_momentum), sum(losses) / len(losses))
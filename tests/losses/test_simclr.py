@@ -17,7 +17,9 @@
 # OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 # DEALINGS IN THE SOFTWARE.
 
+import pytest
 import torch
+import torch.nn.functional as F
 from solo.losses import simclr_loss_func
 
 
@@ -43,3 +45,34 @@ def test_simclr_loss():
         z1.grad = z2.grad = None
 
     assert loss < initial_loss
+
+
+def _dense_simclr_loss(z, indexes, temperature):
+    z = F.normalize(z, dim=-1)
+    sim = torch.exp(z @ z.T / temperature)
+    pos_mask = indexes.unsqueeze(0) == indexes.unsqueeze(1)
+    pos_mask.fill_diagonal_(False)
+    neg_mask = ~(indexes.unsqueeze(0) == indexes.unsqueeze(1))
+    pos = torch.sum(sim * pos_mask, 1)
+    neg = torch.sum(sim * neg_mask, 1)
+    return -(torch.mean(torch.log(pos / (pos + neg))))
+
+
+@pytest.mark.parametrize("chunk_size", [None, 1, 7, 64])
+@pytest.mark.parametrize("supervised", [False, True])
+def test_simclr_loss_chunked(chunk_size, supervised):
+    b, f = 32, 16
+    z = torch.randn(2 * b, f, dtype=torch.float64)
+    indexes = torch.randint(0, 5, (b,)) if supervised else torch.arange(b)
+    indexes = indexes.repeat(2)
+
+    z_ref = z.clone().requires_grad_()
+    ref = _dense_simclr_loss(z_ref, indexes, temperature=0.1)
+    ref.backward()
+
+    z_chunked = z.clone().requires_grad_()
+    loss = simclr_loss_func(z_chunked, indexes, temperature=0.1, chunk_size=chunk_size)
+    loss.backward()
+
+    assert torch.allclose(loss, ref)
+    assert torch.allclose(z_chunked.grad, z_ref.grad)
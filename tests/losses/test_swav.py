@@ -56,3 +56,20 @@ def test_swav_loss():
         z.grad = None
 
     assert loss < initial_loss
+
+
+def test_swav_loss_multicrop():
+    b, f, num_crops = 16, 32, 6
+    preds = [torch.randn(b, f, dtype=torch.float64) for _ in range(num_crops)]
+    assignments = [torch.softmax(p, dim=1) for p in preds[:2]]
+
+    # reference implementation looping over all pairs of views
+    losses = [
+        -torch.mean(torch.sum(a * torch.log_softmax(preds[v2] / 0.1, dim=1), dim=1))
+        for v1, a in enumerate(assignments)
+        for v2 in range(num_crops)
+        if v2 != v1
+    ]
+
+    loss = swav_loss_func(preds, assignments, temperature=0.1)
+    assert torch.allclose(loss, sum(losses) / len(losses))
@@ -17,8 +17,10 @@
 # OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 # DEALINGS IN THE SOFTWARE.
 
+import pytest
 import torch
 from solo.losses import vicreg_loss_func
+from solo.losses.vicreg import covariance_loss
 
 
 def test_vicreg_loss():
@@ -41,3 +43,47 @@ def test_vicreg_loss():
         z1.grad = z2.grad = None
 
     assert loss < initial_loss
+
+
+def reference_covariance_loss(z1, z2):
+    N, D = z1.size()
+    z1 = z1 - z1.mean(dim=0)
+    z2 = z2 - z2.mean(dim=0)
+    cov_z1 = (z1.T @ z1) / (N - 1)
+    cov_z2 = (z2.T @ z2) / (N - 1)
+    diag = torch.eye(D)
+    return cov_z1[~diag.bool()].pow_(2).sum() / D + cov_z2[~diag.bool()].pow_(2).sum() / D
+
+
+@pytest.mark.parametrize("b,f", [(16, 64), (64, 16)])
+@pytest.mark.parametrize("chunk_size", [None, 5])
+def test_covariance_loss_equivalence(b, f, chunk_size):
+    z1 = torch.randn(b, f)
+    z2 = torch.randn(b, f)
+
+    z1_ref, z2_ref = z1.clone().requires_grad_(), z2.clone().requires_grad_()
+    ref = reference_covariance_loss(z1_ref, z2_ref)
+    ref.backward()
+
+    z1.requires_grad_(), z2.requires_grad_()
+    loss = covariance_loss(z1, z2, chunk_size=chunk_size)
+    loss.backward()
+
+    assert torch.allclose(loss, ref, rtol=1e-4)
+    assert torch.allclose(z1.grad, z1_ref.grad, rtol=1e-4, atol=1e-6)
+    assert torch.allclose(z2.grad, z2_ref.grad, rtol=1e-4, atol=1e-6)
+
+
+@pytest.mark.parametrize("dtype", [torch.float16, torch.bfloat16])
+def test_covariance_loss_half_precision(dtype):
+    # the squared norm of the covariance matrices overflows in half precision
+    z1 = torch.randn(256, 2048).to(dtype).requires_grad_()
+    z2 = torch.randn(256, 2048).to(dtype).requires_grad_()
+
+    with torch.autocast(device_type="cpu", dtype=dtype):
+        loss = covariance_loss(z1, z2)
+    loss.backward()
+
+    ref = reference_covariance_loss(z1.detach().float(), z2.detach().float())
+    assert torch.allclose(loss, ref, rtol=1e-3)
+    assert torch.isfinite(z1.grad).all() and torch.isfinite(z2.grad).all()
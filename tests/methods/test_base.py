@@ -58,3 +58,68 @@ def test_base():
     model.extra_optimizer_args = {}
     optimizer = model.configure_optimizers()
     assert isinstance(optimizer, torch.optim.Optimizer)
+
+
+def test_group_crops():
+    cfg = gen_base_cfg("nothing", batch_size=2, num_classes=10, num_small_crops=2)
+    cfg.performance = {"group_crops": True, "group_crops_bn": "per_crop"}
+    model = BaseMethod(cfg)
+    model.no_channel_last = True
+
+    targets = torch.randint(0, 10, (4,))
+    X = [torch.randn(4, 3, 64, 64) for _ in range(2)] + [torch.randn(4, 3, 32, 32)]
+
+    grouped = model.forward_crops(model.base_training_step, X, targets)
+    model.group_crops = False
+    separate = model.forward_crops(model.base_training_step, X, targets)
+
+    # per-crop statistics give the same outputs as forwarding each crop separately
+    assert len(grouped) == len(separate) == 3
+    for out_grouped, out_separate in zip(grouped, separate):
+        assert torch.allclose(out_grouped["feats"], out_separate["feats"], atol=1e-5)
+    assert torch.allclose(
+        sum(out["loss"] for out in grouped), sum(out["loss"] for out in separate), atol=1e-5
+    )
+
+    # shared statistics normalize the whole group at once
+    model.group_crops = True
+    model.group_crops_bn = "shared"
+    shared = model.forward_crops(model.base_training_step, X, targets)
+    assert shared[0]["feats"].size() == separate[0]["feats"].size()
+    assert not torch.allclose(shared[0]["feats"], separate[0]["feats"], atol=1e-5)
+
+    # outputs are split by declaration, not by matching the size of the group
+    def forward_fn(X, targets):
+        out = model.base_training_step(X, targets)
+        out["class_counts"] = torch.bincount(targets % X.size(0), minlength=X.size(0))
+        return out
+
+    model._OUTPUT_BATCH_DIMS = {**BaseMethod._OUTPUT_BATCH_DIMS, "class_counts": None}
+    grouped = model.forward_crops(forward_fn, X[:2], targets)
+    assert all(out["class_counts"].size() == (8,) for out in grouped)
+    assert grouped[0]["loss"].dim() == 0
+
+
+def test_group_crops_grad_checkpointing():
+    cfg = gen_base_cfg("nothing", batch_size=2, num_classes=10)
+    cfg.performance = {"group_crops": True, "group_crops_bn": "per_crop"}
+    model = BaseMethod(cfg)
+    model.no_channel_last = True
+
+    cfg.backbone.grad_checkpointing = {"enabled": True}
+    checkpointed = BaseMethod(cfg)
+    checkpointed.no_channel_last = True
+    checkpointed.load_state_dict(model.state_dict())
+
+    targets = torch.randint(0, 10, (4,))
+    X = [torch.randn(4, 3, 32, 32) for _ in range(2)]
+
+    # the recomputation during backward also normalizes each crop with its own statistics
+    for m in (model, checkpointed):
+        outs = m.forward_crops(m.base_training_step, X, targets)
+        sum(out["feats"].pow(2).sum() for out in outs).backward()
+
+    for p1, p2 in zip(model.backbone.parameters(), checkpointed.backbone.parameters()):
+        assert torch.allclose(p1.grad, p2.grad, rtol=1e-4, atol=1e-5)
+    for b1, b2 in zip(model.backbone.buffers(), checkpointed.backbone.buffers()):
+        assert torch.allclose(b1.float(), b2.float())
@@ -99,3 +99,15 @@ def test_deepclusterv2():
         batch_size=cfg.optimizer.batch_size,
     )
     trainer.fit(model, train_dl, val_dl)
+
+    # compact memory banks and assignments
+    cfg.method_kwargs.memory_bank_dtype = "float16"
+    cfg.method_kwargs.memory_bank_on_cpu = True
+    cfg.method_kwargs.assignments_dtype = "int16"
+    model = DeepClusterV2(cfg)
+
+    trainer = gen_trainer(cfg)
+    trainer.fit(model, train_dl, val_dl)
+    assert model.local_memory_embeddings.dtype == torch.float16
+    assert model.local_memory_embeddings.device.type == "cpu"
+    assert model.assignments.dtype == torch.int16
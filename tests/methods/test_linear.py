@@ -98,3 +98,22 @@ def test_linear():
     model.extra_optimizer_args = {}
     optimizer = model.configure_optimizers()
     assert isinstance(optimizer, torch.optim.Optimizer)
+
+
+def test_linear_finetune_grad_checkpointing():
+    cfg = gen_base_cfg("none", batch_size=2, num_classes=100)
+    cfg.finetune = True
+    cfg.backbone.grad_checkpointing = {"enabled": True, "fraction": 0.5}
+
+    backbone = resnet18()
+    backbone.fc = nn.Identity()
+
+    model = LinearModel(backbone, cfg=cfg)
+    assert "forward" in vars(model.backbone.layer2) and "forward" not in vars(model.backbone.layer3)
+
+    trainer = gen_trainer(cfg)
+    train_dl, val_dl = prepare_classification_dummy_dataloaders(
+        "imagenet100",
+        num_classes=cfg.data.num_classes,
+    )
+    trainer.fit(model, train_dl, val_dl)
@@ -100,3 +100,27 @@ def test_mocov2plus():
         batch_size=cfg.optimizer.batch_size,
     )
     trainer.fit(model, train_dl, val_dl)
+
+
+def test_mocov2plus_legacy_queue():
+    cfg = gen_base_cfg("mocov2plus", batch_size=2, num_classes=10, momentum=True)
+    cfg.method_kwargs = {
+        "proj_output_dim": 16,
+        "proj_hidden_dim": 32,
+        "temperature": 0.2,
+        "queue_size": 64,
+    }
+    model = MoCoV2Plus(cfg)
+
+    # checkpoints saved before FeatureQueue stored the queue as (2, proj_output_dim, queue_size)
+    state_dict = model.state_dict()
+    legacy_queue = torch.randn(2, 16, 64)
+    state_dict["queue"] = legacy_queue
+    state_dict["queue_ptr"] = torch.tensor([5])
+    del state_dict["queue.features"], state_dict["queue.ptr"]
+
+    checkpoint = {"state_dict": state_dict}
+    model.on_load_checkpoint(checkpoint)
+    model.load_state_dict(checkpoint["state_dict"])
+    assert torch.equal(model.queue.get(), legacy_queue.transpose(1, 2))
+    assert model.queue.ptr.item() == 5
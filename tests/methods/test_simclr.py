@@ -17,8 +17,12 @@
 # OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 # DEALINGS IN THE SOFTWARE.
 
+import copy
+
 import torch
+from lightning.pytorch import Callback
 from solo.methods import SimCLR
+from torch.utils.data import DataLoader
 
 from .utils import gen_base_cfg, gen_batch, gen_trainer, prepare_dummy_dataloaders
 
@@ -114,3 +118,95 @@ def test_simclr():
         batch_size=cfg.optimizer.batch_size,
     )
     trainer.fit(model, train_dl, val_dl)
+
+    # gradient caching
+    cfg.grad_cache = {"enabled": True, "sub_batch_size": 1}
+    model = SimCLR(cfg)
+    assert not model.automatic_optimization
+
+    trainer = gen_trainer(cfg)
+    trainer.fit(model, train_dl, val_dl)
+
+
+def test_simclr_compile():
+    method_kwargs = {
+        "proj_output_dim": 256,
+        "proj_hidden_dim": 2048,
+        "temperature": 0.2,
+    }
+
+    cfg = gen_base_cfg("simclr", batch_size=2, num_classes=10, num_small_crops=2)
+    cfg.data.dataset = "cifar10"
+    cfg.method_kwargs = method_kwargs
+    cfg.performance = {"compile": {"enabled": True, "backend": "aot_eager"}}
+
+    torch._dynamo.reset()
+    model = SimCLR(cfg)
+    assert "simclr_loss_func" in model.compiled
+
+    trainer = gen_trainer(cfg)
+    train_dl, val_dl = prepare_dummy_dataloaders(
+        "cifar10",
+        num_large_crops=cfg.data.num_large_crops,
+        num_small_crops=cfg.data.num_small_crops,
+        num_classes=cfg.data.num_classes,
+        batch_size=cfg.optimizer.batch_size,
+    )
+    trainer.fit(model, train_dl, val_dl)
+
+    assert {"backbone", "projector", "simclr_loss_func"} <= set(model.compiled)
+    assert not any(fn.failed for fn in model.compiled.values())
+    # large and small crops are compiled separately
+    assert len(model.compiled["backbone"].compile_times) >= 2
+    assert "backbone:" in model.compile_report()
+
+
+class _GradCapture(Callback):
+    def __init__(self):
+        self.grads = {}
+
+    def on_before_optimizer_step(self, trainer, pl_module, optimizer):
+        self.grads = {
+            name: p.grad.detach().clone()
+            for name, p in pl_module.named_parameters()
+            if p.grad is not None and not name.startswith("classifier")
+        }
+
+
+def test_simclr_grad_cache_matches_full_batch():
+    method_kwargs = {
+        "proj_output_dim": 32,
+        "proj_hidden_dim": 64,
+        "temperature": 0.2,
+        "supervised": False,
+    }
+
+    # the vit backbone and the simclr projector have no batch statistics, so the cached
+    # step must reproduce the gradients of the plain full-batch step
+    cfg = gen_base_cfg("simclr", batch_size=8, num_classes=10)
+    cfg.backbone = {"name": "vit_tiny", "kwargs": {"img_size": 32, "patch_size": 8}}
+    cfg.data.dataset = "cifar10"
+    cfg.method_kwargs = method_kwargs
+
+    batch, _ = gen_batch(cfg.optimizer.batch_size, cfg.data.num_classes, "cifar10")
+    idx, (x1, x2), label = batch
+    samples = [(idx[i], [x1[i].detach(), x2[i].detach()], label[i]) for i in range(len(idx))]
+    train_dl = DataLoader(samples, batch_size=cfg.optimizer.batch_size)
+
+    torch.manual_seed(0)
+    model = SimCLR(cfg)
+    state_dict = copy.deepcopy(model.state_dict())
+    capture = _GradCapture()
+    gen_trainer(cfg, callbacks=capture).fit(model, train_dl)
+    full_batch_grads = capture.grads
+
+    cfg.grad_cache = {"enabled": True, "sub_batch_size": 3}
+    model = SimCLR(cfg)
+    model.load_state_dict(state_dict)
+    capture = _GradCapture()
+    gen_trainer(cfg, callbacks=capture).fit(model, train_dl)
+    cached_grads = capture.grads
+
+    assert full_batch_grads and full_batch_grads.keys() == cached_grads.keys()
+    for name, grad in full_batch_grads.items():
+        assert torch.allclose(grad, cached_grads[name], atol=1e-5, rtol=1e-4), name
@@ -97,3 +97,27 @@ def test_swav():
         batch_size=cfg.optimizer.batch_size,
     )
     trainer.fit(model, train_dl, val_dl)
+
+    # half precision ring buffer with cached prototype scores
+    cfg.method_kwargs.queue_dtype = "float16"
+    cfg.method_kwargs.queue_scores_staleness = 2
+    model = SwAV(cfg)
+
+    trainer = gen_trainer(cfg)
+    trainer.fit(model, train_dl, val_dl)
+    assert model.queue.features.dtype == torch.float16
+    assert model.score_queue.features.size(-1) == method_kwargs["num_prototypes"]
+
+    # the queue of a checkpoint is restored once it is created, also from checkpoints saved
+    # before the queue was a FeatureQueue
+    state_dict = model.state_dict()
+    state_dict["queue"] = state_dict.pop("queue.features")
+    del state_dict["queue.ptr"]
+    checkpoint = {"state_dict": state_dict}
+    new_model = SwAV(cfg)
+    new_model.on_load_checkpoint(checkpoint)
+    new_model.load_state_dict(checkpoint["state_dict"])
+    new_model.trainer = gen_trainer(cfg)
+    new_model.on_train_start()
+    assert torch.equal(new_model.queue.features, model.queue.features)
+    assert not new_model.queue_state
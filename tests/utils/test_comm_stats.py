@@ -0,0 +1,73 @@
+# Copyright 2023 solo-learn development team.
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the
+# Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies
+# or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+# PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE
+# FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+from solo.utils.comm_stats import CommStats, merge_comm_stats
+from solo.utils.misc import gather
+
+
+def _comm_stats_worker(rank, world_size, init_file):
+    dist.init_process_group(
+        "gloo", init_method=f"file://{init_file}", rank=rank, world_size=world_size
+    )
+    try:
+        all_reduce = dist.all_reduce
+        comm_stats = CommStats()
+        with comm_stats:
+            assert dist.all_reduce is not all_reduce
+            x = torch.ones(4, 8)
+            dist.all_reduce(x)
+            dist.all_reduce(x)
+            dist.broadcast(x, 0)
+            gather(torch.ones(3, 8, requires_grad=True)).sum().backward()
+        assert dist.all_reduce is all_reduce
+
+        stats = comm_stats.pop()
+        # backends without reduce_scatter also all-reduce in the backward of gather
+        sites = {k: v for k, v in stats["all_reduce"].items() if k.startswith(__name__)}
+        assert len(sites) == 2
+        assert sum(v["calls"] for v in sites.values()) == 2
+        assert all(v["bytes"] == 4 * 8 * 4 for v in sites.values())
+        assert list(stats["broadcast"].values())[0]["calls"] == 1
+
+        # the forward gather is attributed to the caller of gather
+        gather_stats = stats.get("all_gather_into_tensor", stats.get("all_gather"))
+        gather_sites = [site for site in gather_stats if site.startswith(__name__)]
+        assert len(gather_sites) == 1
+        assert gather_stats[gather_sites[0]]["bytes"] == world_size * 3 * 8 * 4
+
+        # nothing is recorded once disabled
+        dist.all_reduce(x)
+        assert comm_stats.pop() == {}
+
+        total = {}
+        merge_comm_stats(total, stats)
+        merge_comm_stats(total, stats)
+        assert total["broadcast"] == {
+            site: {k: 2 * v for k, v in values.items()}
+            for site, values in stats["broadcast"].items()
+        }
+    finally:
+        dist.destroy_process_group()
+
+
+def test_comm_stats(tmp_path):
+    mp.spawn(_comm_stats_worker, args=(2, str(tmp_path / "init")), nprocs=2, join=True)
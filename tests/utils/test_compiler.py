@@ -0,0 +1,98 @@
+# Copyright 2023 solo-learn development team.
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the
+# Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies
+# or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+# PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE
+# FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import pytest
+import torch
+import torch.nn as nn
+from solo.utils.compiler import CompiledFunction, compile_module, compile_report
+
+
+def _loss(x: torch.Tensor, y: torch.Tensor) -> torch.Tensor:
+    return (x.softmax(dim=-1) - y).pow(2).sum(dim=-1).mean()
+
+
+def _failing_backend(gm, example_inputs):
+    raise RuntimeError("unsupported")
+
+
+def test_compiled_function_inductor_cpu():
+    torch._dynamo.reset()
+    compiled = CompiledFunction(_loss, "loss", backend="inductor")
+
+    x = torch.randn(8, 16, requires_grad=True)
+    y = torch.randn(8, 16)
+    loss = compiled(x, y)
+    loss.backward()
+    grad = x.grad.clone()
+
+    x.grad = None
+    ref = _loss(x, y)
+    ref.backward()
+    assert torch.allclose(loss, ref, atol=1e-5)
+    assert torch.allclose(grad, x.grad, atol=1e-5)
+    assert not compiled.failed
+    assert list(compiled.compile_times) == ["(8x16, 8x16)"]
+
+    # new shapes (e.g. small crops) are reported separately
+    compiled(torch.randn(4, 16), torch.randn(4, 16))
+    compiled(torch.randn(4, 16), torch.randn(4, 16))
+    assert len(compiled.compile_times) == 2
+    assert "loss:" in compile_report({"loss": compiled})
+
+
+def test_compiled_function_fallback():
+    torch._dynamo.reset()
+    compiled = CompiledFunction(_loss, "loss", backend=_failing_backend)
+
+    x, y = torch.randn(8, 16), torch.randn(8, 16)
+    assert torch.allclose(compiled(x, y), _loss(x, y))
+    assert compiled.failed
+    assert torch.allclose(compiled(x, y), _loss(x, y))
+    assert "failed to compile" in compile_report({"loss": compiled})
+
+
+def test_compiled_function_runtime_error():
+    torch._dynamo.reset()
+    calls = []
+
+    def _checked_loss(x, y):
+        calls.append(x)
+        if x.sum() > 0:
+            raise ValueError("positive input")
+        return _loss(x, y)
+
+    compiled = CompiledFunction(_checked_loss, "loss", backend="aot_eager")
+    with pytest.raises(ValueError):
+        compiled(torch.ones(8, 16), torch.randn(8, 16))
+    # the error is not mistaken for a compilation failure, so the call is not replayed
+    assert len(calls) == 1
+    assert not compiled.failed
+
+
+def test_compile_module():
+    torch._dynamo.reset()
+    module = nn.Sequential(nn.Linear(16, 32), nn.ReLU(), nn.Linear(32, 8))
+    keys = list(module.state_dict().keys())
+
+    x = torch.randn(4, 16)
+    ref = module(x)
+    compile_module(module, "projector", backend="aot_eager", dynamic=True)
+    assert list(module.state_dict().keys()) == keys
+    assert torch.allclose(module(x), ref, atol=1e-6)
+    assert module(torch.randn(6, 16)).shape == (6, 8)
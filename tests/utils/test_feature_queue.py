@@ -0,0 +1,119 @@
+# Copyright 2023 solo-learn development team.
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the
+# Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies
+# or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+# PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE
+# FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import pytest
+import torch
+from solo.utils.feature_queue import FeatureQueue
+
+
+def reference_queue(batches, size):
+    # fifo reference: slot i holds the i-th sample modulo size
+    queue = {}
+    n = 0
+    for batch in batches:
+        for sample in batch:
+            queue[n % size] = sample
+            n += 1
+    return queue
+
+
+@pytest.mark.parametrize("batch_sizes", [[4, 4, 4, 4], [3, 5, 7, 2, 9], [13], [1] * 11])
+def test_feature_queue_wrap_around(batch_sizes):
+    size, dim = 10, 8
+    queue = FeatureQueue(size, dim, extra_fields=("y",))
+
+    batches = [torch.randn(b, dim) for b in batch_sizes]
+    labels = [torch.randint(100, (b,)) for b in batch_sizes]
+    for z, y in zip(batches, labels):
+        queue.enqueue(z, y=y)
+
+    expected = reference_queue(batches, size)
+    expected_y = reference_queue(labels, size)
+    for i, sample in expected.items():
+        assert torch.equal(queue.features[i], sample)
+        assert queue.y[i] == expected_y[i]
+    assert int(queue.ptr) == sum(batch_sizes) % size
+
+
+def test_feature_queue_views():
+    size, dim = 16, 4
+    queue = FeatureQueue(size, dim, num_views=2)
+    assert queue.features.size() == (2, size, dim)
+
+    z = torch.randn(2, 6, dim)
+    queue.enqueue(z)
+    queue.enqueue(z)
+    queue.enqueue(z)
+    assert torch.equal(queue.features[:, 2:6], z[:, 2:])
+    assert torch.equal(queue.features[:, 6:12], z)
+    assert torch.equal(queue.features[:, 12:], z[:, :4])
+    assert torch.equal(queue.features[:, :2], z[:, 4:])
+
+
+@pytest.mark.parametrize("dtype", [torch.float32, torch.float16, torch.bfloat16])
+def test_feature_queue_dtype(dtype):
+    queue = FeatureQueue(8, 4, dtype=dtype)
+    z = torch.randn(3, 4)
+    queue.enqueue(z)
+    assert queue.features.dtype == dtype
+    assert torch.allclose(queue.features[:3].float(), z, atol=1e-2)
+
+    # reads in the storage dtype do not copy the queue
+    assert queue.get().data_ptr() == queue.features.data_ptr()
+    assert queue.get(dtype).data_ptr() == queue.features.data_ptr()
+    assert queue.get(torch.float64).dtype == torch.float64
+
+
+def test_feature_queue_state_dict():
+    queue = FeatureQueue(8, 4, extra_fields=("y", "index"))
+    queue.enqueue(torch.randn(5, 4), y=torch.arange(5), index=torch.arange(5))
+    assert set(queue.state_dict()) == {"features", "y", "index", "ptr"}
+
+    new_queue = FeatureQueue(8, 4, extra_fields=("y", "index"))
+    new_queue.load_state_dict(queue.state_dict())
+    z = torch.randn(5, 4)
+    queue.enqueue(z, y=torch.arange(5), index=torch.arange(5))
+    new_queue.enqueue(z, y=torch.arange(5), index=torch.arange(5))
+    for name, value in queue.state_dict().items():
+        assert torch.equal(value, new_queue.state_dict()[name])
+
+
+def test_feature_queue_legacy_state_dict():
+    parent = torch.nn.Module()
+    parent.queue = FeatureQueue(8, 4, extra_fields=("y",))
+
+    # buffers registered directly in the methods before FeatureQueue existed
+    legacy = {
+        "queue": torch.randn(8, 4),
+        "queue_y": torch.arange(8),
+        "queue_ptr": torch.tensor([3]),
+    }
+    state_dict = dict(legacy)
+    parent.queue.convert_legacy_state_dict(state_dict, "queue")
+    assert set(state_dict) == {"queue.features", "queue.y", "queue.ptr"}
+
+    parent.load_state_dict(state_dict)
+    assert torch.equal(parent.queue.features, legacy["queue"])
+    assert torch.equal(parent.queue.y, legacy["queue_y"])
+    assert torch.equal(parent.queue.ptr, legacy["queue_ptr"])
+
+    # current state dicts are left untouched
+    state_dict = parent.state_dict()
+    parent.queue.convert_legacy_state_dict(state_dict, "queue")
+    assert set(state_dict) == {"queue.features", "queue.y", "queue.ptr"}
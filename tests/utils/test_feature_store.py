@@ -0,0 +1,140 @@
+# Copyright 2023 solo-learn development team.
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the
+# Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies
+# or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+# PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE
+# FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import pytest
+import torch
+from torch.utils.data import TensorDataset
+
+from solo.utils.feature_store import FeatureStore
+
+
+def test_feature_store(tmp_path):
+    ckpt = tmp_path / "model.ckpt"
+    torch.save({"state_dict": {}}, ckpt)
+
+    num_samples, features_dim = 50, 16
+    dataset = TensorDataset(torch.randn(num_samples, 8), torch.randint(0, 10, (num_samples,)))
+    proj = torch.randn(8, features_dim)
+
+    def forward_fn(x):
+        return {"backbone": x @ proj, "projector": x}
+
+    # first pass extracts everything
+    store = FeatureStore(tmp_path / "store", ckpt, "custom", flush_every=1)
+    out = store.extract(forward_fn, dataset, "train", ["backbone", "projector"], 8, 0, "cpu")
+    assert store.misses == ["train/backbone", "train/projector"] and not store.hits
+    feats, labels = out["backbone"]
+    assert feats.size() == (num_samples, features_dim) and feats.dtype == torch.float16
+    assert torch.allclose(feats.float(), dataset.tensors[0] @ proj, atol=1e-2, rtol=1e-2)
+    assert torch.equal(labels, dataset.tensors[1])
+
+    # second pass is a cache hit and does not call the model
+    store = FeatureStore(tmp_path / "store", ckpt, "custom")
+    out_cached = store.extract(None, dataset, "train", ["backbone", "projector"], 8, 0, "cpu")
+    assert store.hits == ["train/backbone", "train/projector"] and not store.misses
+    assert torch.equal(out_cached["projector"][0], out["projector"][0])
+
+    # different transforms generate different entries
+    store = FeatureStore(tmp_path / "store", ckpt, "custom", transform="other")
+    assert not store.exists("train", "backbone")
+
+
+def test_feature_store_resume(tmp_path):
+    ckpt = tmp_path / "model.ckpt"
+    torch.save({"state_dict": {}}, ckpt)
+
+    num_samples = 40
+    dataset = TensorDataset(torch.randn(num_samples, 8), torch.arange(num_samples))
+    seen = []
+
+    def failing_forward_fn(x):
+        if len(seen) == 3:
+            raise KeyboardInterrupt
+        seen.append(x.size(0))
+        return {"backbone": x}
+
+    store = FeatureStore(tmp_path / "store", ckpt, "custom", flush_every=1)
+    with pytest.raises(KeyboardInterrupt):
+        store.extract(failing_forward_fn, dataset, "val", ["backbone"], 4, 0, "cpu")
+    assert not store.exists("val", "backbone")
+
+    def forward_fn(x):
+        seen.append(x.size(0))
+        return {"backbone": x}
+
+    # only the samples that were not committed are extracted again
+    feats, labels = store.extract(forward_fn, dataset, "val", ["backbone"], 4, 0, "cpu")["backbone"]
+    assert sum(seen) == num_samples
+    assert torch.equal(labels, torch.arange(num_samples))
+    assert torch.allclose(feats.float(), dataset.tensors[0], atol=1e-2, rtol=1e-2)
+
+
+def test_feature_store_extract_multi(tmp_path):
+    num_samples, num_models = 40, 3
+    dataset = TensorDataset(torch.randn(num_samples, 8), torch.arange(num_samples))
+    stores, projs = [], []
+    for i in range(num_models):
+        ckpt = tmp_path / f"model{i}.ckpt"
+        torch.save({"state_dict": {"i": i}}, ckpt)
+        stores.append(FeatureStore(tmp_path / "store", ckpt, "custom", flush_every=1))
+        projs.append(torch.randn(8, 4))
+    seen = []
+
+    def make_forward_fn(proj, fail):
+        def forward_fn(x):
+            if fail and len(seen) == 5:
+                raise KeyboardInterrupt
+            seen.append(x.size(0))
+            return {"backbone": x @ proj}
+
+        return forward_fn
+
+    # each batch is written for all models before the next one is loaded, so an interrupted
+    # pass is resumed from the last committed batch
+    with pytest.raises(KeyboardInterrupt):
+        FeatureStore.extract_multi(
+            stores,
+            [make_forward_fn(p, i == 2) for i, p in enumerate(projs)],
+            dataset,
+            "train",
+            ["backbone"],
+            4,
+            0,
+            "cpu",
+        )
+    assert not any(store.exists("train", "backbone") for store in stores)
+
+    seen.clear()
+    outs = FeatureStore.extract_multi(
+        stores,
+        [make_forward_fn(p, False) for p in projs],
+        dataset,
+        "train",
+        ["backbone"],
+        4,
+        0,
+        "cpu",
+    )
+    assert sum(seen) == num_models * (num_samples - 4)
+    for store, out, proj in zip(stores, outs, projs):
+        feats, labels = out["backbone"]
+        assert store.misses == ["train/backbone"] * 2
+        assert feats.dtype == torch.float16
+        assert torch.allclose(feats.float(), dataset.tensors[0] @ proj, atol=1e-2, rtol=1e-2)
+        assert torch.equal(labels, dataset.tensors[1])
@@ -17,8 +17,17 @@
 # OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 # DEALINGS IN THE SOFTWARE.
 
+import pytest
 import torch
-from solo.utils.misc import gather
+import torch.distributed as dist
+import torch.multiprocessing as mp
+from solo.utils.misc import (
+    concat_all_gather_no_grad,
+    gather,
+    gather_async,
+    gathered_matmul,
+    pop_exposed_gather_time,
+)
 
 
 def test_gather_layer():
@@ -29,3 +38,89 @@ def test_gather_layer():
     dummy_loss = torch.mm(X_gathered, X_gathered.T).sum()
     dummy_loss.backward()
     assert X.grad is not None
+
+
+def _reference(sizes, dim):
+    torch.manual_seed(0)
+    xs = [torch.randn(n, 8, dtype=torch.double) for n in sizes]
+    return [x.movedim(0, dim).contiguous() for x in xs]
+
+
+def _gather_worker(rank, world_size, init_file, sizes, dim):
+    dist.init_process_group(
+        "gloo", init_method=f"file://{init_file}", rank=rank, world_size=world_size
+    )
+    try:
+        xs = _reference(sizes, dim)
+        uneven = len(set(sizes)) > 1
+
+        # each process computes a different loss on the gathered tensor
+        X = xs[rank].clone().requires_grad_(True)
+        X_gathered = gather(X, dim=dim, uneven=uneven)
+        assert torch.equal(X_gathered, torch.cat(xs, dim=dim))
+        ((rank + 1) * X_gathered.pow(2)).sum().backward()
+
+        # the reference sums the losses of all processes over the full tensor
+        full = torch.cat(xs, dim=dim).requires_grad_(True)
+        sum((r + 1) * full.pow(2).sum() for r in range(world_size)).backward()
+        ref_grad = full.grad.split(sizes, dim=dim)[rank]
+        assert torch.allclose(X.grad, ref_grad)
+
+        no_grad = concat_all_gather_no_grad(xs[rank].movedim(dim, 0), uneven=uneven)
+        assert torch.equal(no_grad, torch.cat(xs, dim=dim).movedim(dim, 0))
+    finally:
+        dist.destroy_process_group()
+
+
+@pytest.mark.parametrize("sizes,dim", [([4, 4], 0), ([3, 5], 0), ([2, 6], 1)])
+def test_gather_layer_distributed(tmp_path, sizes, dim):
+    mp.spawn(
+        _gather_worker,
+        args=(len(sizes), str(tmp_path / "init"), sizes, dim),
+        nprocs=len(sizes),
+        join=True,
+    )
+
+
+def _async_gather_worker(rank, world_size, init_file, sizes):
+    dist.init_process_group(
+        "gloo", init_method=f"file://{init_file}", rank=rank, world_size=world_size
+    )
+    try:
+        xs = _reference(sizes, 0)
+        uneven = len(set(sizes)) > 1
+        W = torch.randn(3, 8, dtype=torch.double, generator=torch.Generator().manual_seed(1))
+
+        # asynchronous gather and overlapped matmul match their synchronous counterparts
+        X = xs[rank].clone().requires_grad_(True)
+        handle = gather_async(X, uneven=uneven)
+        assert handle.offset == sum(sizes[:rank])
+        logits = gathered_matmul(W * (rank + 1), X, handle)
+        assert torch.allclose(logits, W * (rank + 1) @ torch.cat(xs).T)
+        logits.pow(2).sum().backward()
+
+        X_sync = xs[rank].clone().requires_grad_(True)
+        (W * (rank + 1) @ gather(X_sync, uneven=uneven).T).pow(2).sum().backward()
+        assert torch.allclose(X.grad, X_sync.grad)
+        assert pop_exposed_gather_time() >= 0
+        assert pop_exposed_gather_time() == 0
+    finally:
+        dist.destroy_process_group()
+
+
+@pytest.mark.parametrize("sizes", [[4, 4], [3, 5]])
+def test_gather_async_distributed(tmp_path, sizes):
+    mp.spawn(
+        _async_gather_worker,
+        args=(len(sizes), str(tmp_path / "init"), sizes),
+        nprocs=len(sizes),
+        join=True,
+    )
+
+
+def test_gather_async():
+    X = torch.randn(10, 30, requires_grad=True)
+    handle = gather_async(X)
+    assert handle.offset == 0
+    assert torch.equal(handle.wait(), X)
+    assert torch.allclose(gathered_matmul(X, X), X @ X.T)
@@ -0,0 +1,111 @@
+# Copyright 2023 solo-learn development team.
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the
+# Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies
+# or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+# PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE
+# FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import torch
+import torch.nn as nn
+from solo.losses import simclr_loss_func
+from solo.utils.grad_cache import (
+    RandContext,
+    detach_outputs,
+    flatten_tensors,
+    merge_outputs,
+    split_batch,
+)
+from solo.utils.misc import preserve_batch_norm_stats
+
+
+def test_grad_cache():
+    torch.manual_seed(0)
+    b, f = 16, 8
+    model = nn.Sequential(nn.Linear(f, 32), nn.Dropout(0.2), nn.Linear(32, 4)).double()
+
+    def forward_fn(batch):
+        _, X, _ = batch
+        z = [model(x) for x in X]
+        return {"z": z, "loss": sum(zi.pow(2).mean() for zi in z)}
+
+    def loss_fn(out, indexes):
+        return simclr_loss_func(torch.cat(out["z"]), indexes.repeat(2)) + out["loss"]
+
+    indexes = torch.arange(b)
+    X = [torch.randn(b, f, dtype=torch.float64) for _ in range(2)]
+    batch = [indexes, X, indexes]
+
+    # dropout masks depend on the shape of the input, so compare without them
+    model.eval()
+
+    # full batch
+    loss = loss_fn(forward_fn(batch), indexes)
+    loss.backward()
+    grads = [p.grad.clone() for p in model.parameters()]
+    model.zero_grad()
+
+    # cached sub-batches, reproducing the random state of the full batch
+    sub_batches = split_batch(batch, 5)
+    assert [sub_batch[2].size(0) for sub_batch in sub_batches] == [5, 5, 5, 1]
+    rand_states, outs = [], []
+    with torch.no_grad():
+        for sub_batch in sub_batches:
+            rand_states.append(RandContext())
+            outs.append(detach_outputs(forward_fn(sub_batch)))
+    merged = merge_outputs(outs, [5, 5, 5, 1])
+    cached_loss = loss_fn(merged, indexes)
+    cached_loss.backward()
+    for sub_batch, rand_state, out in zip(sub_batches, rand_states, outs):
+        with rand_state:
+            replayed = flatten_tensors(forward_fn(sub_batch))
+        surrogate = sum(
+            (t * cached.grad).sum() for t, cached in zip(replayed, flatten_tensors(out))
+        )
+        surrogate.backward()
+
+    assert torch.allclose(cached_loss, loss)
+    for p, g in zip(model.parameters(), grads):
+        assert torch.allclose(p.grad, g)
+
+
+def test_rand_context():
+    dropout = nn.Dropout(0.5)
+    x = torch.ones(100)
+
+    state = RandContext()
+    y1 = dropout(x)
+    y2 = dropout(x)
+    with state:
+        y3 = dropout(x)
+    y4 = dropout(x)
+
+    assert torch.equal(y1, y3)
+    assert not torch.equal(y1, y2)
+    # replaying does not change the random state outside the context
+    assert not torch.equal(y4, y1) and not torch.equal(y4, y2)
+
+
+def test_preserve_batch_norm_stats():
+    model = nn.Sequential(nn.Linear(8, 16), nn.BatchNorm1d(16))
+    model(torch.randn(4, 8))
+    stats = {name: b.clone() for name, b in model.named_buffers()}
+
+    with torch.no_grad(), preserve_batch_norm_stats(model):
+        model(torch.randn(4, 8))
+    for name, b in model.named_buffers():
+        assert torch.equal(b, stats[name])
+
+    model(torch.randn(4, 8))
+    assert model[1].num_batches_tracked == 2
@@ -0,0 +1,45 @@
+# Copyright 2023 solo-learn development team.
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the
+# Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies
+# or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+# PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE
+# FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import torch
+import torch.nn as nn
+from solo.utils.misc import (
+    inference_autocast,
+    prepare_model_for_inference,
+    setup_inference_device,
+)
+
+
+def test_inference_helpers():
+    num_threads = torch.get_num_threads()
+    device = setup_inference_device("cpu", num_threads=1)
+    assert device.type == "cpu" and torch.get_num_threads() == 1
+    torch.set_num_threads(num_threads)
+
+    model = nn.Sequential(nn.Conv2d(3, 8, 3), nn.Flatten(), nn.LazyLinear(4))
+    x = torch.randn(2, 3, 8, 8)
+    model(x)
+
+    model = prepare_model_for_inference(model, device, "resnet18")
+    assert model[0].weight.is_contiguous(memory_format=torch.channels_last)
+
+    with inference_autocast(device, bf16=True):
+        assert model(x).dtype == torch.bfloat16
+    with inference_autocast(device, bf16=False):
+        assert model(x).dtype == torch.float32
@@ -1,5 +1,9 @@
 import torch
-from solo.utils.kmeans import KMeans
+import torch.distributed as dist
+import torch.multiprocessing as mp
+import torch.nn.functional as F
+from solo.utils.comm_stats import CommStats
+from solo.utils.kmeans import KMeans, MiniBatchKMeans
 
 
 def test_kmeans():
@@ -11,3 +15,161 @@ def test_kmeans():
     assert assignments.size() == (1, 500)
     assert len(assignments.unique()) == 30
     assert centroids_list[0].size() == (30, 128)
+
+
+def reference_cluster_memory(kmeans, local_memory_index, local_memory_embeddings):
+    # dense E step and per-cluster python loop in the M step
+    j = 0
+    assignments = -torch.ones(len(kmeans.num_prototypes), kmeans.dataset_size).long()
+    centroids_list = []
+    for i_K, K in enumerate(kmeans.num_prototypes):
+        random_idx = torch.randperm(len(local_memory_embeddings[j]))[:K]
+        centroids = local_memory_embeddings[j][random_idx]
+        for n_iter in range(kmeans.kmeans_iters + 1):
+            _, local_assignments = torch.mm(local_memory_embeddings[j], centroids.t()).max(dim=1)
+            if n_iter == kmeans.kmeans_iters:
+                break
+            counts = torch.zeros(K).int()
+            emb_sums = torch.zeros(K, kmeans.proj_features_dim)
+            for k in range(K):
+                where = torch.where(local_assignments == k)[0]
+                if len(where) > 0:
+                    emb_sums[k] = local_memory_embeddings[j][where].sum(dim=0)
+                    counts[k] = len(where)
+            mask = counts > 0
+            centroids[mask] = emb_sums[mask] / counts[mask].unsqueeze(1)
+            centroids = F.normalize(centroids, dim=1, p=2)
+        centroids_list.append(centroids)
+        assignments[i_K][local_memory_index] = local_assignments
+        j = (j + 1) % kmeans.num_large_crops
+    return assignments, centroids_list
+
+
+def test_kmeans_matches_reference():
+    n, d, k = 2000, 32, [50, 40, 30]
+    local_memory_index = torch.randperm(n)
+    local_memory_embeddings = F.normalize(torch.randn(2, n, d), dim=-1)
+
+    # small distance matrix to force a chunked E step
+    kmeans = KMeans(1, 0, 2, n, d, k, kmeans_iters=5, max_distance_matrix_size=n * 10)
+
+    torch.manual_seed(0)
+    assignments, centroids_list = kmeans.cluster_memory(local_memory_index, local_memory_embeddings)
+    torch.manual_seed(0)
+    ref_assignments, ref_centroids_list = reference_cluster_memory(
+        kmeans, local_memory_index, local_memory_embeddings
+    )
+
+    assert torch.equal(assignments, ref_assignments)
+    for centroids, ref_centroids in zip(centroids_list, ref_centroids_list):
+        assert torch.allclose(centroids, ref_centroids, atol=1e-5)
+
+
+def test_kmeans_plus_plus():
+    n, d, k = 600, 16, [6]
+    # well separated clusters around random directions
+    centers = F.normalize(torch.randn(k[0], d), dim=-1)
+    embeddings = F.normalize(centers.repeat_interleave(n // k[0], 0) + 0.01 * torch.randn(n, d))
+    kmeans = KMeans(1, 0, 1, n, d, k, kmeans_iters=0, init="kmeans++")
+    centroids = kmeans.kmeans_plus_plus_init(embeddings, k[0])
+
+    # seeding picks one sample from each cluster
+    closest_center = (centroids @ centers.t()).argmax(dim=1)
+    assert len(closest_center.unique()) == k[0]
+
+    assignments, centroids_list = kmeans.cluster_memory(torch.arange(n), embeddings.unsqueeze(0))
+    assert assignments.size() == (1, n)
+    assert centroids_list[0].size() == (k[0], d)
+
+
+def _kmeans_plus_plus_worker(rank, world_size, init_file):
+    dist.init_process_group(
+        "gloo", init_method=f"file://{init_file}", rank=rank, world_size=world_size
+    )
+    try:
+        n, d, K = 100, 16, 8
+        # different samples in each rank
+        torch.manual_seed(rank)
+        embeddings = F.normalize(torch.randn(n, d), dim=-1)
+        kmeans = KMeans(world_size, rank, 1, n * world_size, d, [K], init="kmeans++")
+
+        with CommStats() as comm_stats:
+            centroids = kmeans.kmeans_plus_plus_init(embeddings, K)
+        stats = comm_stats.pop()
+        assert sum(v["calls"] for v in stats["all_gather"].values()) == K
+        assert "broadcast" not in stats
+
+        # all ranks pick the same centroids among the samples of all ranks
+        all_centroids = [torch.empty_like(centroids) for _ in range(world_size)]
+        all_embeddings = [torch.empty_like(embeddings) for _ in range(world_size)]
+        dist.all_gather(all_centroids, centroids)
+        dist.all_gather(all_embeddings, embeddings)
+        assert all(torch.equal(c, centroids) for c in all_centroids)
+        matches = centroids.unsqueeze(1) == torch.cat(all_embeddings).unsqueeze(0)
+        assert matches.all(dim=2).any(dim=1).all()
+    finally:
+        dist.destroy_process_group()
+
+
+def test_kmeans_plus_plus_distributed(tmp_path):
+    mp.spawn(_kmeans_plus_plus_worker, args=(2, str(tmp_path / "init")), nprocs=2, join=True)
+
+
+def test_minibatch_kmeans():
+    n, d, k = 1000, 32, [20, 10]
+    local_memory_index = torch.randperm(n)
+    local_memory_embeddings = F.normalize(torch.randn(2, n, d), dim=-1)
+    kmeans = MiniBatchKMeans(1, 0, 2, n, d, k, kmeans_iters=20, batch_size=128)
+    assignments, centroids_list = kmeans.cluster_memory(local_memory_index, local_memory_embeddings)
+
+    assert assignments.size() == (2, n)
+    assert (assignments >= 0).all()
+    for centroids, K in zip(centroids_list, k):
+        assert centroids.size() == (K, d)
+        assert torch.allclose(centroids.norm(dim=1), torch.ones(K), atol=1e-5)
+
+
+def test_kmeans_warm_start():
+    n, d, k = 1000, 32, [20]
+    local_memory_index = torch.arange(n)
+    local_memory_embeddings = F.normalize(torch.randn(1, n, d), dim=-1)
+    kmeans = KMeans(1, 0, 1, n, d, k, kmeans_iters=100)
+    _, centroids_list = kmeans.cluster_memory(local_memory_index, local_memory_embeddings)
+
+    # warm-starting from converged centroids keeps them (almost) unchanged
+    init_centroids = [c.clone() for c in centroids_list]
+    kmeans.kmeans_iters = 1
+    _, warm_centroids_list = kmeans.cluster_memory(
+        local_memory_index, local_memory_embeddings, init_centroids
+    )
+    assert torch.allclose(warm_centroids_list[0], init_centroids[0], atol=1e-2)
+
+
+def test_kmeans_compact_storage():
+    n, d, k = 1000, 32, [20, 10]
+    local_memory_index = torch.randperm(n)
+    # values representable in fp16 so that both memory banks hold the same embeddings
+    local_memory_embeddings = F.normalize(torch.randn(2, n, d), dim=-1).half().float()
+
+    kmeans = KMeans(1, 0, 2, n, d, k, kmeans_iters=5)
+    torch.manual_seed(0)
+    assignments, centroids_list = kmeans.cluster_memory(local_memory_index, local_memory_embeddings)
+
+    compact_kmeans = KMeans(1, 0, 2, n, d, k, kmeans_iters=5, assignments_dtype=torch.int16)
+    torch.manual_seed(0)
+    compact_assignments, compact_centroids_list = compact_kmeans.cluster_memory(
+        local_memory_index, local_memory_embeddings.half()
+    )
+    assert compact_assignments.dtype == torch.int16
+    assert torch.equal(compact_assignments.long(), assignments)
+    for centroids, compact_centroids in zip(centroids_list, compact_centroids_list):
+        assert torch.allclose(centroids, compact_centroids, atol=1e-5)
+
+    # only keep the assignments of a subset of the dataset
+    needed_indices = torch.arange(0, n, 3)
+    torch.manual_seed(0)
+    sliced_assignments, _ = compact_kmeans.cluster_memory(
+        local_memory_index, local_memory_embeddings.half(), needed_indices=needed_indices
+    )
+    assert sliced_assignments.size() == (2, len(needed_indices))
+    assert torch.equal(sliced_assignments.long(), assignments[:, needed_indices])
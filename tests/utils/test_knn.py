@@ -17,8 +17,19 @@
 # OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 # DEALINGS IN THE SOFTWARE.
 
+import argparse
+import json
+
+import pytest
 import torch
+import torch.nn as nn
 import torch.nn.functional as F
+from omegaconf import OmegaConf
+from torch.utils.data import TensorDataset
+
+import main_knn
+from main_knn import find_checkpoints, main_all_checkpoints
+from solo.methods.base import BaseMethod
 from solo.utils.knn import WeightedKNNClassifier
 
 
@@ -59,3 +70,87 @@ def test_knn():
     assert acc1 >= 0 and acc1 <= 100
     assert acc5 >= 0 and acc5 <= 100
     assert acc5 >= acc1
+
+
+def _save_tiny_checkpoints(ckpt_dir, epochs):
+    cfg = OmegaConf.create(
+        {"method": "simclr", "backbone": {"name": "resnet18"}, "data": {"dataset": "cifar10"}}
+    )
+    for epoch in epochs:
+        backbone = BaseMethod._BACKBONES["resnet18"]("simclr")
+        backbone.fc = nn.Identity()
+        backbone.conv1 = nn.Conv2d(3, 64, kernel_size=3, stride=1, padding=2, bias=False)
+        backbone.maxpool = nn.Identity()
+        state = {f"backbone.{k}": v for k, v in backbone.state_dict().items()}
+        torch.save({"state_dict": state}, ckpt_dir / f"simclr-abc-ep={epoch}.ckpt")
+    return cfg
+
+
+def test_find_checkpoints(tmp_path):
+    _save_tiny_checkpoints(tmp_path, [0, 1, 2, 10])
+    (tmp_path / "args.json").touch()
+    (tmp_path / "simclr-abc-ep=3.ckpt.tmp").touch()
+
+    ckpts = find_checkpoints(tmp_path)
+    assert [epoch for epoch, _ in ckpts] == [0, 1, 2, 10]
+    assert all(path.parent == tmp_path for _, path in ckpts)
+    assert [epoch for epoch, _ in find_checkpoints(tmp_path, frequency=2)] == [0, 2, 10]
+
+
+def test_knn_all_checkpoints(tmp_path, monkeypatch):
+    torch.manual_seed(0)
+    cfg = _save_tiny_checkpoints(tmp_path, [0, 1])
+
+    num_classes = 2
+    train_dataset = TensorDataset(torch.randn(12, 3, 32, 32), torch.arange(12) % num_classes)
+    val_dataset = TensorDataset(torch.randn(6, 3, 32, 32), torch.arange(6) % num_classes)
+    monkeypatch.setattr(main_knn, "prepare_transforms", lambda dataset: (None, "T"))
+    monkeypatch.setattr(
+        main_knn, "prepare_datasets", lambda *args, **kwargs: (train_dataset, val_dataset)
+    )
+
+    args = argparse.Namespace(
+        feature_type=["backbone"],
+        checkpoint_frequency=1,
+        checkpoints_per_pass=1,
+        device="cpu",
+        num_threads=1,
+        num_workers=0,
+        batch_size=4,
+        bf16=False,
+        dataset="custom",
+        train_data_path=None,
+        val_data_path=None,
+        data_format="image_folder",
+        feature_store_dir=str(tmp_path / "store"),
+        k=[2],
+        distance_function=["euclidean"],
+        temperature=[0.07],
+    )
+
+    main_all_checkpoints(args, cfg, tmp_path)
+    with open(tmp_path / "knn_curve.json") as f:
+        curve = json.load(f)
+    assert [point["epoch"] for point in curve] == [0, 1]
+    assert all(0 <= point["acc1"] <= point["acc5"] <= 100 for point in curve)
+
+    # the second evaluation reads all features from the store and produces the same curve
+    load_backbone = main_knn.load_backbone
+    monkeypatch.setattr(main_knn, "load_backbone", None)
+    main_all_checkpoints(args, cfg, tmp_path)
+    with open(tmp_path / "knn_curve.json") as f:
+        assert json.load(f) == curve
+
+    # without a store, features of several checkpoints are extracted in the same pass and
+    # streamed to a temporary store
+    args.feature_store_dir = None
+    args.checkpoints_per_pass = 2
+    monkeypatch.setattr(main_knn, "load_backbone", load_backbone)
+    main_all_checkpoints(args, cfg, tmp_path)
+    with open(tmp_path / "knn_curve.json") as f:
+        assert json.load(f) == curve
+
+    # only backbone features can be evaluated for all checkpoints
+    args.feature_type = ["backbone", "projector"]
+    with pytest.raises(ValueError, match="--feature_type backbone"):
+        main_all_checkpoints(args, cfg, tmp_path)
@@ -0,0 +1,124 @@
+# Copyright 2023 solo-learn development team.
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the
+# Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies
+# or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+# PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE
+# FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import copy
+
+import torch
+import torch.nn as nn
+from solo.utils.momentum import MomentumUpdater, initialize_momentum_params, is_flat
+
+
+def gen_net():
+    return nn.Sequential(nn.Linear(8, 16), nn.BatchNorm1d(16), nn.ReLU(), nn.Linear(16, 4))
+
+
+def perturb(net):
+    with torch.no_grad():
+        for p in net.parameters():
+            p.add_(torch.randn_like(p))
+    net(torch.randn(32, 8))  # updates BN running stats
+
+
+def test_initialize_momentum_params():
+    online_net, momentum_net = gen_net(), gen_net()
+    perturb(online_net)
+    initialize_momentum_params(online_net, momentum_net)
+    for po, pm in zip(online_net.parameters(), momentum_net.parameters()):
+        assert torch.equal(po, pm)
+        assert not pm.requires_grad
+    for bo, bm in zip(online_net.buffers(), momentum_net.buffers()):
+        assert torch.equal(bo, bm)
+
+
+def test_momentum_update():
+    online_net, momentum_net = gen_net(), gen_net()
+    initialize_momentum_params(online_net, momentum_net)
+    perturb(online_net)
+    ref_momentum_net = copy.deepcopy(momentum_net)
+
+    updater = MomentumUpdater(0.9, 1.0)
+    updater.update(online_net, momentum_net)
+    for po, pm, pr in zip(
+        online_net.parameters(), momentum_net.parameters(), ref_momentum_net.parameters()
+    ):
+        assert torch.allclose(pm, 0.9 * pr + 0.1 * po)
+
+    # buffers are only updated if requested
+    for bm, br in zip(momentum_net.buffers(), ref_momentum_net.buffers()):
+        assert torch.equal(bm, br)
+
+    updater = MomentumUpdater(0.9, 1.0, update_buffers=True)
+    updater.update(online_net, momentum_net)
+    bn_online, bn_momentum = online_net[1], momentum_net[1]
+    bn_ref = ref_momentum_net[1]
+    expected = 0.9 * bn_ref.running_mean + 0.1 * bn_online.running_mean
+    assert torch.allclose(bn_momentum.running_mean, expected)
+    assert torch.equal(bn_momentum.num_batches_tracked, bn_online.num_batches_tracked)
+
+
+def test_momentum_update_every():
+    online_net, momentum_net = gen_net(), gen_net()
+    initialize_momentum_params(online_net, momentum_net)
+    perturb(online_net)
+    ref_momentum_net = copy.deepcopy(momentum_net)
+
+    # one update every 4 steps matches 4 updates towards the same online network
+    updater = MomentumUpdater(0.9, 1.0, update_every=4)
+    ref_updater = MomentumUpdater(0.9, 1.0)
+    assert [step for step in range(1, 9) if updater.should_update(step)] == [4, 8]
+
+    updater.update(online_net, momentum_net)
+    for _ in range(4):
+        ref_updater.update(online_net, ref_momentum_net)
+    for pm, pr in zip(momentum_net.parameters(), ref_momentum_net.parameters()):
+        assert torch.allclose(pm, pr, atol=1e-6)
+
+
+def test_flat_momentum_params():
+    online_net, momentum_net = gen_net(), gen_net()
+    initialize_momentum_params(online_net, momentum_net)
+    perturb(online_net)
+    ref_momentum_net = copy.deepcopy(momentum_net)
+    state_dict_keys = set(momentum_net.state_dict())
+
+    updater = MomentumUpdater(0.9, 1.0, flat_params=True)
+    ref_updater = MomentumUpdater(0.9, 1.0)
+    updater.update(online_net, momentum_net)
+    ref_updater.update(online_net, ref_momentum_net)
+
+    params = list(momentum_net.parameters())
+    flat = updater._get_params(online_net, momentum_net)[2]
+    assert flat is not None and is_flat(params, flat)
+    assert flat.numel() == sum(p.numel() for p in params)
+    for pm, pr in zip(params, ref_momentum_net.parameters()):
+        assert torch.allclose(pm, pr)
+
+    # checkpoints keep the same keys and loading copies into the flat buffer
+    assert set(momentum_net.state_dict()) == state_dict_keys
+    momentum_net.load_state_dict(ref_momentum_net.state_dict())
+    assert is_flat(params, flat)
+
+    # moving the network breaks the views, which are rebuilt on the next update
+    momentum_net.to(torch.float64).to(torch.float32)
+    assert not is_flat(params, flat)
+    updater.update(online_net, momentum_net)
+    ref_updater.update(online_net, ref_momentum_net)
+    assert is_flat(params, updater._get_params(online_net, momentum_net)[2])
+    for pm, pr in zip(params, ref_momentum_net.parameters()):
+        assert torch.allclose(pm, pr)
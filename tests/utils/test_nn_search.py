@@ -0,0 +1,60 @@
+# Copyright 2023 solo-learn development team.
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the
+# Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies
+# or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+# PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE
+# FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import pytest
+import torch
+import torch.nn.functional as F
+from solo.utils.feature_queue import FeatureQueue
+from solo.utils.nn_search import chunked_topk
+
+
+@pytest.mark.parametrize("k", [1, 5])
+@pytest.mark.parametrize("max_distance_matrix_size", [16 * 7, 16 * 100, int(5e7)])
+def test_chunked_topk(k, max_distance_matrix_size):
+    query = F.normalize(torch.randn(16, 32), dim=-1)
+    keys = F.normalize(torch.randn(1000, 32), dim=-1)
+
+    values, indices = chunked_topk(query, keys, k, max_distance_matrix_size)
+    ref_values, ref_indices = (query @ keys.T).topk(k, dim=1)
+    assert torch.allclose(values, ref_values)
+    assert torch.equal(indices, ref_indices)
+
+
+def test_chunked_topk_low_precision():
+    query = F.normalize(torch.randn(16, 32), dim=-1)
+    keys = F.normalize(torch.randn(1000, 32), dim=-1)
+    values, indices = chunked_topk(query, keys, 5, 16 * 100, dtype=torch.bfloat16)
+    assert values.dtype == torch.bfloat16
+
+    # neighbors found with low precision are almost as similar as the exact ones
+    ref_values, _ = (query @ keys.T).topk(5, dim=1)
+    exact_values = (query @ keys.T).gather(1, indices)
+    assert torch.allclose(exact_values, ref_values, atol=5e-2)
+
+
+def test_feature_queue_find_nn():
+    queue = FeatureQueue(4096, 32, extra_fields=("y",))
+    queue.enqueue(F.normalize(torch.randn(4096, 32), dim=-1), y=torch.arange(4096))
+
+    z = F.normalize(torch.randn(8, 32), dim=-1)
+    out = queue.find_nn(z, k=5, max_distance_matrix_size=8 * 500)
+    _, ref_indices = (z @ queue.features.T).topk(5, dim=1)
+    assert torch.equal(out["indices"], ref_indices)
+    assert torch.equal(out["neighbors"], queue.features[ref_indices])
+    assert torch.equal(out["y"], ref_indices)
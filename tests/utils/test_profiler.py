@@ -0,0 +1,80 @@
+# Copyright 2023 solo-learn development team.
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the
+# Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies
+# or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+# PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE
+# FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import time
+
+from solo.methods import BYOL
+from solo.utils import profiler
+from solo.utils.profiler import StepProfiler, StepProfilerCallback, profile_region
+
+from ..methods.utils import gen_base_cfg, gen_trainer, prepare_dummy_dataloaders
+
+
+def test_step_profiler():
+    # regions are no-ops without an active profiler
+    assert profile_region("a") is profile_region("b")
+
+    step_profiler = StepProfiler(window=3)
+    for _ in range(5):
+        with step_profiler.region("outer"):
+            with step_profiler.region("inner"):
+                time.sleep(0.001)
+    assert len(step_profiler.times["outer"]) == 3
+    assert len(step_profiler.times["inner"]) == 3
+
+    # only the outer regions count towards the region time
+    region_time = step_profiler.pop_region_time()
+    assert region_time >= 0.005
+    assert step_profiler.pop_region_time() == 0
+
+    summary = step_profiler.summary()
+    assert set(summary) == {"outer_p50_ms", "outer_p95_ms", "inner_p50_ms", "inner_p95_ms"}
+    assert summary["outer_p50_ms"] <= summary["outer_p95_ms"]
+
+
+def test_step_profiler_callback(tmp_path):
+    method_kwargs = {
+        "proj_output_dim": 256,
+        "proj_hidden_dim": 2048,
+        "pred_hidden_dim": 2048,
+    }
+    cfg = gen_base_cfg("byol", batch_size=2, num_classes=100, momentum=True)
+    cfg.method_kwargs = method_kwargs
+    cfg = StepProfilerCallback.add_and_assert_specific_cfg(cfg)
+    model = BYOL(cfg)
+
+    callback = StepProfilerCallback(frequency=1, trace_start_step=0, trace_dir=tmp_path)
+    trainer = gen_trainer(cfg, callback)
+    train_dl, val_dl = prepare_dummy_dataloaders(
+        "imagenet100",
+        num_large_crops=cfg.data.num_large_crops,
+        num_small_crops=cfg.data.num_small_crops,
+        num_classes=cfg.data.num_classes,
+        batch_size=cfg.optimizer.batch_size,
+    )
+    trainer.fit(model, train_dl, val_dl)
+
+    stages = set(callback.profiler.times)
+    assert {"h2d", "online_forward", "online_classifier", "momentum_forward"} <= stages
+    assert {"loss", "backward", "optimizer_step", "step"} <= stages
+    assert "prof_step_p50_ms" in trainer.logged_metrics
+    assert list(tmp_path.glob("trace_rank0_step0.json"))
+
+    # the regions are disabled again after training
+    assert profiler._ACTIVE_PROFILER is None
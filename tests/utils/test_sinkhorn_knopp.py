@@ -0,0 +1,83 @@
+# Copyright 2023 solo-learn development team.
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the
+# Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies
+# or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+# PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE
+# FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+from solo.utils.sinkhorn_knopp import SinkhornKnopp
+
+
+def test_sinkhorn_knopp_log_domain():
+    torch.manual_seed(0)
+    Q = torch.randn(64, 16).clamp(-1, 1)
+
+    linear = SinkhornKnopp(num_iters=10, epsilon=0.05)(Q)
+    log = SinkhornKnopp(num_iters=10, epsilon=0.05, log_domain=True)(Q)
+    assert torch.allclose(linear, log, atol=1e-5)
+    assert torch.allclose(log.sum(dim=1), torch.ones(64), atol=1e-5)
+
+    # the linear domain overflows in half precision, the log domain does not
+    Q = Q.half()
+    assert not torch.isfinite(SinkhornKnopp(epsilon=0.01)(Q)).all()
+    out = SinkhornKnopp(epsilon=0.01, log_domain=True)(Q)
+    assert out.dtype == torch.half
+    assert torch.isfinite(out).all()
+
+
+def test_sinkhorn_knopp_tol():
+    torch.manual_seed(0)
+    Q = torch.randn(64, 16).clamp(-1, 1)
+
+    for log_domain in (False, True):
+        sk = SinkhornKnopp(num_iters=100, epsilon=0.05, log_domain=log_domain, tol=1e-3)
+        out = sk(Q)
+        assert 0 < sk.last_num_iters < 100
+        assert sk.last_time > 0
+        rows = out.sum(dim=0) / out.sum()
+        assert torch.allclose(rows, torch.full((16,), 1 / 16), rtol=1e-2)
+
+
+def _sinkhorn_knopp_worker(rank, world_size, init_file, log_domain):
+    torch.manual_seed(0)
+    Q = torch.randn(world_size * 32, 16).clamp(-1, 1)
+
+    # the reference runs on the full batch before the process group exists
+    ref_sk = SinkhornKnopp(num_iters=50, epsilon=0.05, log_domain=log_domain, tol=1e-4)
+    ref = ref_sk(Q)
+
+    dist.init_process_group(
+        "gloo", init_method=f"file://{init_file}", rank=rank, world_size=world_size
+    )
+    try:
+        dist_sk = SinkhornKnopp(50, 0.05, world_size, log_domain=log_domain, tol=1e-4)
+        out = dist_sk(Q.chunk(world_size)[rank])
+        assert torch.allclose(out, ref.chunk(world_size)[rank], atol=1e-5)
+        assert dist_sk.last_num_iters == ref_sk.last_num_iters
+    finally:
+        dist.destroy_process_group()
+
+
+def test_sinkhorn_knopp_distributed(tmp_path):
+    for log_domain in (False, True):
+        mp.spawn(
+            _sinkhorn_knopp_worker,
+            args=(2, str(tmp_path / f"init_{log_domain}"), log_domain),
+            nprocs=2,
+            join=True,
+        )
@@ -0,0 +1,48 @@
+# Copyright 2023 solo-learn development team.
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the
+# Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies
+# or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+# PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE
+# FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import torch
+from solo.utils.whitening import Whitening2d
+
+
+def reference_whitening(x, eps):
+    xn = x - x.mean(0, keepdim=True)
+    f_cov = xn.T @ xn / (x.size(0) - 1)
+    eye = torch.eye(x.size(1), dtype=x.dtype)
+    f_cov_shrinked = (1 - eps) * f_cov + eps * eye
+    inv_sqrt = torch.triangular_solve(eye, torch.linalg.cholesky(f_cov_shrinked), upper=False)[0]
+    return xn @ inv_sqrt.T
+
+
+def test_whitening():
+    n, d = 64, 16
+    whitening = Whitening2d(d, eps=0.1)
+
+    x = torch.randn(4, n, d, dtype=torch.float64)
+    z = whitening(x)
+    assert z.size() == x.size()
+    for xi, zi in zip(x, z):
+        assert torch.allclose(zi, reference_whitening(xi, 0.1))
+        # a single slice is whitened in the same way
+        assert torch.allclose(whitening(xi), zi)
+
+    # without shrinkage, whitened features have identity covariance
+    z = Whitening2d(d)(x)
+    for zi in z:
+        assert torch.allclose(zi.T @ zi / (n - 1), torch.eye(d, dtype=zi.dtype), atol=1e-6)